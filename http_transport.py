@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP транспорт, общий для WBParser и MayakAPI
+
+Один объект держит пулы соединений и общие заголовки. Бэкенды:
+- requests (по умолчанию) - пул urllib3 настраиваемого размера;
+- httpx (опционально) - HTTP/2 с мультиплексированием запросов к одному хосту,
+  если установлен пакет h2 (pip install "httpx[http2]").
+
+Синхронный интерфейс: request/get/head, асинхронный: arequest/aget/ahead.
+Асинхронный клиент httpx привязан к циклу событий, поэтому создаётся отдельно
+для каждого цикла (например, для каждого asyncio.run); клиенты закрытых циклов отбрасываются.
+Ошибки бэкенда httpx приводятся к requests.exceptions.RequestException,
+поэтому вызывающий код обрабатывает их одинаково для обоих бэкендов.
+
+HedgedTransport (WB_HEDGE=1) дублирует GET запросы, не ответившие за перцентиль
+недавних длительностей, чтобы один медленный ответ не задерживал весь запрос.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, Union, Mapping, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+}
+
+BACKENDS = ('requests', 'httpx')
+DEFAULT_BACKEND = 'requests'
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 20
+
+CookiesType = Optional[Union[Mapping[str, str], requests.cookies.RequestsCookieJar]]
+
+
+class TransportError(requests.exceptions.RequestException):
+    """Ошибка HTTP транспорта (в том числе бэкенда httpx)"""
+
+
+class HttpxResponse:
+    """Ответ httpx с интерфейсом requests.Response (status_code, text, json, raise_for_status)"""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.content = response.content
+
+    @property
+    def text(self) -> str:
+        return self._response.text
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self, **kwargs):
+        return self._response.json(**kwargs)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(
+                f"{self.status_code} Error for url: {self.url}",
+                response=self
+            )
+
+
+def cookie_header(cookies: CookiesType) -> Optional[str]:
+    """Собирает заголовок Cookie из словаря или cookie jar"""
+    if not cookies:
+        return None
+    if isinstance(cookies, requests.cookies.RequestsCookieJar):
+        pairs = [(cookie.name, cookie.value) for cookie in cookies]
+    else:
+        pairs = list(cookies.items())
+    return '; '.join(f"{name}={value}" for name, value in pairs)
+
+
+class HttpTransport:
+    """Общий HTTP клиент с пулом соединений и синхронным/асинхронным интерфейсом"""
+
+    def __init__(self,
+                 backend: Optional[str] = None,
+                 pool_connections: Optional[int] = None,
+                 pool_maxsize: Optional[int] = None,
+                 http2: bool = True,
+                 headers: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            backend: requests или httpx (по умолчанию WB_HTTP_BACKEND или requests)
+            pool_connections: Количество пулов (хостов) в кэше requests
+            pool_maxsize: Максимум соединений на хост (по умолчанию WB_HTTP_POOL_SIZE или 20)
+            http2: Использовать HTTP/2 в бэкенде httpx (если установлен h2)
+            headers: Заголовки поверх DEFAULT_HEADERS
+        """
+        backend = (backend or os.getenv('WB_HTTP_BACKEND') or DEFAULT_BACKEND).lower()
+        if backend not in BACKENDS:
+            raise ValueError(f"Неизвестный HTTP бэкенд: {backend}. Доступны: {', '.join(BACKENDS)}")
+        if backend == 'httpx' and importlib.util.find_spec('httpx') is None:
+            logger.warning("Пакет httpx не установлен, используется бэкенд requests")
+            backend = 'requests'
+
+        self.backend = backend
+        self.pool_connections = pool_connections or DEFAULT_POOL_CONNECTIONS
+        self.pool_maxsize = pool_maxsize or int(os.getenv('WB_HTTP_POOL_SIZE', DEFAULT_POOL_MAXSIZE))
+        self.headers = dict(DEFAULT_HEADERS)
+        if headers:
+            self.headers.update(headers)
+
+        self.http2 = False
+        if backend == 'httpx' and http2:
+            self.http2 = importlib.util.find_spec('h2') is not None
+            if not self.http2:
+                logger.warning("Пакет h2 не установлен, httpx работает по HTTP/1.1")
+
+        self.session: Optional[requests.Session] = None
+        self._client = None
+        # id цикла событий -> (цикл, httpx.AsyncClient)
+        self._async_clients: Dict[int, Tuple[asyncio.AbstractEventLoop, Any]] = {}
+        self._async_lock = threading.Lock()
+
+        if backend == 'requests':
+            self.session = requests.Session()
+            self.session.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+            self.session.mount('https://', adapter)
+            self.session.mount('http://', adapter)
+        else:
+            import httpx
+            self._client = httpx.Client(
+                http2=self.http2,
+                headers=self.headers,
+                limits=self._httpx_limits(),
+                follow_redirects=True,
+            )
+
+        logger.info(f"HTTP транспорт: {self.backend}{' (HTTP/2)' if self.http2 else ''}, "
+                    f"до {self.pool_maxsize} соединений на хост")
+
+    def _httpx_limits(self):
+        import httpx
+        return httpx.Limits(
+            max_connections=self.pool_connections * self.pool_maxsize,
+            max_keepalive_connections=self.pool_maxsize,
+        )
+
+    def _merge_headers(self, headers: Optional[Dict[str, str]], cookies: CookiesType) -> Dict[str, str]:
+        merged = dict(headers or {})
+        header = cookie_header(cookies)
+        if header:
+            merged['Cookie'] = header
+        return merged
+
+    def request(self, method: str, url: str,
+                params: Optional[Dict[str, Any]] = None,
+                headers: Optional[Dict[str, str]] = None,
+                cookies: CookiesType = None,
+                timeout: float = 30,
+                allow_redirects: bool = True):
+        """
+        Выполняет HTTP запрос
+
+        Args:
+            method: HTTP метод
+            url: URL
+            params: Параметры строки запроса
+            headers: Дополнительные заголовки запроса
+            cookies: Cookies только для этого запроса
+            timeout: Таймаут в секундах
+            allow_redirects: Следовать редиректам
+
+        Returns:
+            Ответ с интерфейсом requests.Response
+        """
+        if self.session is not None:
+            return self.session.request(
+                method, url, params=params, headers=headers, cookies=cookies,
+                timeout=timeout, allow_redirects=allow_redirects
+            )
+
+        import httpx
+        try:
+            response = self._client.request(
+                method, url, params=params, headers=self._merge_headers(headers, cookies),
+                timeout=timeout, follow_redirects=allow_redirects
+            )
+        except httpx.HTTPError as e:
+            raise TransportError(str(e)) from e
+        return HttpxResponse(response)
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url: str, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        return self.request('HEAD', url, **kwargs)
+
+    def _get_async_client(self):
+        """Клиент httpx текущего цикла событий (соединения клиента нельзя использовать из другого цикла)"""
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            # Клиенты завершённых циклов закрыть уже нельзя - только забыть
+            for key in [key for key, (other, _) in self._async_clients.items() if other.is_closed()]:
+                del self._async_clients[key]
+            entry = self._async_clients.get(id(loop))
+            if entry is None or entry[0] is not loop:
+                import httpx
+                client = httpx.AsyncClient(
+                    http2=self.http2,
+                    headers=self.headers,
+                    limits=self._httpx_limits(),
+                    follow_redirects=True,
+                )
+                entry = self._async_clients[id(loop)] = (loop, client)
+            return entry[1]
+
+    async def arequest(self, method: str, url: str,
+                       params: Optional[Dict[str, Any]] = None,
+                       headers: Optional[Dict[str, str]] = None,
+                       cookies: CookiesType = None,
+                       timeout: float = 30,
+                       allow_redirects: bool = True):
+        """Асинхронный вариант request с тем же интерфейсом"""
+        if self.session is not None:
+            # requests синхронный: выполняем запрос в пуле потоков, пул соединений общий
+            return await asyncio.to_thread(
+                self.request, method, url, params=params, headers=headers, cookies=cookies,
+                timeout=timeout, allow_redirects=allow_redirects
+            )
+
+        import httpx
+        client = self._get_async_client()
+        try:
+            response = await client.request(
+                method, url, params=params, headers=self._merge_headers(headers, cookies),
+                timeout=timeout, follow_redirects=allow_redirects
+            )
+        except httpx.HTTPError as e:
+            raise TransportError(str(e)) from e
+        return HttpxResponse(response)
+
+    async def aget(self, url: str, **kwargs):
+        return await self.arequest('GET', url, **kwargs)
+
+    async def ahead(self, url: str, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        return await self.arequest('HEAD', url, **kwargs)
+
+    def close(self):
+        """Закрывает синхронные соединения (асинхронный клиент закрывается через aclose)"""
+        if self.session is not None:
+            self.session.close()
+        if self._client is not None:
+            self._client.close()
+
+    async def aclose(self):
+        """Закрывает асинхронный клиент текущего цикла событий"""
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            entry = self._async_clients.pop(id(loop), None)
+        if entry is not None and entry[0] is loop:
+            await entry[1].aclose()
+
+
+class LatencyTracker:
+    """Скользящее окно длительностей последних запросов для оценки перцентилей"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """p-й перцентиль (0-100) или None, если замеров нет"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))
+        return samples[index]
+
+
+class HedgedTransport:
+    """
+    Обёртка над HttpTransport с хеджированием GET запросов
+
+    Если ответ не пришёл за p-й перцентиль недавних длительностей запросов к этому хосту,
+    отправляется дубликат; используется первый успешный ответ, второй отменяется
+    (запрос requests отменить нельзя - его ответ закрывается и отбрасывается).
+    Дополнительная нагрузка ограничена бюджетом: каждый запрос добавляет budget
+    «кредита», дубликат тратит единицу.
+    """
+
+    def __init__(self, transport: Optional[HttpTransport] = None, percentile: float = 95,
+                 budget: float = 0.05, min_samples: int = 20, min_delay: float = 0.05,
+                 window: int = 200, max_credit: float = 10, max_workers: int = 64):
+        """
+        Args:
+            transport: Базовый транспорт (по умолчанию HttpTransport())
+            percentile: Перцентиль длительности, после которого отправляется дубликат
+            budget: Доля дополнительных запросов (0.05 - не больше ~5% сверху)
+            min_samples: Сколько замеров по хосту нужно, прежде чем хеджировать
+            min_delay: Минимальная задержка перед дубликатом, сек
+            window: Количество последних замеров на хост
+            max_credit: Максимальный накопленный кредит (всплеск дубликатов после затишья)
+            max_workers: Потоков для синхронных запросов
+        """
+        self.transport = transport or HttpTransport()
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self.max_credit = max_credit
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self._credit = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def __getattr__(self, name: str):
+        # backend, session, headers и прочее - от базового транспорта
+        return getattr(self.transport, name)
+
+    def tracker(self, url: str) -> LatencyTracker:
+        host = urlsplit(url).netloc
+        with self._lock:
+            tracker = self._trackers.get(host)
+            if tracker is None:
+                tracker = self._trackers[host] = LatencyTracker(self.window)
+            return tracker
+
+    def hedge_delay(self, tracker: LatencyTracker) -> Optional[float]:
+        """Задержка перед дубликатом или None, если замеров ещё мало"""
+        if len(tracker) < self.min_samples:
+            return None
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+    def _start(self):
+        with self._lock:
+            self.requests += 1
+            self._credit = min(self.max_credit, self._credit + self.budget)
+
+    def _take_credit(self) -> bool:
+        with self._lock:
+            if self._credit < 1:
+                return False
+            self._credit -= 1
+            self.hedges += 1
+            return True
+
+    def _record_win(self, hedged: bool):
+        if hedged:
+            with self._lock:
+                self.hedge_wins += 1
+
+    @staticmethod
+    def _discard(future):
+        """Закрывает ответ проигравшего запроса"""
+        if not future.cancelled() and future.exception() is None:
+            close = getattr(future.result(), 'close', None)
+            if close:
+                close()
+
+    def _timed(self, tracker: LatencyTracker, method: str, url: str, kwargs: Dict[str, Any]):
+        started = time.monotonic()
+        response = self.transport.request(method, url, **kwargs)
+        tracker.record(time.monotonic() - started)
+        return response
+
+    def request(self, method: str, url: str, **kwargs):
+        """Тот же интерфейс, что HttpTransport.request; хеджируются только GET"""
+        if method.upper() != 'GET':
+            return self.transport.request(method, url, **kwargs)
+
+        self._start()
+        tracker = self.tracker(url)
+        delay = self.hedge_delay(tracker)
+        if delay is None:
+            return self._timed(tracker, method, url, kwargs)
+
+        primary = self._executor.submit(self._timed, tracker, method, url, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_credit():
+            return primary.result()
+
+        logger.debug(f"Хеджирование запроса {url}: нет ответа за {delay:.3f} сек")
+        hedge = self._executor.submit(self._timed, tracker, method, url, kwargs)
+        pending = {primary, hedge}
+        errors = {}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                        other.add_done_callback(self._discard)
+                    self._record_win(future is hedge)
+                    return future.result()
+                errors[future] = future.exception()
+        raise errors[primary]
+
+    def get(self, url: str, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url: str, **kwargs):
+        return self.transport.head(url, **kwargs)
+
+    async def _atimed(self, tracker: LatencyTracker, method: str, url: str, kwargs: Dict[str, Any]):
+        started = time.monotonic()
+        response = await self.transport.arequest(method, url, **kwargs)
+        tracker.record(time.monotonic() - started)
+        return response
+
+    async def arequest(self, method: str, url: str, **kwargs):
+        """Асинхронный вариант request; проигравший запрос отменяется"""
+        if method.upper() != 'GET':
+            return await self.transport.arequest(method, url, **kwargs)
+
+        self._start()
+        tracker = self.tracker(url)
+        delay = self.hedge_delay(tracker)
+        if delay is None:
+            return await self._atimed(tracker, method, url, kwargs)
+
+        primary = asyncio.ensure_future(self._atimed(tracker, method, url, kwargs))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self._take_credit():
+            return await primary
+
+        hedge = asyncio.ensure_future(self._atimed(tracker, method, url, kwargs))
+        pending = {primary, hedge}
+        errors = {}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    self._record_win(task is hedge)
+                    return task.result()
+                errors[task] = task.exception()
+        raise errors[primary]
+
+    async def aget(self, url: str, **kwargs):
+        return await self.arequest('GET', url, **kwargs)
+
+    async def ahead(self, url: str, **kwargs):
+        return await self.transport.ahead(url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            trackers = dict(self._trackers)
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'delays': {host: self.hedge_delay(tracker) for host, tracker in trackers.items()},
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.transport.close()
+
+
+def default_transport(**kwargs) -> Union[HttpTransport, HedgedTransport]:
+    """
+    Транспорт по умолчанию для WBParser и MayakAPI: HttpTransport, обёрнутый
+    в HedgedTransport при WB_HEDGE=1
+
+    Environment:
+        WB_HEDGE - 1, чтобы включить хеджирование
+        WB_HEDGE_PERCENTILE - перцентиль задержки перед дубликатом (по умолчанию 95)
+        WB_HEDGE_BUDGET - доля дополнительных запросов (по умолчанию 0.05)
+    """
+    transport = HttpTransport(**kwargs)
+    if os.getenv('WB_HEDGE', '0').lower() not in ('1', 'true', 'yes'):
+        return transport
+    hedged = HedgedTransport(
+        transport,
+        percentile=float(os.getenv('WB_HEDGE_PERCENTILE', '95')),
+        budget=float(os.getenv('WB_HEDGE_BUDGET', '0.05')),
+    )
+    logger.info(f"Хеджирование запросов: p{hedged.percentile:g}, бюджет {hedged.budget:.0%}")
+    return hedged
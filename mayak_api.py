@@ -5,15 +5,26 @@ Mayak API Client
 Модуль для работы с API mayak.bz для получения подробной информации о товарах WB
 """
 
+import os
+import threading
+import time
 import requests
 import json
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Callable, Tuple
 import logging
 from urllib.parse import urljoin
 
+from http_transport import HttpTransport
+from wb_deadline import Deadline, ProductList, DEFAULT_TIMEOUT, is_expired, request_timeout
+from wb_metrics import upstream_call
+
 
 logger = logging.getLogger(__name__)
 
+# Ответы Mayak, означающие недействительные cookies: повторять запрос бессмысленно
+AUTH_ERROR_CODES = (401, 403)
+THROTTLE_CODES = (429,)
+
 
 class MayakAPI:
     """Класс для работы с API Mayak"""
@@ -22,24 +33,34 @@ class MayakAPI:
     PRODUCTS_ENDPOINT = "wb/products"
     MAX_CODES_PER_REQUEST = 20
     
-    def __init__(self, cookies: Optional[Union[str, Dict[str, str]]] = None):
+    # Неудавшийся чанк повторяется целиком CHUNK_RETRIES раз с паузой RETRY_BACKOFF * 2^n
+    # (не больше RETRY_BACKOFF_MAX), а если сбой вызван его кодами - делится пополам
+    # (см. retry_failed_chunks). Повторных запросов за вызов не больше RETRY_REQUEST_LIMIT
+    CHUNK_RETRIES = int(os.getenv('MAYAK_CHUNK_RETRIES', '2'))
+    RETRY_BACKOFF = float(os.getenv('MAYAK_RETRY_BACKOFF', '0.5'))
+    RETRY_BACKOFF_MAX = 8.0
+    RETRY_REQUEST_LIMIT = int(os.getenv('MAYAK_RETRY_LIMIT', '40'))
+    
+    def __init__(self, cookies: Optional[Union[str, Dict[str, str]]] = None,
+                 transport: Optional[HttpTransport] = None):
         """
         Инициализация клиента Mayak API
         
         Args:
             cookies: Cookies в виде строки или словаря
+            transport: Общий HTTP транспорт (по умолчанию создаётся свой)
         """
-        self.session = requests.Session()
-        
-        # Настройка заголовков
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Referer': 'https://app.mayak.bz/',
-        })
+        self.transport = transport or HttpTransport()
+        
+        # Заголовки и cookies Mayak передаются в каждом запросе,
+        # поэтому транспорт можно разделять с WBParser
+        self.headers = {'Referer': 'https://app.mayak.bz/'}
+        self.cookies = requests.cookies.RequestsCookieJar()
+        # Последний запрос получил 401/403 - неудавшиеся чанки не повторяются
+        # (сбрасывается следующим успешным запросом или новыми cookies)
+        self.auth_failed = False
+        # HTTP статус последней ошибки get_products_info в текущем потоке (см. request_chunk)
+        self._failure = threading.local()
         
         # Установка cookies
         if cookies:
@@ -62,13 +83,14 @@ class MayakAPI:
                     cookie_pairs.append((name.strip(), value.strip()))
             
             for name, value in cookie_pairs:
-                self.session.cookies.set(name, value)
+                self.cookies.set(name, value)
                 
         elif isinstance(cookies, dict):
             for name, value in cookies.items():
-                self.session.cookies.set(name, value)
+                self.cookies.set(name, value)
         
-        logger.info(f"Установлено {len(self.session.cookies)} cookies")
+        self.auth_failed = False
+        logger.info(f"Установлено {len(self.cookies)} cookies")
     
     def split_codes_to_chunks(self, codes: List[Union[int, str]], chunk_size: int = None) -> List[List[str]]:
         """
@@ -94,15 +116,20 @@ class MayakAPI:
         logger.info(f"Разбито {len(str_codes)} кодов на {len(chunks)} чанков")
         return chunks
     
-    def get_products_info(self, codes: List[Union[int, str]]) -> Optional[Dict[str, Any]]:
+    def fetch_products_info(self, codes: List[Union[int, str]], timeout: float = DEFAULT_TIMEOUT) -> Any:
         """
-        Получает информацию о товарах по их кодам
-        
+        Запрашивает информацию о товарах без обработки ошибок
+
         Args:
             codes: Список кодов товаров (максимум 20)
-            
+            timeout: Таймаут HTTP запроса, сек
+
         Returns:
-            Словарь с информацией о товарах или None в случае ошибки
+            Список товаров (или ответ API как есть, если это не словарь товаров)
+
+        Raises:
+            requests.exceptions.RequestException: Ошибка запроса (HTTPError содержит response)
+            json.JSONDecodeError: Некорректный JSON в ответе
         """
         if len(codes) > self.MAX_CODES_PER_REQUEST:
             logger.warning(f"Передано {len(codes)} кодов, максимум {self.MAX_CODES_PER_REQUEST}")
@@ -114,29 +141,56 @@ class MayakAPI:
         url = urljoin(self.BASE_URL, self.PRODUCTS_ENDPOINT)
         params = {'codes': codes_str}
         
-        try:
-            logger.info(f"Запрос к Mayak API: {url}?codes={codes_str[:100]}{'...' if len(codes_str) > 100 else ''}")
-            response = self.session.get(url, params=params, timeout=30)
+        logger.info(f"Запрос к Mayak API: {url}?codes={codes_str[:100]}{'...' if len(codes_str) > 100 else ''}")
+        with upstream_call('mayak', 'mayak_chunk'):
+            response = self.transport.get(url, params=params, headers=self.headers,
+                                          cookies=self.cookies, timeout=timeout)
             response.raise_for_status()
-            
             data = response.json()
-            logger.info(f"Получен ответ от Mayak API, размер: {len(response.text)} символов")
+        
+        logger.info(f"Получен ответ от Mayak API, размер: {len(response.text)} символов")
+        
+        # Преобразуем данные в более удобный формат
+        if isinstance(data, dict):
+            products_list = []
+            for product_id, product_data in data.items():
+                if isinstance(product_data, dict):
+                    # Добавляем ID к данным товара
+                    product_info = product_data.copy()
+                    product_info['id'] = product_id
+                    products_list.append(product_info)
             
-            # Преобразуем данные в более удобный формат
-            if isinstance(data, dict):
-                products_list = []
-                for product_id, product_data in data.items():
-                    if isinstance(product_data, dict):
-                        # Добавляем ID к данным товара
-                        product_info = product_data.copy()
-                        product_info['id'] = product_id
-                        products_list.append(product_info)
-                
-                logger.info(f"Преобразовано {len(products_list)} товаров в список")
-                return products_list
+            logger.info(f"Преобразовано {len(products_list)} товаров в список")
+            return products_list
+        
+        return data
+    
+    def get_products_info(self, codes: List[Union[int, str]],
+                          deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """
+        Получает информацию о товарах по их кодам
+        
+        Args:
+            codes: Список кодов товаров (максимум 20)
+            deadline: Ограничение по времени: таймаут не больше оставшегося, после истечения запрос не выполняется
             
+        Returns:
+            Словарь с информацией о товарах или None в случае ошибки
+        """
+        if is_expired(deadline):
+            logger.warning(f"Истёк бюджет времени, чанк из {len(codes)} кодов не запрошен")
+            return None
+        try:
+            data = self.fetch_products_info(codes, timeout=request_timeout(deadline))
+            self.auth_failed = False
             return data
-            
+        except requests.exceptions.HTTPError as e:
+            status = getattr(e.response, 'status_code', None)
+            self._failure.status = status
+            if status in AUTH_ERROR_CODES:
+                self.auth_failed = True
+            logger.error(f"Ошибка при запросе к Mayak API: {e}")
+            return None
         except requests.exceptions.RequestException as e:
             logger.error(f"Ошибка при запросе к Mayak API: {e}")
             return None
@@ -144,38 +198,198 @@ class MayakAPI:
             logger.error(f"Ошибка при парсинге JSON от Mayak API: {e}")
             return None
     
-    def get_all_products_info(self, codes: List[Union[int, str]]) -> List[Dict[str, Any]]:
+    @staticmethod
+    def chunk_products(chunk_data: Any) -> List[Dict[str, Any]]:
+        """Извлекает список товаров из ответа на один чанк"""
+        if not chunk_data:
+            return []
+        # Предполагаем, что API возвращает список товаров
+        if isinstance(chunk_data, list):
+            return chunk_data
+        if isinstance(chunk_data, dict):
+            # Если возвращается словарь, ищем список товаров
+            if 'products' in chunk_data:
+                return chunk_data['products']
+            if 'data' in chunk_data:
+                return chunk_data['data']
+            return [chunk_data]
+        return []
+    
+    def can_retry(self) -> bool:
+        """Есть ли смысл повторять неудавшиеся чанки (cookies не отклонены)"""
+        return not self.auth_failed
+    
+    def request_chunk(self, codes: List[Union[int, str]],
+                      deadline: Optional[Deadline] = None) -> Tuple[Optional[Any], Optional[int]]:
+        """
+        Запрашивает чанк через get_products_info
+        
+        Returns:
+            (данные или None при ошибке, HTTP статус ошибки или None - таймаут, соединение, JSON)
+        """
+        self._failure.status = None
+        data = self.get_products_info(codes, deadline=deadline)
+        return data, (getattr(self._failure, 'status', None) if data is None else None)
+    
+    def fetch_chunks(self, chunks: List[List[str]],
+                     deadline: Optional[Deadline] = None) -> List[Tuple[Optional[Any], Optional[int]]]:
+        """Запрашивает чанки по очереди; результат request_chunk для каждого"""
+        return [self.request_chunk(chunk, deadline=deadline) for chunk in chunks]
+    
+    @staticmethod
+    def is_codes_error(status: Optional[int]) -> bool:
+        """Ошибка вызвана кодами в запросе (4xx, кроме отказа в доступе и ограничения частоты)"""
+        return status is not None and 400 <= status < 500 and status not in AUTH_ERROR_CODES + THROTTLE_CODES
+    
+    def retry_failed_chunks(self, failed: List[Tuple[List[str], Optional[int]]],
+                            deadline: Optional[Deadline] = None,
+                            others_succeeded: bool = False) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Повторно запрашивает только неудавшиеся чанки
+        
+        Чанк повторяется целиком до CHUNK_RETRIES раз (временные ошибки: 5xx, 429, таймауты).
+        Пополам он делится, только если ошибка похожа на вызванную его кодами: ответ 4xx
+        (кроме 401/403/429) или другие чанки того же вызова получены успешно. Если падают
+        обе половины, деление прекращается: сбой не в отдельных кодах. Перед каждым раундом
+        повторов - экспоненциальная пауза, всего повторных запросов за вызов не больше
+        RETRY_REQUEST_LIMIT, поэтому при недоступности Mayak повторы не умножают нагрузку.
+        
+        Args:
+            failed: Упавшие чанки и HTTP статус их ошибки (см. request_chunk)
+            deadline: Ограничение по времени; по истечении оставшиеся коды не запрашиваются
+            others_succeeded: Другие чанки этого вызова получены успешно
+            
+        Returns:
+            (полученные товары, коды, которые так и не удалось обогатить)
+        """
+        products: List[Dict[str, Any]] = []
+        missing: List[str] = []
+        # (коды, статус последней ошибки, сколько ещё раз можно повторить целиком, номер делённого чанка)
+        pending = [([str(code) for code in codes], status, self.CHUNK_RETRIES, None) for codes, status in failed]
+        requested = sum(len(codes) for codes, *_ in pending)
+        succeeded = others_succeeded
+        budget = self.RETRY_REQUEST_LIMIT
+        attempt = 0
+        splits = 0
+        
+        while pending:
+            if is_expired(deadline) or not self.can_retry():
+                reason = 'истёк бюджет времени' if is_expired(deadline) else 'cookies отклонены'
+                lost = [code for codes, *_ in pending for code in codes]
+                missing.extend(lost)
+                logger.warning(f"Повтор чанков Mayak прекращён ({reason}), не обогащено {len(lost)} товаров")
+                break
+            
+            queue = []
+            for codes, status, retries_left, _ in pending:
+                codes_error = self.is_codes_error(status)
+                if len(codes) > 1 and (codes_error or (retries_left == 0 and succeeded)):
+                    splits += 1
+                    middle = len(codes) // 2
+                    queue += [(codes[:middle], 0, splits), (codes[middle:], 0, splits)]
+                elif retries_left > 0 and not codes_error:
+                    queue.append((codes, retries_left - 1, None))
+                else:
+                    missing.extend(codes)
+                    logger.warning(f"Не удалось получить {len(codes)} товаров ({', '.join(codes[:5])}"
+                                   f"{'...' if len(codes) > 5 else ''}), повторы исчерпаны")
+            if len(queue) > budget:
+                lost = [code for codes, *_ in queue[budget:] for code in codes]
+                missing.extend(lost)
+                logger.warning(f"Лимит повторных запросов Mayak ({self.RETRY_REQUEST_LIMIT}) исчерпан, "
+                               f"не обогащено ещё {len(lost)} товаров")
+                queue = queue[:budget]
+            if not queue:
+                break
+            budget -= len(queue)
+            
+            attempt += 1
+            delay = min(self.RETRY_BACKOFF * 2 ** (attempt - 1), self.RETRY_BACKOFF_MAX)
+            if deadline is not None:
+                delay = min(delay, deadline.remaining())
+            logger.info(f"Повтор {len(queue)} чанков Mayak через {delay:.1f} сек")
+            if delay > 0:
+                time.sleep(delay)
+            
+            results = self.fetch_chunks([codes for codes, *_ in queue], deadline=deadline)
+            pending = []
+            failed_halves: Dict[int, List[Tuple[List[str], Optional[int], int, Optional[int]]]] = {}
+            for (codes, retries_left, split), (chunk_data, status) in zip(queue, results):
+                if chunk_data is None:
+                    entry = (codes, status, retries_left, split)
+                    if split is None:
+                        pending.append(entry)
+                    else:
+                        failed_halves.setdefault(split, []).append(entry)
+                else:
+                    succeeded = True
+                    products.extend(self.chunk_products(chunk_data))
+            for halves in failed_halves.values():
+                if len(halves) == 2:
+                    lost = halves[0][0] + halves[1][0]
+                    missing.extend(lost)
+                    logger.warning(f"Обе половины чанка из {len(lost)} товаров не получены, деление прекращено")
+                else:
+                    pending.extend(halves)
+        
+        logger.info(f"Повтор чанков Mayak: из {requested} товаров не обогащено {len(missing)}"
+                    f"{': ' + ', '.join(missing[:10]) + ('...' if len(missing) > 10 else '') if missing else ''}")
+        return products, missing
+    
+    def get_all_products_info(self, codes: List[Union[int, str]],
+                              on_chunk: Optional[Callable[[List[Dict[str, Any]], int, int], None]] = None,
+                              deadline: Optional[Deadline] = None) -> ProductList:
         """
         Получает информацию о всех товарах, разбивая на чанки при необходимости
         
         Args:
             codes: Список кодов товаров
+            on_chunk: Вызывается после каждого чанка с (товары на текущий момент, готово чанков, всего чанков)
+            deadline: Ограничение по времени; после истечения оставшиеся чанки не запрашиваются
             
         Returns:
-            Список с информацией о всех товарах
+            Список с информацией о всех товарах (ProductList: partial и missing_ids - коды
+            чанков, не успевших до deadline, и кодов, которые не удалось получить и после повторов)
         """
         all_products = []
+        missing = []
+        failed = []
+        succeeded = False
         chunks = self.split_codes_to_chunks(codes)
         
         for i, chunk in enumerate(chunks, 1):
+            if is_expired(deadline):
+                skipped = [code for rest in [codes for codes, _ in failed] + chunks[i - 1:] for code in rest]
+                logger.warning(f"Истёк бюджет времени: не запрошено {len(chunks) - i + 1} чанков "
+                               f"({len(skipped)} товаров), возвращаем частичный результат")
+                return ProductList(all_products, missing_ids=missing + skipped)
+
             logger.info(f"Обрабатывается чанк {i}/{len(chunks)} ({len(chunk)} кодов)")
             
-            chunk_data = self.get_products_info(chunk)
-            if chunk_data:
-                # Предполагаем, что API возвращает список товаров
-                if isinstance(chunk_data, list):
-                    all_products.extend(chunk_data)
-                elif isinstance(chunk_data, dict):
-                    # Если возвращается словарь, ищем список товаров
-                    if 'products' in chunk_data:
-                        all_products.extend(chunk_data['products'])
-                    elif 'data' in chunk_data:
-                        all_products.extend(chunk_data['data'])
-                    else:
-                        all_products.append(chunk_data)
+            chunk_data, status = self.request_chunk(chunk, deadline=deadline)
+            if chunk_data is None:
+                if is_expired(deadline):
+                    # Запрос прерван таймаутом по deadline
+                    missing.extend(chunk)
+                else:
+                    failed.append((chunk, status))
+            else:
+                succeeded = True
+            all_products.extend(self.chunk_products(chunk_data))
+            
+            if on_chunk:
+                try:
+                    on_chunk(all_products, i, len(chunks))
+                except Exception as e:
+                    logger.error(f"Ошибка в обработчике прогресса: {e}")
+        
+        if failed:
+            recovered, lost = self.retry_failed_chunks(failed, deadline=deadline, others_succeeded=succeeded)
+            all_products.extend(recovered)
+            missing.extend(lost)
         
         logger.info(f"Получена информация о {len(all_products)} товарах")
-        return all_products
+        return ProductList(all_products, missing_ids=missing)
     
     def save_products_info(self, products: List[Dict[str, Any]], filename: str, format_type: str = 'json'):
         """
@@ -300,3 +514,36 @@ def parse_cookies_string(cookies_string: str) -> Dict[str, str]:
             name, value = cookie.split('=', 1)
             cookies[name.strip()] = value.strip()
     return cookies
+
+
+def load_cookie_sets(path: str) -> List[str]:
+    """
+    Загружает наборы cookies Mayak (по одному на аккаунт)
+
+    Args:
+        path: Файл (по набору cookies на строку) или каталог (по набору на файл,
+              строки файла объединяются); пустые строки и строки с # пропускаются
+
+    Returns:
+        Список строк cookies без повторов (пустой, если cookies нет)
+
+    Raises:
+        FileNotFoundError: Если путь не существует
+    """
+    def read_lines(file_path: str) -> List[str]:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+    if os.path.isdir(path):
+        cookie_sets = []
+        for name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, name)
+            if name.startswith('.') or not os.path.isfile(file_path):
+                continue
+            lines = read_lines(file_path)
+            if lines:
+                cookie_sets.append('; '.join(line.rstrip(';') for line in lines))
+    else:
+        cookie_sets = read_lines(path)
+
+    return list(dict.fromkeys(cookie_sets))
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Пул аккаунтов Mayak
+
+Каждый набор cookies - отдельный аккаунт со своей сессией. Чанки товаров
+раздаются аккаунтам по кругу и выполняются параллельно; для каждого аккаунта
+учитываются запросы, ошибки и темп (запросов в минуту), соблюдается минимальный
+интервал между его запросами. Аккаунт, получивший 401/403 (cookies истекли),
+выводится из ротации, его чанк передаётся следующему; при 429 аккаунт
+временно пропускается. Неудавшиеся чанки повторяются и делятся пополам
+(MayakAPI.retry_failed_chunks) параллельно на аккаунтах пула. С deadline
+чанки, не успевшие завершиться, попадают в missing_ids частичного результата.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from typing import List, Dict, Any, Optional, Union, Callable, Tuple
+
+import requests
+
+from http_transport import HttpTransport, default_transport
+from mayak_api import MayakAPI, AUTH_ERROR_CODES, THROTTLE_CODES
+from wb_deadline import Deadline, ProductList, is_expired, request_timeout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THROTTLE_COOLDOWN = 30.0
+RATE_WINDOW = 60.0
+
+
+class MayakAccount:
+    """Аккаунт Mayak в пуле: клиент, состояние ротации и статистика запросов"""
+
+    def __init__(self, name: str, api: MayakAPI, min_interval: float = 0.0):
+        self.name = name
+        self.api = api
+        self.min_interval = min_interval
+        self.in_flight = False
+        self.disabled_reason: Optional[str] = None
+        self.ready_at = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.total_latency = 0.0
+        self._recent = deque()
+
+    @property
+    def active(self) -> bool:
+        return self.disabled_reason is None
+
+    def available(self, now: float) -> bool:
+        return self.active and not self.in_flight and now >= self.ready_at
+
+    def record_start(self, now: float):
+        self.in_flight = True
+        self.requests += 1
+        self.ready_at = now + self.min_interval
+        self._recent.append(now)
+
+    def requests_per_minute(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        while self._recent and now - self._recent[0] > RATE_WINDOW:
+            self._recent.popleft()
+        return len(self._recent) * 60.0 / RATE_WINDOW
+
+    def stats(self) -> Dict[str, Any]:
+        completed = self.requests - self.errors
+        return {
+            'name': self.name,
+            'active': self.active,
+            'disabled_reason': self.disabled_reason,
+            'requests': self.requests,
+            'errors': self.errors,
+            'throttled': self.throttled,
+            'requests_per_minute': self.requests_per_minute(),
+            'avg_latency': round(self.total_latency / completed, 3) if completed > 0 else None,
+        }
+
+
+class MayakSessionPool(MayakAPI):
+    """Клиент Mayak, распределяющий чанки по нескольким аккаунтам"""
+
+    def __init__(self, cookie_sets: List[Union[str, Dict[str, str]]], min_interval: float = 0.0,
+                 throttle_cooldown: float = DEFAULT_THROTTLE_COOLDOWN,
+                 transport_factory: Callable[[], HttpTransport] = default_transport):
+        """
+        Args:
+            cookie_sets: Наборы cookies, по одному на аккаунт
+            min_interval: Минимальный интервал между запросами одного аккаунта, сек
+            throttle_cooldown: Пауза для аккаунта после ответа 429 (если нет Retry-After), сек
+            transport_factory: Создаёт HTTP транспорт (отдельная сессия на аккаунт)
+        """
+        if not cookie_sets:
+            raise ValueError("Нужен хотя бы один набор cookies")
+        self.accounts = [
+            MayakAccount(f"#{i}", MayakAPI(cookies, transport=transport_factory()), min_interval)
+            for i, cookies in enumerate(cookie_sets, 1)
+        ]
+        super().__init__(transport=self.accounts[0].api.transport)
+        self.throttle_cooldown = throttle_cooldown
+        self._cond = threading.Condition()
+        self._next = 0
+        logger.info(f"Пул Mayak: {len(self.accounts)} аккаунтов")
+
+    @property
+    def active_accounts(self) -> List[MayakAccount]:
+        return [account for account in self.accounts if account.active]
+
+    def _acquire(self, deadline: Optional[Deadline] = None) -> Optional[MayakAccount]:
+        """
+        Следующий по кругу свободный аккаунт; ждёт, пока он освободится.
+        None, если активных нет или истёк deadline
+        """
+        with self._cond:
+            while True:
+                if not self.active_accounts or is_expired(deadline):
+                    return None
+                now = time.monotonic()
+                count = len(self.accounts)
+                for offset in range(count):
+                    index = (self._next + offset) % count
+                    account = self.accounts[index]
+                    if account.available(now):
+                        self._next = index + 1
+                        account.record_start(now)
+                        return account
+
+                idle = [account.ready_at - now for account in self.active_accounts if not account.in_flight]
+                if deadline is not None:
+                    idle.append(deadline.remaining())
+                self._cond.wait(timeout=max(0.01, min(idle)) if idle else None)
+
+    def _release(self, account: MayakAccount, latency: Optional[float] = None, error: bool = False,
+                 disable: Optional[str] = None, cooldown: Optional[float] = None):
+        with self._cond:
+            account.in_flight = False
+            if latency is not None:
+                account.total_latency += latency
+            if error:
+                account.errors += 1
+            if disable:
+                account.disabled_reason = disable
+            if cooldown is not None:
+                account.throttled += 1
+                account.ready_at = max(account.ready_at, time.monotonic() + cooldown)
+            self._cond.notify_all()
+
+    def _retry_after(self, response) -> float:
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError, AttributeError):
+            return self.throttle_cooldown
+
+    def get_products_info(self, codes: List[Union[int, str]],
+                          deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """
+        Получает информацию о товарах одного чанка через следующий свободный аккаунт
+
+        Args:
+            codes: Список кодов товаров (максимум 20)
+            deadline: Ограничение по времени на ожидание аккаунта и запрос
+
+        Returns:
+            Список товаров или None, если чанк не удалось получить ни через один аккаунт
+        """
+        throttled_attempts = 0
+        while True:
+            account = self._acquire(deadline)
+            if account is None and is_expired(deadline):
+                logger.warning(f"Истёк бюджет времени, чанк из {len(codes)} кодов не запрошен")
+                return None
+            if account is None:
+                logger.error("Нет активных аккаунтов Mayak: cookies всех аккаунтов недействительны")
+                return None
+
+            started = time.monotonic()
+            try:
+                data = account.api.fetch_products_info(codes, timeout=request_timeout(deadline))
+            except requests.exceptions.HTTPError as e:
+                status = getattr(e.response, 'status_code', None)
+                if status in AUTH_ERROR_CODES:
+                    self._release(account, error=True, disable=f"HTTP {status}")
+                    logger.warning(f"Аккаунт Mayak {account.name} выведен из ротации: HTTP {status} "
+                                   f"(cookies истекли?), осталось {len(self.active_accounts)}")
+                    continue
+                if status in THROTTLE_CODES and throttled_attempts < len(self.accounts):
+                    throttled_attempts += 1
+                    cooldown = self._retry_after(e.response)
+                    self._release(account, error=True, cooldown=cooldown)
+                    logger.warning(f"Аккаунт Mayak {account.name}: HTTP 429, пауза {cooldown:g} сек")
+                    continue
+                self._failure.status = status
+                self._release(account, error=True)
+                logger.error(f"Ошибка при запросе к Mayak API (аккаунт {account.name}): {e}")
+                return None
+            except requests.exceptions.RequestException as e:
+                self._release(account, error=True)
+                logger.error(f"Ошибка при запросе к Mayak API (аккаунт {account.name}): {e}")
+                return None
+            except json.JSONDecodeError as e:
+                self._release(account, error=True)
+                logger.error(f"Ошибка при парсинге JSON от Mayak API (аккаунт {account.name}): {e}")
+                return None
+
+            self._release(account, latency=time.monotonic() - started)
+            return data
+
+    def can_retry(self) -> bool:
+        """Повторять чанки есть смысл, пока в ротации остались аккаунты"""
+        return bool(self.active_accounts)
+
+    def fetch_chunks(self, chunks: List[List[str]],
+                     deadline: Optional[Deadline] = None) -> List[Tuple[Optional[Any], Optional[int]]]:
+        """Запрашивает чанки параллельно на аккаунтах пула (результаты request_chunk в порядке чанков)"""
+        workers = max(1, min(len(chunks), len(self.active_accounts)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mayak-retry') as executor:
+            return list(executor.map(lambda chunk: self.request_chunk(chunk, deadline), chunks))
+
+    def get_all_products_info(self, codes: List[Union[int, str]],
+                              on_chunk: Optional[Callable[[List[Dict[str, Any]], int, int], None]] = None,
+                              deadline: Optional[Deadline] = None) -> ProductList:
+        """
+        Получает информацию о всех товарах, выполняя чанки параллельно на аккаунтах пула
+
+        Args:
+            codes: Список кодов товаров
+            on_chunk: Вызывается после каждого чанка с (товары на текущий момент, готово чанков, всего чанков)
+            deadline: Ограничение по времени; по его истечении незавершённые чанки не ждём
+
+        Returns:
+            Список с информацией о всех товарах в порядке чанков, затем товары повторно
+            запрошенных чанков (ProductList с missing_ids чанков, не успевших до deadline,
+            и кодов, которые не удалось получить и после повторов)
+        """
+        chunks = self.split_codes_to_chunks(codes)
+        if not chunks:
+            return ProductList()
+
+        results: List[List[Dict[str, Any]]] = [[] for _ in chunks]
+        all_products: List[Dict[str, Any]] = []
+        missing: List[str] = []
+        failed: List[Tuple[List[str], Optional[int]]] = []
+        succeeded = False
+        workers = max(1, min(len(chunks), len(self.active_accounts)))
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mayak')
+        futures = {executor.submit(self.request_chunk, chunk, deadline): i for i, chunk in enumerate(chunks)}
+        pending = set(futures)
+        try:
+            timeout = deadline.remaining() if deadline is not None else None
+            for done, future in enumerate(as_completed(futures, timeout=timeout), 1):
+                pending.discard(future)
+                chunk_data, status = future.result()
+                if chunk_data is None:
+                    if is_expired(deadline):
+                        missing.extend(chunks[futures[future]])
+                    else:
+                        failed.append((chunks[futures[future]], status))
+                else:
+                    succeeded = True
+                products = self.chunk_products(chunk_data)
+                results[futures[future]] = products
+                all_products.extend(products)
+                if on_chunk:
+                    try:
+                        on_chunk(all_products, done, len(chunks))
+                    except Exception as e:
+                        logger.error(f"Ошибка в обработчике прогресса: {e}")
+        except FuturesTimeoutError:
+            # Запросы в полёте ограничены таймаутом по deadline и завершатся сами, их не ждём
+            for future in pending:
+                missing.extend(chunks[futures[future]])
+            logger.warning(f"Истёк бюджет времени: не завершено {len(pending)} из {len(chunks)} чанков, "
+                           f"возвращаем частичный результат")
+        finally:
+            executor.shutdown(wait=not pending, cancel_futures=True)
+
+        recovered: List[Dict[str, Any]] = []
+        if failed:
+            recovered, lost = self.retry_failed_chunks(failed, deadline=deadline, others_succeeded=succeeded)
+            missing.extend(lost)
+
+        for account in self.accounts:
+            stats = account.stats()
+            logger.info(f"Аккаунт Mayak {account.name}: запросов {stats['requests']}, ошибок {stats['errors']}, "
+                        f"{stats['requests_per_minute']:.0f}/мин"
+                        f"{'' if account.active else ', отключён: ' + account.disabled_reason}")
+
+        ordered = [product for products in results for product in products] + recovered
+        logger.info(f"Получена информация о {len(ordered)} товарах ({workers} аккаунтов параллельно)")
+        return ProductList(ordered, missing_ids=missing)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [account.stats() for account in self.accounts]
+
+
+def create_mayak_client(cookies: Union[str, List[str]], transport: Optional[HttpTransport] = None) -> MayakAPI:
+    """
+    Создаёт клиент Mayak: один аккаунт - MayakAPI на общем транспорте, несколько - MayakSessionPool
+
+    Args:
+        cookies: Строка cookies или список наборов cookies (см. mayak_api.load_cookie_sets)
+        transport: Общий HTTP транспорт для одного аккаунта
+
+    Environment:
+        MAYAK_MIN_INTERVAL - минимальный интервал между запросами одного аккаунта пула, сек
+    """
+    cookie_sets = [cookies] if isinstance(cookies, str) else list(cookies)
+    if len(cookie_sets) == 1:
+        return MayakAPI(cookie_sets[0], transport=transport)
+    return MayakSessionPool(cookie_sets, min_interval=float(os.getenv('MAYAK_MIN_INTERVAL', '0')))
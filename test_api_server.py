@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест HTTP API: маршрутизация, потоковая выдача, ошибки и keep-alive
+"""
+
+import asyncio
+import json
+
+from mayak_api import MayakAPI
+from wb_api_server import ApiServer
+from wb_parser import WBParser
+
+
+MOCK_SEARCH = {
+    "total": 2,
+    "products": [
+        {"id": 306897066, "name": "Куртка 1", "brand": "A", "pics": 13, "reviewRating": 4.8, "feedbacks": 10},
+        {"id": 164105063, "name": "Куртка 2", "brand": "B", "pics": 8, "reviewRating": 4.5, "feedbacks": 3},
+    ],
+}
+
+
+class FakeMayakAPI(MayakAPI):
+    """Mayak API без сети: чанки по 2 кода, коды из failing не обогащаются, error - исключение"""
+
+    MAX_CODES_PER_REQUEST = 2
+
+    def __init__(self, failing=(), error=None):
+        super().__init__()
+        self.failing = {str(code) for code in failing}
+        self.error = error
+        self.RETRY_BACKOFF = 0
+
+    def get_products_info(self, codes, deadline=None):
+        if self.error:
+            raise self.error
+        if self.failing.intersection(str(code) for code in codes):
+            self._failure.status = 400
+            return None
+        return [{'id': str(code), 'sales': int(code) % 1000} for code in codes]
+
+
+class FakeWBParser(WBParser):
+    """WBParser с выдачей WB из MOCK_SEARCH"""
+
+    def fetch_data(self, url, deadline=None):
+        return MOCK_SEARCH
+
+
+class UnavailableWBParser(WBParser):
+    """WBParser, у которого запрос к WB не удаётся"""
+
+    def fetch_data(self, url, deadline=None):
+        return None
+
+
+def make_server(mayak_api=None, parser_class=FakeWBParser) -> ApiServer:
+    parser = parser_class()
+    parser.mayak_api = mayak_api
+    return ApiServer(parser, max_concurrency=2)
+
+
+async def read_response(reader: asyncio.StreamReader):
+    """Читает один ответ: (статус, заголовки, тело, получен ли ответ целиком)"""
+    status_line = await reader.readline()
+    if not status_line:
+        return None, {}, b'', False
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        return status, headers, await reader.readexactly(int(headers['content-length'])), True
+
+    body = b''
+    while True:
+        size_line = await reader.readline()
+        if not size_line:
+            return status, headers, body, False
+        size = int(size_line.strip(), 16)
+        if size == 0:
+            await reader.readline()
+            return status, headers, body, True
+        body += (await reader.readexactly(size + 2))[:-2]
+
+
+async def exchange(server: ApiServer, requests_data):
+    """Отправляет запросы в одном соединении и читает ответы до закрытия соединения сервером"""
+    listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for raw in requests_data:
+            writer.write(raw)
+        await writer.drain()
+        responses = []
+        while True:
+            status, headers, body, complete = await asyncio.wait_for(read_response(reader), 5)
+            if status is None:
+                break
+            responses.append((status, headers, body, complete))
+            if not complete:
+                break
+        writer.close()
+        return responses
+    finally:
+        listener.close()
+        await listener.wait_closed()
+
+
+def get(path: str, close: bool = True) -> bytes:
+    connection = 'Connection: close\r\n' if close else ''
+    return f"GET {path} HTTP/1.1\r\nHost: test\r\n{connection}\r\n".encode('utf-8')
+
+
+def run(server: ApiServer, *requests_data):
+    return asyncio.run(exchange(server, list(requests_data)))
+
+
+def test_routing_and_formats():
+    """Маршруты, форматы ответа и коды ошибок запроса"""
+    print("🧪 Тест HTTP API...")
+
+    server = make_server(FakeMayakAPI())
+    [(status, headers, body, complete)] = run(server, get('/health'))
+    health = json.loads(body)
+    assert status == 200 and complete and health['status'] == 'ok' and health['mayak'] is True
+    assert headers['connection'] == 'close'
+
+    [(status, headers, body, complete)] = run(server, get('/search?q=%D0%BA%D1%83%D1%80%D1%82%D0%BA%D0%B0'))
+    data = json.loads(body)
+    assert status == 200 and complete and headers['transfer-encoding'] == 'chunked'
+    assert data['query'] == 'куртка' and data['total'] == 2
+    assert [p['id'] for p in data['products']] == [306897066, 164105063]
+
+    [(_, headers, body, _)] = run(server, get('/search?q=x&format=csv'))
+    assert headers['content-type'].startswith('text/csv') and body.decode('utf-8').count('\n') == 3
+
+    assert run(server, get('/nope'))[0][0] == 404
+    assert run(server, b"POST /health HTTP/1.1\r\nConnection: close\r\n\r\n")[0][0] == 405
+    assert run(server, get('/search'))[0][0] == 400
+    assert run(server, get('/search?q=x&page=abc'))[0][0] == 400
+    assert run(server, get('/search?q=x&format=xml'))[0][0] == 400
+    assert run(server, get('/enrich?ids=1,x'))[0][0] == 400
+    assert run(make_server(None), get('/enrich?ids=1'))[0][0] == 503
+
+    # Некорректный Content-Length - ошибка клиента, а не сервера
+    for length in (b'abc', b'-5'):
+        [(status, headers, body, _)] = run(server, b"GET /health HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n")
+        assert status == 400 and 'Content-Length' in json.loads(body)['error']
+        assert headers['connection'] == 'close'
+
+    # Слишком большое тело отклоняется до чтения, соединение закрывается
+    responses = run(server, b"GET /health HTTP/1.1\r\nContent-Length: 1000000000\r\n\r\n", get('/health'))
+    [(status, headers, _, _)] = responses
+    assert status == 413 and headers['connection'] == 'close'
+
+    print("✅ Маршруты и ошибки запроса обрабатываются")
+    return True
+
+
+def test_enrich_streaming():
+    """/enrich отдаёт товары по чанкам Mayak и сообщает о необогащённых кодах"""
+    print("\n🧪 Тест потоковой выдачи /enrich...")
+
+    server = make_server(FakeMayakAPI(failing=[3]))
+    [(status, headers, body, complete)] = run(server, get('/enrich?ids=1,2,3,4,5&format=ndjson'))
+    lines = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    assert status == 200 and complete and headers['content-type'].startswith('application/x-ndjson')
+    # Товар 4 из повтора упавшего чанка [3, 4] приходит последним
+    assert [row['id'] for row in lines[:-1]] == ['1', '2', '5', '4']
+    assert lines[-1] == {'missing_ids': ['3']}
+
+    [(_, _, body, complete)] = run(server, get('/enrich?ids=1,2,3,4'))
+    data = json.loads(body)
+    assert complete and data['ids'] == 4 and data['missing_ids'] == ['3'] and len(data['products']) == 3
+
+    [(_, _, body, _)] = run(make_server(FakeMayakAPI()), get('/enrich?ids=1,2'))
+    assert 'missing_ids' not in json.loads(body)
+
+    print("✅ Потоковая выдача работает")
+    return True
+
+
+def test_partial_and_upstream_errors():
+    """Сбой WB - 502, а не пустая выдача; неполное обогащение /products помечается partial и missing_ids"""
+    server = make_server(FakeMayakAPI(), parser_class=UnavailableWBParser)
+    [(status, headers, body, complete)] = run(server, get('/search?q=x'))
+    assert status == 502 and complete and 'WB' in json.loads(body)['error']
+
+    server = make_server(FakeMayakAPI(failing=[164105063]))
+    [(status, _, body, complete)] = run(server, get('/products?q=x'))
+    data = json.loads(body)
+    assert status == 200 and complete and data['partial'] is True and data['missing_ids'] == ['164105063']
+    assert [p['id'] for p in data['products']] == ['306897066']
+
+    [(_, _, body, _)] = run(server, get('/products?q=x&format=ndjson'))
+    lines = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+    assert [row['id'] for row in lines[:-1]] == ['306897066'] and lines[-1] == {'missing_ids': ['164105063']}
+
+    [(_, _, body, _)] = run(make_server(FakeMayakAPI()), get('/products?q=x'))
+    data = json.loads(body)
+    assert data['partial'] is False and 'missing_ids' not in data and data['count'] == 2
+    return True
+
+
+def test_error_after_stream_started():
+    """Ошибка после отправки заголовков обрывает ответ, а не дописывает в него JSON с кодом 500"""
+    print("\n🧪 Тест ошибки во время потоковой выдачи...")
+
+    server = make_server(FakeMayakAPI(error=RuntimeError("сбой")))
+    responses = run(server, get('/enrich?ids=1,2,3', close=False), get('/health'))
+    [(status, headers, body, complete)] = responses
+    assert status == 200 and headers['transfer-encoding'] == 'chunked'
+    # Ответ не завершён завершающим чанком, соединение закрыто, второй запрос не обработан
+    assert not complete and b'"error"' not in body and b'500' not in body
+
+    print("✅ Оборванный ответ распознаётся клиентом")
+    return True
+
+
+def test_keep_alive():
+    """Несколько запросов в одном соединении, Connection: close завершает соединение"""
+    print("\n🧪 Тест keep-alive...")
+
+    server = make_server(FakeMayakAPI())
+    responses = run(server, get('/health', close=False), get('/search?q=x', close=False),
+                    get('/nope', close=False), get('/health'))
+    assert [status for status, _, _, _ in responses] == [200, 200, 404, 200]
+    assert all(complete for _, _, _, complete in responses)
+    assert [headers['connection'] for _, headers, _, _ in responses] == ['keep-alive'] * 3 + ['close']
+
+    # Тело запроса вычитывается и не ломает следующий запрос
+    responses = run(server, b"GET /health HTTP/1.1\r\nContent-Length: 4\r\n\r\nbody", get('/health'))
+    assert [status for status, _, _, _ in responses] == [200, 200]
+
+    # HTTP/1.0 без keep-alive закрывает соединение после ответа
+    responses = run(server, b"GET /health HTTP/1.0\r\n\r\n", get('/health'))
+    assert len(responses) == 1 and responses[0][1]['connection'] == 'close'
+
+    print("✅ Keep-alive работает")
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_routing_and_formats, test_enrich_streaming, test_partial_and_upstream_errors,
+             test_error_after_stream_started, test_keep_alive]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
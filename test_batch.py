@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест дедупликации SKU между страницами и запросами перед запросами к Mayak
+"""
+
+from wb_parser import WBParser
+from mayak_api import MayakAPI
+
+
+# Выдача WB: {(запрос, страница): список товаров}
+MOCK_PAGES = {
+    ("куртка", 1): [{"id": 306897066, "pics": 13, "name": "Куртка 1"}, {"id": 164105063, "pics": 8, "name": "Куртка 2"}],
+    ("куртка", 2): [{"id": 164105063, "pics": 8, "name": "Куртка 2"}, {"id": 244733060, "pics": 15, "name": "Куртка 3"}],
+    ("пуховик", 1): [{"id": 244733060, "pics": 15, "name": "Куртка 3"}, {"id": 64775386, "pics": 5, "name": "Пуховик"}],
+    ("пуховик", 2): [],
+}
+
+MOCK_SALES = {306897066: 12450, 164105063: 8765, 244733060: 15678, 64775386: 7193}
+
+
+class FakeMayakAPI(MayakAPI):
+    """Mayak API без сети: запоминает запрошенные коды"""
+
+    def __init__(self, failing=()):
+        super().__init__()
+        self.requested_codes = []
+        self.failing = {str(code) for code in failing}
+        self.RETRY_BACKOFF = 0
+
+    def get_products_info(self, codes, deadline=None):
+        self.requested_codes.extend(int(code) for code in codes)
+        if self.failing.intersection(str(code) for code in codes):
+            self._failure.status = 400
+            return None
+        return [{'id': str(code), 'sales': MOCK_SALES[int(code)]} for code in codes]
+
+
+class FakeWBParser(WBParser):
+    """WBParser с выдачей WB из MOCK_PAGES"""
+
+    def build_url(self, query, page=1):
+        return (query, page)
+
+    def fetch_data(self, url):
+        return {"products": MOCK_PAGES.get(url, [])}
+
+
+def test_dedup_across_pages_and_queries():
+    """Каждый SKU запрашивается у Mayak ровно один раз"""
+    print("🧪 Тест дедупликации SKU...")
+
+    parser = FakeWBParser()
+    parser.mayak_api = FakeMayakAPI()
+
+    results = parser.get_products_for_queries(["куртка", "пуховик"], pages=2)
+
+    requested = parser.mayak_api.requested_codes
+    assert sorted(requested) == sorted(MOCK_SALES), requested
+
+    assert [p['id'] for p in results["куртка"]] == ['244733060', '306897066', '164105063']
+    assert [p['id'] for p in results["пуховик"]] == ['244733060', '64775386']
+    assert results["пуховик"][0]['name'] == "Куртка 3"
+    assert results["куртка"][0]['image_urls'] and results["пуховик"][0]['image_urls']
+
+    # Результаты разных запросов не разделяют один и тот же словарь
+    assert results["куртка"][0] is not results["пуховик"][0]
+
+    print(f"✅ {len(requested)} товаров запрошено у Mayak на 6 вхождений в выдаче")
+    return True
+
+
+def test_max_products_per_query():
+    """Ограничение количества товаров действует на каждый запрос отдельно"""
+    print("\n🧪 Тест ограничения товаров на запрос...")
+
+    parser = FakeWBParser()
+    parser.mayak_api = FakeMayakAPI()
+
+    results = parser.get_products_for_queries(["куртка", "пуховик"], pages=2, max_products=2)
+    assert sorted(int(p['id']) for p in results["куртка"]) == [164105063, 306897066]
+    assert len(results["пуховик"]) == 2
+
+    print("✅ Ограничение на запрос работает")
+    return True
+
+
+# Выдача WB по регионам: {(запрос, dest, страница): список товаров}
+MOCK_REGIONS = {
+    ("куртка", "1", 1): [{"id": 306897066, "pics": 13}, {"id": 164105063, "pics": 8}, {"id": 64775386, "pics": 5}],
+    ("куртка", "2", 1): [{"id": 244733060, "pics": 15}, {"id": 306897066, "pics": 13}],
+    ("куртка", "3", 1): [{"id": 164105063, "pics": 8}],
+}
+
+
+class FakeRegionWBParser(WBParser):
+    """WBParser с региональной выдачей WB из MOCK_REGIONS"""
+
+    def build_url(self, query, page=1, dest=None):
+        return (query, dest, page)
+
+    def fetch_data(self, url):
+        return {"products": MOCK_REGIONS.get(url, [])}
+
+
+def test_regions_fan_out():
+    """Регионы опрашиваются вместе, SKU запрашивается у Mayak один раз, позиции сохраняются по регионам"""
+    print("\n🧪 Тест поиска по регионам...")
+
+    parser = FakeRegionWBParser()
+    parser.mayak_api = FakeMayakAPI()
+
+    results = parser.get_products_for_regions(["куртка"], ["1", "2", "3"], max_products=2)
+
+    assert sorted(parser.mayak_api.requested_codes) == [164105063, 244733060, 306897066]
+    by_id = {p['id']: p for p in results["куртка"]}
+    assert [p['id'] for p in results["куртка"]] == ['244733060', '306897066', '164105063']
+    assert by_id['306897066']['ranks'] == {"1": 1, "2": 2}
+    # Позиция учитывается и за пределами max_products
+    assert by_id['164105063']['ranks'] == {"1": 2, "3": 1} and by_id['164105063']['best_rank'] == 1
+    assert by_id['244733060']['ranks'] == {"2": 1}
+
+    print("✅ Поиск по регионам работает")
+    return True
+
+
+def test_missing_ids_reported():
+    """Коды без данных Mayak попадают в missing_ids тех запросов, в выдаче которых они были"""
+    print("\n🧪 Тест отчёта о необогащённых товарах...")
+
+    parser = FakeWBParser()
+    parser.mayak_api = FakeMayakAPI(failing=[64775386])
+    results = parser.get_products_for_queries(["куртка", "пуховик"], pages=2)
+    assert not results["куртка"].partial and len(results["куртка"]) == 3
+    assert results["пуховик"].partial and results["пуховик"].missing_ids == ['64775386']
+    assert [p['id'] for p in results["пуховик"]] == ['244733060']
+
+    parser = FakeRegionWBParser()
+    parser.mayak_api = FakeMayakAPI(failing=[306897066])
+    results = parser.get_products_for_regions(["куртка"], ["1", "2", "3"], max_products=2)
+    # Товар есть в двух регионах, но в отчёте один раз
+    assert results["куртка"].missing_ids == ['306897066']
+    assert [p['id'] for p in results["куртка"]] == ['244733060', '164105063']
+
+    print("✅ Необогащённые товары указаны по запросам")
+    return True
+
+
+def main():
+    """Основная функция тестирования"""
+    tests = [
+        test_dedup_across_pages_and_queries,
+        test_max_products_per_query,
+        test_regions_fan_out,
+        test_missing_ids_reported
+    ]
+
+    passed = sum(1 for test in tests if test())
+    print(f"\n📊 Результат: {passed}/{len(tests)} тестов пройдено")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
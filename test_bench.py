@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест микробенчмарков: замеры всех участков на малом объёме, проверка регрессий, база
+и отпечаток машины
+"""
+
+import json
+import os
+import tempfile
+
+from wb_bench import (BENCHMARKS, compare, host_fingerprint, host_mismatch, load_baseline, load_baseline_host,
+                      run_benchmarks, save_baseline)
+
+
+def test_benchmarks_run():
+    """Каждый участок замеряется: время, пропускная способность, пик памяти"""
+    print("🧪 Тест микробенчмарков...")
+
+    results = run_benchmarks(list(BENCHMARKS), [100], repeat=1)
+    assert set(results) == {f"{name}@100" for name in BENCHMARKS}
+    for key, result in results.items():
+        assert result['size'] == 100 and result['seconds'] > 0 and result['items_per_sec'] > 0, key
+        assert result['peak_bytes'] > 0, key
+
+    # Объёмы больше max_size участка пропускаются
+    assert BENCHMARKS['products_to_xlsx_bytes'].max_size < 1000000
+    assert 'products_to_xlsx_bytes@1000000' not in run_benchmarks(['products_to_xlsx_bytes'], [1000000])
+
+    print("✅ Участки замеряются")
+    return True
+
+
+def test_regression_gate():
+    """Падение пропускной способности и рост памяти сверх порогов - регрессии; шум - нет"""
+    baseline = {
+        'merge@10000': {'size': 10000, 'seconds': 0.1, 'items_per_sec': 100000, 'peak_bytes': 10_000_000},
+        'write_csv@100': {'size': 100, 'seconds': 0.002, 'items_per_sec': 50000, 'peak_bytes': 100_000},
+    }
+    within = {
+        'merge@10000': {'size': 10000, 'seconds': 0.12, 'items_per_sec': 80000, 'peak_bytes': 12_000_000},
+        # +100% памяти, но в абсолютных байтах это шум
+        'write_csv@100': {'size': 100, 'seconds': 0.002, 'items_per_sec': 50000, 'peak_bytes': 150_000},
+        'sort_products_by_sales@100': {'size': 100, 'seconds': 1.0, 'items_per_sec': 100, 'peak_bytes': 1},
+    }
+    assert compare(within, baseline, max_slowdown=0.25, max_memory_growth=0.25) == []
+
+    slower = {'merge@10000': {'size': 10000, 'seconds': 0.2, 'items_per_sec': 50000, 'peak_bytes': 20_000_000}}
+    regressions = compare(slower, baseline, max_slowdown=0.25, max_memory_growth=0.25)
+    assert len(regressions) == 2 and all(r.startswith('merge@10000') for r in regressions), regressions
+    assert '-50%' in regressions[0] and '+100%' in regressions[1], regressions
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'baseline.json')
+        assert load_baseline(path) == {}
+        save_baseline(path, {'merge@10000': baseline['merge@10000']})
+        save_baseline(path, {'write_csv@100': baseline['write_csv@100']})
+        assert load_baseline(path) == baseline
+        with open(path, encoding='utf-8') as f:
+            assert json.load(f)['host'] == host_fingerprint()
+        assert load_baseline_host(path) == host_fingerprint()
+    return True
+
+
+def test_host_fingerprint():
+    """База с другой машины или без отпечатка не годится для проверки регрессий"""
+    host = host_fingerprint()
+    assert host_mismatch(host) == [] and host_mismatch(dict(host)) == []
+    assert host_mismatch(None) == ['отпечаток машины в базе отсутствует']
+    other = dict(host, cpus=(host['cpus'] or 1) * 2)
+    assert host_mismatch(other) == [f"cpus: {other['cpus']!r} -> {host['cpus']!r}"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'baseline.json')
+        result = {'size': 100, 'seconds': 0.002, 'items_per_sec': 50000, 'peak_bytes': 100_000}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'host': other, 'results': {'merge@100': result}}, f)
+        assert host_mismatch(load_baseline_host(path))
+
+        # Записи с другой машины не смешиваются с новыми
+        save_baseline(path, {'write_csv@100': result})
+        assert list(load_baseline(path)) == ['write_csv@100']
+        assert host_mismatch(load_baseline_host(path)) == []
+    return True
+
+
+if __name__ == "__main__":
+    success = test_benchmarks_run() and test_regression_gate() and test_host_fingerprint()
+    exit(0 if success else 1)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест конвейера бота: общий парсер на набор cookies и однократное выполнение
+одинаковых одновременных запросов
+"""
+
+import threading
+import time
+
+import tg_bot
+from tg_bot import QueryResult, compute_query_result, get_parser
+
+
+class SlowBuild:
+    """Заглушка build_query_result: считает вызовы и держит запрос до release"""
+
+    def __init__(self, error=None):
+        self.calls = 0
+        self.error = error
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, query, mayak_cookies, on_progress=None, deadline=None):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return QueryResult(query, [{'id': 1, 'sales': 10}], b'xlsx')
+
+
+def run_concurrently(queries):
+    """Запускает compute_query_result в потоках; результаты и исключения по порядку запросов"""
+    outcomes = [None] * len(queries)
+
+    def call(index, query):
+        try:
+            outcomes[index] = compute_query_result(query, ['sid=1'])
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=call, args=(i, q)) for i, q in enumerate(queries)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def test_parser_reuse():
+    """Для одного набора cookies используется один WBParser"""
+    print("🧪 Тест общего парсера бота...")
+
+    parser = get_parser(['sid=1'])
+    assert get_parser(['sid=1']) is parser
+    assert get_parser(['sid=2']) is not parser
+    for i in range(tg_bot.MAX_PARSERS + 1):
+        get_parser([f'old={i}'])
+    assert len(tg_bot._parsers) == tg_bot.MAX_PARSERS
+
+    print("✅ Парсер переиспользуется")
+    return True
+
+
+def test_single_flight():
+    """Одинаковые одновременные запросы строят результат один раз, ошибка передаётся всем"""
+    original = tg_bot.build_query_result
+    tg_bot.result_cache.clear()
+    try:
+        build = SlowBuild()
+        tg_bot.build_query_result = build
+        threads, outcomes = run_concurrently(["Куртка", "куртка ", "КУРТКА"])
+        assert build.started.wait(5)
+        time.sleep(0.1)
+        build.release.set()
+        for thread in threads:
+            thread.join(5)
+        assert build.calls == 1 and outcomes[0] is outcomes[1] is outcomes[2]
+        assert not tg_bot._in_flight
+
+        # Завершённый запрос отвечается из кэша без новой сборки
+        assert compute_query_result("куртка", ['sid=1']) is outcomes[0] and build.calls == 1
+
+        tg_bot.result_cache.clear()
+        build = SlowBuild(error=RuntimeError("WB недоступен"))
+        tg_bot.build_query_result = build
+        threads, outcomes = run_concurrently(["пуховик", "Пуховик"])
+        assert build.started.wait(5)
+        time.sleep(0.1)
+        build.release.set()
+        for thread in threads:
+            thread.join(5)
+        assert build.calls == 1 and all(isinstance(o, RuntimeError) for o in outcomes)
+        assert not tg_bot._in_flight and "пуховик" not in tg_bot.result_cache
+    finally:
+        tg_bot.build_query_result = original
+        tg_bot.result_cache.clear()
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_parser_reuse, test_single_flight]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
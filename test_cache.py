@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест кэша результатов с TTL и вытеснением
+"""
+
+from wb_cache import TTLCache, normalize_query
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_and_eviction():
+    """Записи устаревают через ttl, старые вытесняются при переполнении"""
+    print("🧪 Тест кэша результатов...")
+
+    clock = FakeClock()
+    cache = TTLCache(max_entries=2, ttl=60, clock=clock)
+
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get_with_time('a') == (1, 1000.0)
+    cache.set('c', 3)  # вытесняет 'b': к 'a' обращались позже
+    assert 'b' not in cache and cache.get('a') == 1 and cache.get('c') == 3
+
+    clock.now += 61
+    assert cache.get('a') is None and len(cache) == 1
+    assert cache.hits == 3 and cache.misses == 1
+
+    assert normalize_query("  Куртка   ЖЕНСКАЯ чёрная ") == "куртка женская черная"
+
+    print("✅ Кэш результатов работает")
+    return True
+
+
+if __name__ == "__main__":
+    success = test_ttl_and_eviction()
+    exit(0 if success else 1)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест демона: пересылка аргументов, потоковый вывод (в том числе из потоков команды),
+коды завершения, пути и переменные окружения клиента
+"""
+
+import io
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import wb_sales_parser
+from wb_daemon import SocketStream, ThreadLocalStream, WBDaemon, forward_to_daemon, send_command
+from wb_query_log import DEFAULT_PATH
+
+ORIGINAL_THREAD_START = threading.Thread.start
+
+
+def test_daemon_round_trip():
+    """Команды выполняются в демоне, вывод и код завершения возвращаются клиенту"""
+    print("🧪 Тест демона...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, 'daemon.sock')
+        assert forward_to_daemon(['--help'], socket_path=socket_path) is None
+
+        daemon = WBDaemon(socket_path)
+        daemon.bind()
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        try:
+            out, err = io.StringIO(), io.StringIO()
+            assert forward_to_daemon(['--help'], socket_path, out, err) == 0
+            assert 'wb_sales_parser.py' in out.getvalue() and '--query' in out.getvalue()
+
+            # Относительный путь к cookies считается от каталога клиента
+            out, err = io.StringIO(), io.StringIO()
+            previous_cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                code = forward_to_daemon(['-q', 'куртка', '--cookies-file', 'нет.txt'], socket_path, out, err)
+            finally:
+                os.chdir(previous_cwd)
+            assert code == 1
+            assert os.path.join(tmp, 'нет.txt') in err.getvalue(), err.getvalue()
+
+            out, err = io.StringIO(), io.StringIO()
+            assert forward_to_daemon(['--max-products', 'x'], socket_path, out, err) == 2
+            assert 'invalid int value' in err.getvalue() or 'недопустимое' in err.getvalue()
+
+            status = send_command('status', socket_path)['status']
+            assert status['requests'] == 3 and status['active'] == 0
+        finally:
+            send_command('stop', socket_path)
+            thread.join(5)
+
+        assert not thread.is_alive() and not os.path.exists(socket_path)
+
+    print("✅ Демон работает")
+    return True
+
+
+def fake_run(args, context):
+    """run() без сети: пути контекста и вывод из потоков пула"""
+    log = context.query_log()
+    print(f"images={context.image_dir()} log={log.path if log else None} cookies={args.cookies_file}")
+
+    def work(i):
+        # Одной записью: print пишет текст и перевод строки отдельно, и строки потоков перемешиваются
+        sys.stdout.write(f"поток {i}\n")
+        logging.getLogger('wb_images').warning(f"лог потока {i}")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(work, range(2)))
+
+
+def test_client_paths_and_worker_output():
+    """Пути по умолчанию и переменные окружения - клиента; вывод потоков команды уходит клиенту"""
+    with tempfile.TemporaryDirectory() as tmp:
+        socket_path = os.path.join(tmp, 'daemon.sock')
+        client_dir = os.path.join(tmp, 'client')
+        os.makedirs(client_dir)
+
+        daemon = WBDaemon(socket_path)
+        daemon.bind()
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        original_run = wb_sales_parser.run
+        wb_sales_parser.run = fake_run
+        previous_cwd = os.getcwd()
+        try:
+            os.chdir(client_dir)
+            for env, images, log in (
+                ({'IMAGE_CACHE_DIR': 'cache', 'WB_QUERY_LOG': 'logs/q.jsonl'},
+                 os.path.join(client_dir, 'cache'), os.path.join(client_dir, 'logs', 'q.jsonl')),
+                ({}, os.path.join(client_dir, 'images'), DEFAULT_PATH),
+                ({'WB_QUERY_LOG': ''}, os.path.join(client_dir, 'images'), None),
+            ):
+                saved = {name: os.environ.pop(name, None) for name in env}
+                os.environ.update(env)
+                try:
+                    out, err = io.StringIO(), io.StringIO()
+                    assert forward_to_daemon(['-q', 'куртка'], socket_path, out, err) == 0
+                finally:
+                    for name, value in saved.items():
+                        os.environ.pop(name, None)
+                        if value is not None:
+                            os.environ[name] = value
+                lines = out.getvalue().splitlines()
+                cookies = os.path.join(client_dir, 'cookies.txt')
+                assert lines[0] == f"images={images} log={log} cookies={cookies}", lines[0]
+                assert sorted(lines[1:]) == ["поток 0", "поток 1"], lines
+                assert "лог потока 0" in err.getvalue() and "лог потока 1" in err.getvalue()
+        finally:
+            os.chdir(previous_cwd)
+            wb_sales_parser.run = original_run
+            send_command('stop', socket_path)
+            thread.join(5)
+
+        # После остановки демона запуск потоков не перехватывается
+        assert threading.Thread.start is ORIGINAL_THREAD_START
+    return True
+
+
+def test_finished_command_streams():
+    """Поток, переживший команду, пишет в исходный поток демона, а не закрытому клиенту"""
+    fallback = io.StringIO()
+    stream = ThreadLocalStream(fallback)
+    client = SocketStream(io.BytesIO(), 'out', threading.Lock())
+
+    def start_worker(text):
+        worker = threading.Thread(target=stream.write, args=(text,))
+        stream.inherit(worker)
+        return worker
+
+    stream.bind(client)
+    during, after = start_worker("во время команды"), start_worker("после команды")
+    stream.bind(None)
+    during.start()
+    during.join()
+    client.finish()
+    after.start()
+    after.join()
+
+    assert "во время команды" in client.wfile.getvalue().decode('utf-8')
+    assert fallback.getvalue() == "после команды"
+    return True
+
+
+def test_client_imports():
+    """Клиент CLI, пересылающий команду демону, не импортирует requests и метрики"""
+    code = "import sys, wb_sales_parser; print(sorted(m for m in ('requests', 'wb_metrics') if m in sys.modules))"
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == '[]', output
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_daemon_round_trip, test_client_paths_and_worker_output, test_finished_command_streams,
+             test_client_imports]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
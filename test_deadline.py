@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест бюджета времени: таймауты по deadline и частичный результат вместо ожидания
+"""
+
+import time
+
+import requests
+
+from mayak_api import MayakAPI
+from mayak_pool import MayakSessionPool
+from wb_deadline import Deadline, ProductList, MIN_TIMEOUT, request_timeout
+from wb_parser import WBParser
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self._data = data
+        self.status_code = 200
+        self.text = str(data)
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+class SlowMayakTransport:
+    """Ответ Mayak через delay сек; запрос с таймаутом меньше delay завершается ошибкой"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.timeouts = []
+
+    def get(self, url, params=None, headers=None, cookies=None, timeout=None):
+        self.timeouts.append(timeout)
+        if timeout is not None and timeout < self.delay:
+            time.sleep(timeout)
+            raise requests.exceptions.ReadTimeout("timed out")
+        time.sleep(self.delay)
+        return FakeResponse({code: {'sales': int(code)} for code in params['codes'].split(',')})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadline():
+    clock = FakeClock()
+    deadline = Deadline(10, clock=clock)
+    assert deadline.remaining() == 10 and not deadline.expired
+    assert deadline.timeout(30) == 10 and deadline.timeout(5) == 5
+    clock.now += 12
+    assert deadline.expired and deadline.remaining() == 0
+    # Нулевой таймаут requests отвергает с ValueError вместо ошибки таймаута
+    assert deadline.timeout(30) == MIN_TIMEOUT > 0
+    assert request_timeout(None) == 30
+    assert Deadline.after(0) is None and Deadline.after(None) is None
+
+    products = ProductList([{'id': '1'}], missing_ids=[2, 3])
+    assert products.partial and products.missing_ids == ['2', '3'] and products == [{'id': '1'}]
+    assert not ProductList([1]).partial
+    assert ProductList.like([], products).missing_ids == ['2', '3']
+    return True
+
+
+class ExpiringClock(FakeClock):
+    """Время идёт на step сек при каждом обращении: бюджет истекает между проверкой и запросом"""
+
+    def __init__(self, step: float):
+        super().__init__()
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+def test_expired_between_check_and_request():
+    """Истечение бюджета сразу перед запросом даёт ошибку запроса, а не ValueError"""
+    parser = WBParser()
+    data = parser._fetch_url("http://127.0.0.1:9/", deadline=Deadline(1, clock=ExpiringClock(0.6)))
+    assert data is None
+
+    api = MayakAPI(transport=requests.Session())
+    api.BASE_URL = "http://127.0.0.1:9/"
+    assert api.get_products_info([1], deadline=Deadline(1, clock=ExpiringClock(0.6))) is None
+    return True
+
+
+def test_sequential_partial():
+    """Последовательные чанки: после истечения бюджета остальные не запрашиваются"""
+    print("🧪 Тест частичного результата по deadline...")
+
+    transport = SlowMayakTransport(delay=0.1)
+    api = MayakAPI(transport=transport)
+    codes = list(range(1, 101))  # 5 чанков по 20
+
+    started = time.monotonic()
+    products = api.get_all_products_info(codes, deadline=Deadline(0.25))
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 0.45, elapsed
+    assert products.partial and len(products) == 40, len(products)
+    assert sorted(int(code) for code in products.missing_ids) == codes[40:]
+    assert all(timeout <= 0.25 for timeout in transport.timeouts)
+
+    # Без deadline результат полный
+    complete = MayakAPI(transport=SlowMayakTransport(delay=0)).get_all_products_info(codes)
+    assert len(complete) == 100 and not complete.partial
+
+    print("✅ Частичный результат возвращается вовремя")
+    return True
+
+
+def test_pool_partial():
+    """Пул: незавершённые к deadline чанки не ждём, их коды в missing_ids"""
+    transport = SlowMayakTransport(delay=0.2)
+    pool = MayakSessionPool(['sid=a', 'sid=b'], transport_factory=lambda: transport)
+    codes = list(range(1, 101))
+
+    started = time.monotonic()
+    products = pool.get_all_products_info(codes, deadline=Deadline(0.3))
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 0.45, elapsed
+    assert len(products) == 40 and len(products.missing_ids) == 60
+    assert {p['id'] for p in products}.isdisjoint(products.missing_ids)
+    return True
+
+
+class FakeWBParser(WBParser):
+    """Выдача WB без сети: 60 товаров"""
+
+    def fetch_data(self, url, deadline=None):
+        if deadline is not None and deadline.expired:
+            return None
+        return {"products": [{"id": 100000 + i, "pics": 3, "name": f"Товар {i}"} for i in range(60)]}
+
+
+def test_pipeline_partial():
+    """get_products_detailed_info_with_pics помечает неполный результат"""
+    parser = FakeWBParser()
+    parser.mayak_api = MayakAPI(transport=SlowMayakTransport(delay=0.1))
+
+    products = parser.get_products_detailed_info_with_pics("куртка", max_products=60, deadline=Deadline(0.15))
+    assert isinstance(products, ProductList) and products.partial
+    assert len(products) == 20 and len(products.missing_ids) == 40
+    assert products[0]['name'] and products[0]['image_urls']
+
+    # WB не успел ответить - пустой частичный результат
+    expired = Deadline(0)
+    products = parser.get_products_detailed_info_with_pics("куртка", deadline=expired)
+    assert products == [] and products.partial
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_deadline, test_expired_between_check_and_request, test_sequential_partial, test_pool_partial, test_pipeline_partial]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест поиска дублирующихся карточек по перцептивному хэшу
+"""
+
+import os
+import random
+import tempfile
+import threading
+
+from wb_duplicates import BKTree, compute_hashes, dhash_file, group_duplicates, hamming_distance
+
+
+def test_bk_tree_search():
+    """BK-дерево находит те же соседи, что и полный перебор"""
+    print("🧪 Тест BK-дерева...")
+
+    rng = random.Random(42)
+    values = [rng.getrandbits(64) for _ in range(2000)]
+    # Добавляем близкие копии первых хэшей (изменено 1-3 бита)
+    for value in values[:50]:
+        for bit in rng.sample(range(64), rng.randint(1, 3)):
+            value ^= 1 << bit
+        values.append(value)
+
+    tree = BKTree()
+    for index, value in enumerate(values):
+        tree.add(value, index)
+    assert len(tree) == len(values)
+
+    for query in values[:20] + values[-20:]:
+        expected = sorted(i for i, v in enumerate(values) if hamming_distance(query, v) <= 6)
+        found = sorted(item for _, item in tree.search(query, 6))
+        assert found == expected, (found, expected)
+
+    print("✅ BK-дерево работает")
+    return True
+
+
+def test_group_duplicates():
+    """Близкие хэши объединяются в группы с суммарными продажами"""
+    print("\n🧪 Тест группировки дубликатов...")
+
+    products = [
+        {'id': '1', 'sales': 100, 'revenue': 1000},
+        {'id': '2', 'sales': 300, 'revenue': 3000},
+        {'id': '3', 'sales': 50, 'revenue': 500},
+        {'id': '4', 'sales': 10, 'revenue': 100},
+    ]
+    base = 0xF0F0F0F0F0F0F0F0
+    hashes = {'1': base, '2': base ^ 0b11, '3': base ^ 0b11 ^ (1 << 40), '4': ~base & (2 ** 64 - 1)}
+
+    groups = group_duplicates(products, hashes, max_distance=2)
+    assert len(groups) == 1
+    assert groups[0]['ids'] == ['2', '1', '3']
+    assert groups[0]['sales'] == 450 and groups[0]['revenue'] == 4500
+
+    print("✅ Группировка дубликатов работает")
+    return True
+
+
+def test_compute_hashes_from_thread():
+    """Пул хэширования (spawn) работает из рабочего потока, как в демоне; нечитаемые файлы пропускаются"""
+    from PIL import Image
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for index in range(4):
+            path = os.path.join(tmp, f'{index}.png')
+            Image.new('L', (40, 30), color=index * 60).save(path)
+            paths[str(index)] = path
+        paths['broken'] = os.path.join(tmp, 'broken.jpg')
+        with open(paths['broken'], 'wb') as f:
+            f.write(b'not an image')
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(compute_hashes(paths, workers=2)))
+        thread.start()
+        thread.join(60)
+        assert not thread.is_alive() and len(results) == 1
+        assert results[0] == {key: dhash_file(path) for key, path in paths.items() if key != 'broken'}
+    return True
+
+
+def main():
+    """Основная функция тестирования"""
+    tests = [
+        test_bk_tree_search,
+        test_group_duplicates,
+        test_compute_hashes_from_thread
+    ]
+
+    passed = sum(1 for test in tests if test())
+    print(f"\n📊 Результат: {passed}/{len(tests)} тестов пройдено")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест экспорта в Excel: миниатюры, встраивание изображений, размеры ячеек
+"""
+
+import io
+import os
+import tempfile
+
+from openpyxl import Workbook, load_workbook
+from PIL import Image
+
+from wb_export import (IMAGE_CELL_HEIGHT, IMAGE_CELL_WIDTH, _embed_thumbnails, build_thumbnails,
+                       make_thumbnail, products_to_xlsx_bytes)
+
+
+def save_image(path: str, size, mode: str = 'RGB') -> str:
+    Image.new(mode, size).save(path)
+    return path
+
+
+class LocalDownloader:
+    """Загрузчик без сети: {ID товара: локальные файлы}"""
+
+    def __init__(self, paths_by_id):
+        self.paths_by_id = paths_by_id
+        self.calls = []
+
+    def download_products(self, products, max_images=None):
+        self.calls.append(max_images)
+        return {str(p['id']): self.paths_by_id.get(str(p['id']), [])[:max_images] for p in products}
+
+
+def test_make_thumbnail():
+    """Миниатюра вписывается в ячейку с сохранением пропорций и кодируется в JPEG"""
+    print("🧪 Тест миниатюр...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [((1000, 500), (180, 90)), ((600, 1200), (120, 240)), ((90, 60), (90, 60))]
+        for size, expected in cases:
+            data = make_thumbnail(save_image(os.path.join(tmp, 'image.png'), size))
+            assert data.startswith(b'\xff\xd8')
+            with Image.open(io.BytesIO(data)) as image:
+                assert image.size == expected and image.format == 'JPEG', (size, image.size)
+
+        # Прозрачность (RGBA) не мешает сохранению в JPEG
+        data = make_thumbnail(save_image(os.path.join(tmp, 'alpha.png'), (400, 400), 'RGBA'), 100, 100)
+        with Image.open(io.BytesIO(data)) as image:
+            assert image.size == (100, 100) and image.mode == 'RGB'
+
+        broken = os.path.join(tmp, 'broken.webp')
+        with open(broken, 'wb') as f:
+            f.write(b'not an image')
+        assert make_thumbnail(broken) is None
+        assert make_thumbnail(os.path.join(tmp, 'missing.png')) is None
+
+    print("✅ Миниатюры готовятся")
+    return True
+
+
+def test_build_thumbnails():
+    """Каждый файл уменьшается один раз, порядок изображений товара сохраняется"""
+    with tempfile.TemporaryDirectory() as tmp:
+        shared = save_image(os.path.join(tmp, 'shared.png'), (360, 480))
+        wide = save_image(os.path.join(tmp, 'wide.png'), (800, 200))
+        broken = os.path.join(tmp, 'broken.png')
+        with open(broken, 'wb') as f:
+            f.write(b'x')
+        downloader = LocalDownloader({'1': [shared, wide, broken], '2': [shared]})
+        products = [{'id': 1}, {'id': 2}, {'id': 3}]
+
+        thumbnails = build_thumbnails(products, images_per_product=3, downloader=downloader, workers=1)
+
+        assert downloader.calls == [3]
+        assert set(thumbnails) == {'1', '2', '3'} and thumbnails['3'] == []
+        assert len(thumbnails['1']) == 3 and thumbnails['1'][2] is None
+        assert thumbnails['1'][0] == thumbnails['2'][0]
+        with Image.open(io.BytesIO(thumbnails['1'][1])) as image:
+            assert image.size == (180, 45)
+    return True
+
+
+def test_embed_thumbnails():
+    """Миниатюры привязываются к ячейкам строки, пропущенные изображения оставляют ячейку пустой"""
+    with tempfile.TemporaryDirectory() as tmp:
+        data = make_thumbnail(save_image(os.path.join(tmp, 'image.png'), (360, 480)))
+
+    ws = Workbook().active
+    _embed_thumbnails(ws, [data, None, data], row=3, first_col=5)
+    assert [image.anchor for image in ws._images] == ['E3', 'G3']
+    return True
+
+
+def test_xlsx_layout():
+    """Размеры строк и колонок, формулы IMAGE() и встроенные миниатюры в книге"""
+    print("\n🧪 Тест разметки книги...")
+
+    products = [
+        {'id': '111', 'name': 'Товар 1', 'sales': 10, 'revenue': 100,
+         'image_urls': ['https://img/1.webp', 'https://img/2.webp', 'https://img/3.webp', 'https://img/4.webp']},
+        {'id': '222', 'name': 'Товар 2', 'sales': 5, 'revenue': 50, 'image_urls': ['https://img/5.webp']},
+    ]
+
+    sheet = load_workbook(io.BytesIO(products_to_xlsx_bytes(products))).active
+    assert sheet.max_column == 8 and sheet['H2'].value == '=IMAGE("https://img/4.webp"; 1)'
+    assert sheet['F3'].value is None
+    assert [sheet.column_dimensions[col].width for col in 'ABCD'] == [45, 50, 18, 18]
+    assert all(sheet.column_dimensions[col].width == round(IMAGE_CELL_WIDTH / 7.0, 2) for col in 'EFGH')
+    assert all(sheet.row_dimensions[row].height == IMAGE_CELL_HEIGHT * 0.75 for row in range(1, 4))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image = save_image(os.path.join(tmp, 'image.png'), (360, 480))
+        downloader = LocalDownloader({'111': [image] * 4, '222': [image]})
+        xlsx = products_to_xlsx_bytes(products, embed_images=True, images_per_product=2,
+                                      downloader=downloader, workers=1)
+
+    sheet = load_workbook(io.BytesIO(xlsx)).active
+    # Колонок изображений не больше images_per_product, вместо формул - картинки
+    assert sheet.max_column == 6 and sheet['E2'].value is None
+    assert [cell.value for cell in sheet[1]][4:] == ["Изображение 1", "Изображение 2"]
+    assert len(sheet._images) == 3
+    assert sheet.column_dimensions['F'].width == round(IMAGE_CELL_WIDTH / 7.0, 2)
+
+    print("✅ Разметка книги корректна")
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_make_thumbnail, test_build_thumbnails, test_embed_thumbnails, test_xlsx_layout]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
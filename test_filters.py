@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест фильтрации товаров по данным поиска WB до запросов к Mayak
+"""
+
+from wb_parser import WBParser
+from wb_filters import ProductFilter
+
+
+MOCK_WB_RESPONSE = {
+    "products": [
+        {"id": 306897066, "pics": 13, "brand": "Zara", "reviewRating": 4.8, "feedbacks": 120,
+         "sizes": [{"price": {"basic": 599000, "product": 299000}}]},
+        {"id": 164105063, "pics": 2, "brand": "Mango", "reviewRating": 4.9, "feedbacks": 5,
+         "sizes": [{"price": {"basic": 199000, "product": 149000}}]},
+        {"id": 244733060, "pics": 15, "brand": "Noname", "reviewRating": 3.9, "feedbacks": 900,
+         "salePriceU": 89000},
+    ],
+    "total": 3
+}
+
+
+def test_filter_flags():
+    """Тест фильтров, заданных параметрами"""
+    print("🧪 Тест фильтров по параметрам...")
+
+    parser = WBParser()
+    wb_products = parser.extract_products_with_pics(MOCK_WB_RESPONSE)
+
+    assert list(ProductFilter(min_price=1000).apply(wb_products)) == [306897066, 164105063]
+    assert list(ProductFilter(max_price=1000).apply(wb_products)) == [244733060]
+    assert list(ProductFilter(min_rating=4.5, min_feedbacks=10).apply(wb_products)) == [306897066]
+    assert list(ProductFilter(min_pics=10).apply(wb_products)) == [306897066, 244733060]
+    assert list(ProductFilter(brands=['zara', 'MANGO']).apply(wb_products)) == [306897066, 164105063]
+    assert list(ProductFilter(exclude_brands=['Zara']).apply(wb_products)) == [164105063, 244733060]
+    assert ProductFilter().apply(wb_products) is wb_products
+
+    print("✅ Фильтры по параметрам работают")
+    return True
+
+
+def test_filter_expression():
+    """Тест разбора выражения фильтра"""
+    print("\n🧪 Тест выражения фильтра...")
+
+    parser = WBParser()
+    wb_products = parser.extract_products_with_pics(MOCK_WB_RESPONSE)
+
+    product_filter = ProductFilter.from_expression("price >= 1000 and brand not in Zara|Noname")
+    assert list(product_filter.apply(wb_products)) == [164105063]
+    assert product_filter.describe() == "price >= 1000 and brand not in noname|zara"
+
+    for bad_expression in ("color = red", "price ~ 10"):
+        try:
+            ProductFilter.from_expression(bad_expression)
+            print(f"❌ Некорректное выражение принято: {bad_expression}")
+            return False
+        except ValueError:
+            pass
+
+    print("✅ Выражения фильтра работают")
+    return True
+
+
+def main():
+    """Основная функция тестирования"""
+    tests = [
+        test_filter_flags,
+        test_filter_expression
+    ]
+
+    passed = sum(1 for test in tests if test())
+    print(f"\n📊 Результат: {passed}/{len(tests)} тестов пройдено")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест хеджирования запросов: дубликат после перцентиля, бюджет, только GET
+"""
+
+import asyncio
+import threading
+import time
+
+from http_transport import HedgedTransport, LatencyTracker
+
+
+class FakeResponse:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class SlowTransport:
+    """Длительность n-го запроса берётся из delays (дальше - 0.01 сек)"""
+
+    def __init__(self, delays=None):
+        self.delays = list(delays or [])
+        self.calls = 0
+        self.responses = []
+        self._lock = threading.Lock()
+
+    def _next(self):
+        with self._lock:
+            index = self.calls
+            self.calls += 1
+        delay = self.delays[index] if index < len(self.delays) else 0.01
+        return index, delay
+
+    def request(self, method, url, **kwargs):
+        index, delay = self._next()
+        time.sleep(delay)
+        response = FakeResponse(index)
+        self.responses.append(response)
+        return response
+
+    async def arequest(self, method, url, **kwargs):
+        index, delay = self._next()
+        await asyncio.sleep(delay)
+        return FakeResponse(index)
+
+
+def warm_up(hedged: HedgedTransport, url: str, count: int):
+    for _ in range(count):
+        hedged.get(url)
+
+
+def test_latency_tracker():
+    tracker = LatencyTracker(window=100)
+    assert tracker.percentile(95) is None
+    for value in range(1, 101):
+        tracker.record(value / 1000)
+    assert tracker.percentile(50) == 0.05 and tracker.percentile(95) == 0.095
+    assert tracker.percentile(100) == 0.1
+    return True
+
+
+def test_hedged_requests():
+    """Медленный запрос дублируется, ответ дубликата возвращается раньше"""
+    print("🧪 Тест хеджирования запросов...")
+
+    url = "https://app.mayak.bz/api/v1/wb/products"
+    base = SlowTransport(delays=[0.01] * 20 + [1.0])
+    hedged = HedgedTransport(base, percentile=95, budget=1.0, min_samples=20, min_delay=0.02)
+    warm_up(hedged, url, 20)
+    assert base.calls == 20 and hedged.hedges == 0
+
+    started = time.monotonic()
+    response = hedged.get(url)
+    elapsed = time.monotonic() - started
+    assert response.name == 21 and elapsed < 0.5, (response.name, elapsed)
+    assert hedged.hedges == 1 and hedged.hedge_wins == 1
+
+    # Ответ проигравшего запроса закрывается, когда он завершится
+    time.sleep(1.1)
+    assert base.responses[-1].name == 20 and base.responses[-1].closed
+
+    # POST не хеджируется
+    base.delays = [0.01] * base.calls + [0.2]
+    assert hedged.request('POST', url).name == base.calls - 1 and hedged.hedges == 1
+
+    print("✅ Хеджирование запросов работает")
+    return True
+
+
+def test_hedge_budget():
+    """Без накопленного бюджета дубликаты не отправляются"""
+    url = "https://search.wb.ru/search"
+    base = SlowTransport(delays=[0.01] * 20 + [0.3, 0.01, 0.3])
+    hedged = HedgedTransport(base, budget=0.05, min_samples=20, min_delay=0.02)
+    warm_up(hedged, url, 20)
+
+    # 21 запрос * 0.05 = 1.05 кредита: первый медленный запрос (20) хеджируется дубликатом (21),
+    # второй медленный (22) ждёт свой ответ
+    assert hedged.get(url).name == 21
+    assert hedged.hedges == 1
+    assert hedged.get(url).name == 22
+    assert hedged.hedges == 1
+    return True
+
+
+def test_async_hedged_requests():
+    """В асинхронном режиме проигравший запрос отменяется"""
+    url = "https://search.wb.ru/search"
+    base = SlowTransport(delays=[0.01] * 20 + [1.0])
+    hedged = HedgedTransport(base, budget=1.0, min_samples=20, min_delay=0.02)
+
+    async def scenario():
+        for _ in range(20):
+            await hedged.aget(url)
+        started = time.monotonic()
+        response = await hedged.aget(url)
+        return response, time.monotonic() - started
+
+    response, elapsed = asyncio.run(scenario())
+    assert response.name == 21 and elapsed < 0.5
+    assert hedged.hedge_wins == 1
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_latency_tracker, test_hedged_requests, test_hedge_budget, test_async_hedged_requests]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест хранилища истории метрик товаров
+"""
+
+import tempfile
+
+from wb_history import ProductHistoryStore
+
+
+def make_snapshot(day: int):
+    """Снимок Mayak для двух товаров на день day"""
+    return [
+        {'id': '306897066', 'sales': 100 + day * 10, 'revenue': 1000.0 * day, 'avg_price': 2867, 'lost_revenue': 0},
+        {'id': '164105063', 'sales': 50 + day * 2, 'revenue': 500.0 * day, 'avg_price': 2500, 'lost_revenue': 10},
+    ]
+
+
+def test_range_reads_and_velocity():
+    """Тест чтения диапазона и скорости продаж"""
+    print("🧪 Тест хранилища истории...")
+
+    with tempfile.TemporaryDirectory() as path:
+        store = ProductHistoryStore(path)
+        for day in range(5):
+            store.append_snapshot(make_snapshot(day), ts=day * 86400)
+
+        history = store.read_range(306897066, start=86400, end=3 * 86400)
+        assert list(history['ts']) == [86400, 2 * 86400, 3 * 86400]
+        assert list(history['sales']) == [110, 120, 130]
+
+        assert list(store.deltas(164105063)) == [2.0, 2.0, 2.0, 2.0]
+        assert list(store.velocity(306897066)) == [10.0, 10.0, 10.0, 10.0]
+
+        velocities = store.velocity_between(0, 4 * 86400)
+        assert velocities == {306897066: 10.0, 164105063: 2.0}
+        store.close()
+
+        # Повторное открытие восстанавливает индекс с диска
+        reopened = ProductHistoryStore(path)
+        assert len(reopened) == 10
+        assert list(reopened.read_range(164105063, start=4 * 86400)['sales']) == [58]
+
+        try:
+            reopened.append_snapshot(make_snapshot(0), ts=0)
+            print("❌ Снимок из прошлого не отклонён")
+            return False
+        except ValueError:
+            pass
+        reopened.close()
+
+    print("✅ Хранилище истории работает")
+    return True
+
+
+def main():
+    """Основная функция тестирования"""
+    success = test_range_reads_and_velocity()
+    print("🎉 Все тесты прошли успешно!" if success else "⚠️  Некоторые тесты не прошли")
+    return success
+
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест HTTP транспорта: бэкенды requests и httpx, ошибки httpx как исключения requests,
+заголовок Cookie, асинхронный клиент в нескольких циклах событий
+"""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from http_transport import HttpTransport, TransportError, cookie_header
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """/echo - заголовки и строка запроса в JSON, /status/<код> - пустой ответ, /slow - ответ через 1 сек"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: bytes = b''):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith('/status/'):
+            self._reply(int(self.path.rsplit('/', 1)[1]))
+        elif self.path == '/slow':
+            time.sleep(1)
+            self._reply(200, b'{}')
+        elif self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/echo')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            body = {'path': self.path, 'headers': {k.lower(): v for k, v in self.headers.items()}}
+            self._reply(200, json.dumps(body).encode('utf-8'))
+
+    do_HEAD = do_GET
+
+
+def start_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}/"
+
+
+def test_cookie_header():
+    jar = requests.cookies.RequestsCookieJar()
+    jar.set('sid', 'abc')
+    jar.set('lang', 'ru')
+    assert cookie_header(jar) == 'sid=abc; lang=ru'
+    assert cookie_header({'a': '1', 'b': '2'}) == 'a=1; b=2'
+    assert cookie_header(None) is None and cookie_header({}) is None
+    return True
+
+
+def test_backends():
+    """Оба бэкенда дают одинаковые ответы и одинаковые исключения"""
+    print("🧪 Тест HTTP транспорта...")
+
+    server, base = start_server()
+    try:
+        for backend in ('requests', 'httpx'):
+            transport = HttpTransport(backend=backend, headers={'X-Client': 'wb'})
+            assert transport.backend == backend
+            response = transport.get(f"{base}/echo", params={'q': 'куртка'}, headers={'X-Extra': '1'},
+                                     cookies={'sid': 'abc', 'lang': 'ru'})
+            data = response.json()
+            assert response.status_code == 200 and response.ok
+            assert data['path'] == '/echo?q=%D0%BA%D1%83%D1%80%D1%82%D0%BA%D0%B0', (backend, data['path'])
+            assert data['headers']['cookie'] == 'sid=abc; lang=ru', backend
+            assert data['headers']['x-client'] == 'wb' and data['headers']['x-extra'] == '1'
+            assert data['headers']['user-agent'].startswith('Mozilla/5.0')
+
+            # HEAD не следует редиректам, GET - следует
+            assert transport.head(f"{base}/redirect").status_code == 302
+            assert transport.get(f"{base}/redirect").json()['path'] == '/echo'
+
+            response = transport.get(f"{base}/status/404")
+            assert response.status_code == 404 and not response.ok
+            try:
+                response.raise_for_status()
+                assert False, "ожидалась HTTPError"
+            except requests.exceptions.HTTPError as e:
+                assert e.response.status_code == 404
+
+            for url, timeout in ((closed_port_url(), 5), (f"{base}/slow", 0.1)):
+                try:
+                    transport.get(url, timeout=timeout)
+                    assert False, f"ожидалась ошибка запроса ({backend}, {url})"
+                except requests.exceptions.RequestException as e:
+                    # Ошибки httpx приводятся к исключениям requests
+                    assert backend == 'requests' or isinstance(e, TransportError)
+            transport.close()
+    finally:
+        server.shutdown()
+
+    print("✅ Бэкенды requests и httpx взаимозаменяемы")
+    return True
+
+
+def test_async_client_per_loop():
+    """Асинхронный клиент создаётся для каждого цикла событий и работает после asyncio.run"""
+    server, base = start_server()
+    try:
+        for backend in ('requests', 'httpx'):
+            transport = HttpTransport(backend=backend)
+
+            async def fetch():
+                responses = await asyncio.gather(*(transport.aget(f"{base}/echo", cookies={'sid': str(i)})
+                                                   for i in range(3)))
+                head = await transport.ahead(f"{base}/redirect")
+                try:
+                    await transport.aget(closed_port_url())
+                    assert False, "ожидалась ошибка запроса"
+                except requests.exceptions.RequestException:
+                    pass
+                return [r.json()['headers']['cookie'] for r in responses], head.status_code
+
+            # Каждый asyncio.run - новый цикл: клиент прошлого цикла не переиспользуется
+            for _ in range(2):
+                assert asyncio.run(fetch()) == (['sid=0', 'sid=1', 'sid=2'], 302), backend
+
+            if backend == 'httpx':
+                async def client_ids():
+                    first = transport._get_async_client()
+                    assert transport._get_async_client() is first
+                    await transport.aclose()
+                    return len(transport._async_clients)
+
+                # Клиенты закрытых циклов отброшены, aclose закрывает клиент текущего цикла
+                assert asyncio.run(client_ids()) == 0
+            transport.close()
+    finally:
+        server.shutdown()
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_cookie_header, test_backends, test_async_client_per_loop]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест загрузки изображений: продолжение после перезапуска, дедупликация по содержимому,
+ограничение соединений на хост, очистка недописанных файлов
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from wb_images import ImageDownloader, ImageStore, PARTIAL_FILE_MAX_AGE
+from wb_sales_parser import CliContext
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b''):
+        self.status_code = status_code
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+
+class FakeImageTransport:
+    """Изображения без сети: содержимое - последний сегмент пути, одновременные запросы считаются по хостам"""
+
+    def __init__(self, delay=0.0, failures=0, missing=()):
+        self.delay = delay
+        self.failures = failures
+        self.missing = set(missing)
+        self.requests = Counter()
+        self.active = Counter()
+        self.max_active = Counter()
+        self.lock = threading.Lock()
+
+    def get(self, url, headers=None, timeout=None):
+        host = url.split('/')[2]
+        with self.lock:
+            self.requests[url] += 1
+            self.active[host] += 1
+            self.max_active[host] = max(self.max_active[host], self.active[host])
+            fail = self.failures > 0
+            if fail:
+                self.failures -= 1
+        try:
+            time.sleep(self.delay)
+            if fail:
+                raise requests.exceptions.ConnectionError("connection reset")
+            if url in self.missing:
+                return FakeResponse(404)
+            return FakeResponse(200, url.rsplit('/', 1)[1].split('.')[0].encode('utf-8'))
+        finally:
+            with self.lock:
+                self.active[host] -= 1
+
+
+def test_store_dedup_and_resume():
+    """Одинаковое содержимое хранится один раз, после перезапуска загруженные URL не запрашиваются"""
+    print("🧪 Тест хранилища изображений...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        transport = FakeImageTransport()
+        downloader = ImageDownloader(ImageStore(tmp), transport=transport)
+        urls = [
+            "https://basket-01.wbbasket.ru/vol1/1/images/big/a.webp",
+            "https://basket-02.wbbasket.ru/vol2/2/images/big/a.webp",
+            "https://basket-01.wbbasket.ru/vol1/1/images/big/b.webp",
+        ]
+        paths = downloader.download(urls + urls[:1])
+        assert list(paths) == urls and paths[urls[0]] == paths[urls[1]] != paths[urls[2]]
+        with open(paths[urls[0]], 'rb') as f:
+            assert f.read() == b'a'
+        objects = [name for _, _, names in os.walk(os.path.join(tmp, 'objects')) for name in names]
+        assert len(objects) == 2 and all(transport.requests[url] == 1 for url in urls)
+
+        # Недописанная строка журнала после аварийного завершения пропускается
+        with open(os.path.join(tmp, ImageStore.INDEX_FILE), 'a', encoding='utf-8') as f:
+            f.write('{"url": "https://basket-01')
+
+        transport = FakeImageTransport()
+        store = ImageStore(tmp)
+        assert len(store) == 3
+        extra = "https://basket-01.wbbasket.ru/vol1/1/images/big/c.webp"
+        paths = ImageDownloader(store, transport=transport).download(urls + [extra])
+        assert all(paths.values()) and list(transport.requests) == [extra]
+
+        # Файл из журнала удалён - URL загружается заново
+        os.remove(paths[urls[2]])
+        assert ImageStore(tmp).get(urls[2]) is None
+
+    print("✅ Дедупликация и продолжение загрузки работают")
+    return True
+
+
+def test_per_host_limit_and_retries():
+    """Одновременных загрузок с одного хоста не больше per_host; ошибки повторяются, 404 - нет"""
+    with tempfile.TemporaryDirectory() as tmp:
+        transport = FakeImageTransport(delay=0.02)
+        downloader = ImageDownloader(ImageStore(tmp), transport=transport, max_workers=16, per_host=3)
+        urls = [f"https://basket-{host:02d}.wbbasket.ru/vol1/images/big/{host}-{i}.webp"
+                for host in (1, 2) for i in range(12)]
+        assert all(downloader.download(urls).values())
+        assert set(transport.max_active.values()) == {3}, transport.max_active
+
+        missing = "https://basket-01.wbbasket.ru/vol1/images/big/missing.webp"
+        transport = FakeImageTransport(failures=2, missing=[missing])
+        downloader = ImageDownloader(ImageStore(tmp), transport=transport, max_workers=1, retries=2)
+        flaky = "https://basket-03.wbbasket.ru/vol1/images/big/flaky.webp"
+        assert downloader.fetch(flaky) and transport.requests[flaky] == 3
+        assert downloader.fetch(missing) is None and transport.requests[missing] == 1
+
+        transport.failures = 10
+        broken = "https://basket-03.wbbasket.ru/vol1/images/big/broken.webp"
+        assert downloader.fetch(broken) is None and transport.requests[broken] == 3
+    return True
+
+
+def test_partial_files_cleanup():
+    """При открытии хранилища удаляются только давно брошенные .part файлы"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ImageStore(tmp)
+        part_dir = os.path.join(tmp, 'objects', 'ab')
+        os.makedirs(part_dir)
+        stale = os.path.join(part_dir, 'abc.webp.1.part')
+        fresh = os.path.join(part_dir, 'abc.webp.2.part')
+        for path in (stale, fresh):
+            with open(path, 'wb') as f:
+                f.write(b'partial')
+        old = time.time() - PARTIAL_FILE_MAX_AGE - 60
+        os.utime(stale, (old, old))
+
+        # Свежий файл может дописываться другим процессом с тем же хранилищем
+        ImageStore(tmp)
+        assert not os.path.exists(stale) and os.path.exists(fresh)
+    return True
+
+
+def test_download_products():
+    """Пути изображений товаров по порядку, не более max_images, без неудавшихся"""
+    with tempfile.TemporaryDirectory() as tmp:
+        missing = "https://basket-01.wbbasket.ru/vol1/images/big/2.webp"
+        downloader = ImageDownloader(ImageStore(tmp), transport=FakeImageTransport(missing=[missing]))
+        products = [
+            {'id': 1, 'image_urls': ["https://basket-01.wbbasket.ru/vol1/images/big/1.webp", missing,
+                                     "https://basket-01.wbbasket.ru/vol1/images/big/3.webp"]},
+            {'id': 2, 'image_urls': []},
+        ]
+        result = downloader.download_products(products, max_images=2)
+        assert list(result) == ['1', '2'] and len(result['1']) == 1 and result['2'] == []
+        assert result['1'][0].endswith('.webp')
+
+        # CLI загружает изображения через транспорт парсера, а не через новый пул соединений
+        transport = FakeImageTransport()
+        assert CliContext().get_image_downloader(tmp, 4, transport).transport is transport
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_store_dedup_and_resume, test_per_host_limit_and_retries, test_partial_files_cleanup,
+             test_download_products]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест очереди заданий: аренда, повторная выдача после падения воркера, попытки
+"""
+
+import json
+import os
+import tempfile
+
+from wb_deadline import ProductList
+from wb_jobs import JobQueue, JobWorker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeParser:
+    def get_products_detailed_info_with_pics(self, query, page=1, max_products=None, product_filter=None):
+        if query == "ошибка":
+            raise RuntimeError("Mayak недоступен")
+        if query == "пусто":
+            # Так выглядит и сбой поиска WB
+            return ProductList()
+        products = [{'id': '1', 'sales': 10, 'query': query, 'max_products': max_products}]
+        if query == "частично":
+            return ProductList(products, missing_ids=['2', '3'])
+        return ProductList(products)
+
+
+def test_job_queue_leases():
+    """Задание упавшего воркера выдаётся снова, устаревший воркер не может его завершить"""
+    print("🧪 Тест очереди заданий...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        clock = FakeClock()
+        queue = JobQueue(os.path.join(tmp, 'jobs.db'), lease_seconds=60, max_attempts=2, clock=clock)
+        first = queue.enqueue("куртка", max_products=5)
+        second = queue.enqueue("ошибка")
+
+        job = queue.lease("w1")
+        assert job.id == first and job.attempts == 1 and job.params == {'max_products': 5}
+        assert queue.lease("w2").id == second
+
+        # w1 "упал": после истечения аренды задание получает w3
+        clock.now += 61
+        job = queue.lease("w3")
+        assert job.id == first and job.attempts == 2
+        assert not queue.heartbeat(first, "w1") and not queue.complete(first, "w1", "x")
+        assert queue.heartbeat(first, "w3") and queue.complete(first, "w3", "x")
+
+        # Второе задание брошено и исчерпало попытки после повторной выдачи
+        job = queue.lease("w3")
+        assert job.id == second and job.attempts == 2
+        clock.now += 61
+        assert queue.lease("w3") is None
+        assert queue.stats() == {'pending': 0, 'running': 0, 'done': 1, 'failed': 1}
+
+        # Воркер сохраняет результат и переживает ошибки заданий
+        worker = JobWorker(queue, FakeParser(), os.path.join(tmp, 'results'), worker_id="w4")
+        ok = queue.enqueue("кроссовки", max_products=3)
+        bad = queue.enqueue("ошибка")
+        assert worker.run_once() and worker.run_once() and worker.run_once()
+        assert not worker.run_once()
+
+        record = queue.get(ok)
+        assert record['status'] == 'done'
+        with open(record['result_path'], encoding='utf-8') as f:
+            result = json.load(f)
+        assert result['count'] == 1 and result['products'][0]['max_products'] == 3
+        assert result['partial'] is False and result['missing_ids'] == []
+        record = queue.get(bad)
+        assert record['status'] == 'failed' and record['attempts'] == 2
+        assert record['error'] == "Mayak недоступен"
+        queue.close()
+
+    print("✅ Очередь заданий работает")
+    return True
+
+
+def test_incomplete_results_retried():
+    """Пустой и частичный результаты - неудачные попытки; частичный последней попытки сохраняется"""
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = JobQueue(os.path.join(tmp, 'jobs.db'), max_attempts=2, clock=FakeClock())
+        worker = JobWorker(queue, FakeParser(), os.path.join(tmp, 'results'), worker_id="w1")
+        empty = queue.enqueue("пусто")
+        partial = queue.enqueue("частично")
+
+        # Первая попытка возвращает задание в очередь, вторая исчерпывает попытки
+        assert worker.run_once()
+        assert queue.get(empty)['status'] == 'pending' and queue.get(empty)['attempts'] == 1
+        assert worker.run_once()
+        record = queue.get(empty)
+        assert record['status'] == 'failed' and record['attempts'] == 2 and record['error'] == "пустой результат поиска"
+
+        assert worker.run_once()
+        assert queue.get(partial)['status'] == 'pending' and 'частичный' in queue.get(partial)['error']
+        assert not os.listdir(os.path.join(tmp, 'results'))
+        assert worker.run_once() and not worker.run_once()
+
+        record = queue.get(partial)
+        assert record['status'] == 'done' and record['attempts'] == 2
+        with open(record['result_path'], encoding='utf-8') as f:
+            result = json.load(f)
+        assert result['partial'] is True and result['missing_ids'] == ['2', '3'] and result['count'] == 1
+        queue.close()
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_job_queue_leases, test_incomplete_results_retried]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
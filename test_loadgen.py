@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест нагрузочного воспроизведения: расписание из журнала, очередь, заглушки WB и Mayak
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+from mayak_api import MayakAPI
+from wb_loadgen import (BotTarget, LibraryTarget, StandInServer, build_report, load_schedule, main, percentile,
+                        replay)
+from wb_parser import WBParser
+
+
+def test_schedule_and_queueing():
+    """Интервалы берутся из ts, запросы ждут свободного обработчика"""
+    print("🧪 Тест воспроизведения журнала...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'queries.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'query': 'б', 'ts': 1010.0}, ensure_ascii=False) + '\n')
+            f.write(json.dumps({'query': 'а', 'ts': 1000.0}, ensure_ascii=False) + '\n')
+            f.write('не json\n')
+            f.write(json.dumps({'query': 'в'}, ensure_ascii=False) + '\n')
+        # Запись без ts идёт через DEFAULT_GAP после предыдущей строки журнала
+        assert load_schedule(path) == [(0.0, 'а'), (1.0, 'в'), (10.0, 'б')]
+        assert load_schedule(path, limit=1) == [(0.0, 'а')]
+
+    def slow_target(query):
+        time.sleep(0.1)
+        return 1
+
+    # Ускорение x100: запросы приходят через 0.1 и 0.11 сек, один обработчик - третий ждёт второй
+    samples = replay([(0.0, 'а'), (10.0, 'б'), (11.0, 'в')], slow_target, concurrency=1, speed=100)
+    assert [s.query for s in samples] == ['а', 'б', 'в']
+    assert samples[0].queue_delay < 0.02 and samples[2].queue_delay > 0.07, [s.queue_delay for s in samples]
+
+    report = build_report(samples, cache_hits=1, cache_misses=3)
+    assert report['requests'] == 3 and report['errors'] == 0 and report['cache_hit_rate'] == 0.25
+    assert report['queue_delay']['max'] > 0.07 and report['throughput'] > 0
+
+    assert percentile([3, 1, 2, 4], 50) == 2 and percentile([3, 1, 2, 4], 100) == 4 and percentile([], 95) == 0
+
+    print("✅ Воспроизведение журнала работает")
+    return True
+
+
+def test_stand_in_library():
+    """Библиотечный пайплайн против локальной заглушки WB и Mayak"""
+    saved = WBParser.BASE_URL, MayakAPI.BASE_URL
+    stand_in = StandInServer(wb_latency=0.01, mayak_latency=0.01).start()
+    try:
+        stand_in.point_clients()
+        target = LibraryTarget(['sid=a', 'sid=b'], max_products=40)
+        samples = replay([(0.0, 'куртка'), (0.0, 'шапка'), (1.0, 'куртка')], target, concurrency=2, speed=10)
+        hits, misses = target.cache_counters()
+    finally:
+        stand_in.stop()
+        WBParser.BASE_URL, MayakAPI.BASE_URL = saved
+
+    assert all(s.error is None and s.count == 40 for s in samples), [(s.count, s.error) for s in samples]
+    # Повторный запрос страницы выдачи берётся из кэша страниц
+    assert hits == 1 and misses == 2, (hits, misses)
+    # 3 раза поиск WB (один из кэша - 2 запроса) и по 2 чанка Mayak на запрос
+    assert stand_in.requests == 2 + 3 * 2, stand_in.requests
+    return True
+
+
+def test_stand_in_bot():
+    """Пайплайн бота: кэш результатов и бюджет времени общие с tg_bot.process_query"""
+    import tg_bot
+
+    saved = WBParser.BASE_URL, MayakAPI.BASE_URL
+    stand_in = StandInServer(wb_latency=0.01, mayak_latency=0.01).start()
+    tg_bot.result_cache.clear()
+    try:
+        stand_in.point_clients()
+        target = BotTarget(['sid=a'])
+        hits_before, misses_before = target.cache_counters()
+        samples = replay([(0.0, 'Куртка'), (1.0, 'куртка '), (2.0, 'шапка')], target, concurrency=1, speed=10)
+        hits, misses = target.cache_counters()
+        hits, misses = hits - hits_before, misses - misses_before
+    finally:
+        stand_in.stop()
+        WBParser.BASE_URL, MayakAPI.BASE_URL = saved
+        tg_bot.result_cache.clear()
+
+    assert all(s.error is None and s.count == 20 for s in samples), [(s.count, s.error) for s in samples]
+    # Повтор запроса (с точностью до нормализации) - из кэша результатов
+    assert (hits, misses) == (1, 2), (hits, misses)
+    return True
+
+
+def test_speed_validation():
+    """Нулевое или отрицательное ускорение - ошибка, а не деление на ноль"""
+    for speed in (0, -1):
+        try:
+            replay([(0.0, 'а')], lambda query: 1, speed=speed)
+            assert False, "ожидалась ошибка ускорения"
+        except ValueError:
+            pass
+
+    saved_argv = sys.argv
+    sys.argv = ['wb_loadgen.py', '--log', 'нет.jsonl', '--speed', '0']
+    try:
+        main()
+        assert False, "ожидалась ошибка аргументов"
+    except SystemExit as e:
+        assert e.code == 2
+    finally:
+        sys.argv = saved_argv
+    return True
+
+
+if __name__ == "__main__":
+    success = (test_schedule_and_queueing() and test_stand_in_library() and test_stand_in_bot()
+               and test_speed_validation())
+    exit(0 if success else 1)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест пула аккаунтов Mayak: раздача чанков, вывод аккаунта с истёкшими cookies, 429
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import requests
+
+from mayak_api import load_cookie_sets
+from mayak_pool import MayakSessionPool
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data or {}
+        self.headers = headers or {}
+        self.text = str(self._data)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+    def json(self):
+        return self._data
+
+
+class FakeTransport:
+    """Ответы Mayak по cookie sid: expired - 401, throttled - один раз 429"""
+
+    calls = []
+    lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None, cookies=None, timeout=None):
+        sid = cookies.get('sid')
+        codes = params['codes'].split(',')
+        with self.lock:
+            self.calls.append((sid, len(codes)))
+            throttled_before = sum(1 for call_sid, _ in self.calls if call_sid == 'throttled') > 1
+        time.sleep(0.02)
+        if sid == 'expired':
+            return FakeResponse(401)
+        if sid == 'throttled' and not throttled_before:
+            return FakeResponse(429, headers={'Retry-After': '0'})
+        return FakeResponse(200, {code: {'sales': int(code), 'account': sid} for code in codes})
+
+
+def test_pool_dispatch():
+    """Чанки распределяются по аккаунтам, аккаунт с 401 выводится из ротации"""
+    print("🧪 Тест пула аккаунтов Mayak...")
+
+    FakeTransport.calls = []
+    pool = MayakSessionPool(['sid=a', 'sid=expired', 'sid=throttled'], transport_factory=FakeTransport)
+    progress = []
+    codes = list(range(1, 141))
+    products = pool.get_all_products_info(codes, on_chunk=lambda so_far, done, total: progress.append((done, total)))
+
+    assert [p['id'] for p in products] == [str(code) for code in codes]
+    assert progress[-1] == (7, 7) and len(progress) == 7
+
+    stats = {account['name']: account for account in pool.stats()}
+    assert not stats['#2']['active'] and stats['#2']['disabled_reason'] == 'HTTP 401'
+    assert stats['#2']['requests'] == 1
+    assert stats['#3']['throttled'] == 1
+    served = {p['account'] for p in products}
+    assert served == {'a', 'throttled'}, served
+
+    # Без активных аккаунтов чанк не выполняется
+    pool = MayakSessionPool(['sid=expired'], transport_factory=FakeTransport)
+    assert pool.get_all_products_info([1, 2]) == []
+    assert pool.get_products_info([1]) is None
+
+    print("✅ Пул аккаунтов Mayak работает")
+    return True
+
+
+def test_load_cookie_sets():
+    """Наборы cookies из файла (по строке) и из каталога (по файлу)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'cookies.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("# аккаунт 1\nsid=a; token=1\n\nsid=b\nsid=a; token=1\n")
+        assert load_cookie_sets(path) == ['sid=a; token=1', 'sid=b']
+
+        directory = os.path.join(tmp, 'accounts')
+        os.mkdir(directory)
+        for name, content in [('1.txt', 'sid=a;\ntoken=1\n'), ('2.txt', 'sid=b\n'), ('3.txt', '\n')]:
+            with open(os.path.join(directory, name), 'w', encoding='utf-8') as f:
+                f.write(content)
+        assert load_cookie_sets(directory) == ['sid=a; token=1', 'sid=b']
+
+    return True
+
+
+if __name__ == "__main__":
+    success = test_pool_dispatch() and test_load_cookie_sets()
+    exit(0 if success else 1)
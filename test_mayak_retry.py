@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест повторов чанков Mayak: временные ошибки, поиск «плохих» кодов делением, отчёт о необогащённых
+"""
+
+import threading
+import time
+
+import requests
+
+from mayak_api import MayakAPI
+from mayak_pool import MayakSessionPool
+from wb_deadline import Deadline
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data or {}
+        self.text = str(self._data)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error", response=self)
+
+    def json(self):
+        return self._data
+
+
+class FlakyTransport:
+    """Mayak: чанк с кодом из bad_codes - bad_status, первые flaky_failures запросов - 503, status - всегда"""
+
+    def __init__(self, bad_codes=(), flaky_failures=0, status=None, bad_status=500):
+        self.bad_codes = {str(code) for code in bad_codes}
+        self.bad_status = bad_status
+        self.flaky_failures = flaky_failures
+        self.status = status
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None, cookies=None, timeout=None):
+        codes = params['codes'].split(',')
+        with self.lock:
+            self.requests.append(codes)
+            flaky = len(self.requests) <= self.flaky_failures
+        if self.status:
+            return FakeResponse(self.status)
+        if flaky:
+            return FakeResponse(503)
+        if self.bad_codes.intersection(codes):
+            return FakeResponse(self.bad_status)
+        return FakeResponse(200, {code: {'sales': int(code)} for code in codes})
+
+
+def make_api(transport) -> MayakAPI:
+    api = MayakAPI(transport=transport)
+    api.RETRY_BACKOFF = 0
+    return api
+
+
+def test_bisect_bad_codes():
+    """Чанк с «плохими» кодами делится пополам: обогащены все, кроме них"""
+    print("🧪 Тест повторов чанков Mayak...")
+
+    transport = FlakyTransport(bad_codes=[13, 47])
+    codes = list(range(1, 101))
+    products = make_api(transport).get_all_products_info(codes)
+
+    assert sorted(int(p['id']) for p in products) == [code for code in codes if code not in (13, 47)]
+    assert products.partial and sorted(products.missing_ids) == ['13', '47']
+    # 5 чанков + по 2 повтора двух плохих чанков + деление 20 -> 10 -> 5 -> 3 -> 1 (по 2 запроса на уровень)
+    assert len(transport.requests) == 5 + 2 * (2 + 2 * 4), len(transport.requests)
+    assert ['13'] in transport.requests and ['47'] in transport.requests
+
+    # Ответ 400 указывает на коды: делится сразу, даже если других чанков нет
+    transport = FlakyTransport(bad_codes=[7], bad_status=400)
+    products = make_api(transport).get_all_products_info(list(range(1, 21)))
+    assert len(products) == 19 and products.missing_ids == ['7']
+    assert transport.requests[1] == [str(code) for code in range(1, 11)]
+
+    # Падают обе половины - деление прекращается
+    transport = FlakyTransport(bad_codes=[3, 15], bad_status=400)
+    products = make_api(transport).get_all_products_info(list(range(1, 21)))
+    assert len(products) == 0 and len(products.missing_ids) == 20 and len(transport.requests) == 3
+
+    print("✅ Необогащённые коды найдены, остальные товары получены")
+    return True
+
+
+def test_transient_failure_retried():
+    """Временная ошибка: повторяется только упавший чанк, результат полный"""
+    transport = FlakyTransport(flaky_failures=1)
+    api = make_api(transport)
+    api.RETRY_BACKOFF = 0.05
+    codes = list(range(1, 61))
+
+    started = time.monotonic()
+    products = api.get_all_products_info(codes)
+    assert time.monotonic() - started >= 0.05
+
+    assert len(products) == 60 and not products.partial and products.missing_ids == []
+    assert len(transport.requests) == 4 and transport.requests[-1] == [str(code) for code in range(1, 21)]
+    return True
+
+
+def test_retry_limits():
+    """Сбой Mayak не умножает запросы; отклонённые cookies не повторяются; повторы укладываются в deadline"""
+    # Mayak недоступен: только повторы целых чанков, без деления
+    transport = FlakyTransport(status=503)
+    products = make_api(transport).get_all_products_info(list(range(1, 101)))
+    assert len(products) == 0 and len(products.missing_ids) == 100
+    assert len(transport.requests) == 5 + 5 * MayakAPI.CHUNK_RETRIES, len(transport.requests)
+
+    # Общий лимит повторных запросов за вызов
+    api = make_api(FlakyTransport(status=503))
+    api.RETRY_REQUEST_LIMIT = 7
+    products = api.get_all_products_info(list(range(1, 101)))
+    assert len(api.transport.requests) == 5 + 7 and len(products.missing_ids) == 100
+
+    transport = FlakyTransport(status=401)
+    api = make_api(transport)
+    products = api.get_all_products_info(list(range(1, 41)))
+    assert len(products) == 0 and len(products.missing_ids) == 40
+    assert len(transport.requests) == 2 and api.auth_failed
+
+    # Флаг отказа сбрасывается первым успешным запросом
+    transport.status = None
+    assert api.get_products_info([1]) and not api.auth_failed
+
+    transport = FlakyTransport(status=503)
+    api = MayakAPI(transport=transport)
+    api.RETRY_BACKOFF = 5.0
+    started = time.monotonic()
+    products = api.get_all_products_info(list(range(1, 41)), deadline=Deadline(0.3))
+    assert time.monotonic() - started < 0.5
+    assert len(products.missing_ids) == 40
+    return True
+
+
+def test_pool_retry():
+    """Пул повторяет и делит упавшие чанки на своих аккаунтах"""
+    transport = FlakyTransport(bad_codes=[5])
+    pool = MayakSessionPool(['sid=a', 'sid=b'], transport_factory=lambda: transport)
+    pool.RETRY_BACKOFF = 0
+    codes = list(range(1, 41))
+
+    products = pool.get_all_products_info(codes)
+    assert sorted(int(p['id']) for p in products) == [code for code in codes if code != 5]
+    assert products.missing_ids == ['5']
+    assert all(account['active'] for account in pool.stats())
+    return True
+
+
+if __name__ == "__main__":
+    success = (test_bisect_bad_codes() and test_transient_failure_retried() and test_retry_limits()
+               and test_pool_retry())
+    exit(0 if success else 1)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест метрик: гистограммы, счётчики с метками, формат Prometheus, эндпоинт /metrics
+"""
+
+import requests
+
+from wb_metrics import Registry, STAGE_SECONDS, UPSTREAM_ERRORS, start_metrics_server
+from wb_parser import WBParser
+
+
+class FailingResponse:
+    status_code = 503
+    text = ''
+
+    def raise_for_status(self):
+        raise requests.exceptions.HTTPError("503 Server Error", response=self)
+
+
+class FailingTransport:
+    def get(self, url, timeout=None, **kwargs):
+        return FailingResponse()
+
+
+def test_registry_render():
+    """Гистограмма накапливает корзины, метки экранируются"""
+    print("🧪 Тест метрик...")
+
+    registry = Registry()
+    latency = registry.histogram('test_seconds', 'Длительность', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        latency.labels('wb "fetch"').observe(value)
+    errors = registry.counter('test_errors_total', 'Ошибки', ('kind',))
+    errors.labels('timeout').inc()
+    errors.labels('timeout').inc(2)
+    depth = registry.gauge('test_depth', 'Очередь')
+    depth.set_function(lambda: 7)
+
+    text = registry.render()
+    assert '# TYPE test_seconds histogram' in text
+    assert 'test_seconds_bucket{stage="wb \\"fetch\\"",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{stage="wb \\"fetch\\"",le="1"} 3' in text
+    assert 'test_seconds_bucket{stage="wb \\"fetch\\"",le="+Inf"} 4' in text
+    assert 'test_seconds_sum{stage="wb \\"fetch\\""} 4.25' in text
+    assert 'test_seconds_count{stage="wb \\"fetch\\""} 4' in text
+    assert 'test_errors_total{kind="timeout"} 3' in text
+    assert 'test_depth 7' in text
+
+    try:
+        registry.counter('test_errors_total', 'Повтор')
+        assert False, "повторная регистрация должна быть ошибкой"
+    except ValueError:
+        pass
+
+    print("✅ Метрики формируются")
+    return True
+
+
+def test_pipeline_instrumentation():
+    """Запросы к WB учитываются в гистограмме этапа и счётчике ошибок, эндпоинт отдаёт текст"""
+    parser = WBParser(transport=FailingTransport())
+    parser.search_cache = None
+
+    errors = UPSTREAM_ERRORS.labels('wb', 'http_503')
+    fetches = STAGE_SECONDS.labels('wb_fetch')
+    errors_before = errors.get()
+    fetches_before = fetches.snapshot()[0]
+
+    assert parser.fetch_data("http://wb.invalid/search") is None
+    assert errors.get() == errors_before + 1
+    assert sum(fetches.snapshot()[0]) == sum(fetches_before) + 1
+
+    server = start_metrics_server(0)
+    try:
+        port = server.server_address[1]
+        response = requests.get(f"http://127.0.0.1:{port}/metrics", timeout=5)
+        assert response.status_code == 200 and response.headers['Content-Type'].startswith('text/plain')
+        assert 'wb_upstream_errors_total{upstream="wb",kind="http_503"}' in response.text
+        assert 'wb_stage_seconds_bucket{stage="wb_fetch",le="+Inf"}' in response.text
+        assert requests.get(f"http://127.0.0.1:{port}/other", timeout=5).status_code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+    return True
+
+
+if __name__ == "__main__":
+    success = test_registry_render() and test_pipeline_instrumentation()
+    exit(0 if success else 1)
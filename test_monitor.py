@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест монитора watchlist: загрузка списка, планировщик (джиттер, порядок),
+лимит параллельности и сохранение результатов
+"""
+
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from wb_deadline import ProductList
+from wb_monitor import QueryScheduler, WatchItem, WatchlistMonitor, load_watchlist, query_slug
+
+
+def test_load_watchlist():
+    """Значения по умолчанию, строки вместо объектов, пропуск пустых и повторных запросов"""
+    print("🧪 Тест загрузки watchlist...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'watchlist.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "defaults": {"interval": 600, "max_products": 5},
+                "queries": [
+                    {"query": "куртка женская", "interval": 60, "page": 2},
+                    {"query": "кроссовки", "filter": "price >= 2000"},
+                    "платье летнее",
+                    {"query": "  "},
+                    "куртка женская",
+                ],
+            }, f, ensure_ascii=False)
+        items = load_watchlist(path)
+
+        assert [item.query for item in items] == ["куртка женская", "кроссовки", "платье летнее"]
+        assert (items[0].interval, items[0].max_products, items[0].page) == (60.0, 5, 2)
+        assert items[1].interval == 600 and items[1].product_filter is not None
+        assert items[2].product_filter is None
+
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(["a", {"query": "b", "interval": 0}], f)
+        try:
+            load_watchlist(path)
+            assert False, "ожидалась ошибка интервала"
+        except ValueError:
+            pass
+
+    assert query_slug("Куртка женская / черная!") == "куртка_женская_черная"
+    assert query_slug("???") == "query"
+
+    print("✅ Watchlist загружается")
+    return True
+
+
+def test_scheduler():
+    """Первые запуски распределяются по spread, следующие - через интервал с джиттером"""
+    items = [WatchItem(f"q{i}", interval=100) for i in range(4)]
+    scheduler = QueryScheduler(items, jitter=0.2, spread=40, now=1000, rng=random.Random(7))
+
+    assert len(scheduler) == 4 and scheduler.next_run_time() == 1000
+    assert scheduler.pop_due(1000) is items[0] and scheduler.pop_due(1000) is None
+    # Запросы извлекаются по времени запуска
+    assert [scheduler.pop_due(1040).query for _ in range(3)] == ["q1", "q2", "q3"]
+    assert scheduler.pop_due(1040) is None and scheduler.next_run_time() is None
+
+    delays = [scheduler.reschedule(items[0], 0) for _ in range(200)]
+    assert all(80 <= delay <= 120 for delay in delays)
+    # Джиттер разводит запуски запросов с одинаковым интервалом
+    assert len(set(delays)) == 200 and min(delays) < 90 and max(delays) > 110
+
+    scheduler = QueryScheduler([], jitter=0, now=0)
+    assert scheduler.reschedule(items[1], 5) == 105
+    # Одинаковое время запуска - в порядке постановки
+    scheduler.schedule(items[2], 105)
+    scheduler.schedule(items[3], 50)
+    assert [scheduler.pop_due(200) for _ in range(3)] == [items[3], items[1], items[2]]
+    return True
+
+
+class FakeParser:
+    """Парсер без сети: запоминает одновременные запросы, запрос 'сбой' падает"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = Counter()
+        self.max_total = 0
+        self.max_per_query = 0
+        self.calls = Counter()
+
+    def get_products_detailed_info_with_pics(self, query, page=1, max_products=None, product_filter=None):
+        with self.lock:
+            self.calls[query] += 1
+            self.active[query] += 1
+            self.max_total = max(self.max_total, sum(self.active.values()))
+            self.max_per_query = max(self.max_per_query, self.active[query])
+        try:
+            time.sleep(self.delay)
+            if query == 'сбой':
+                raise RuntimeError("Mayak недоступен")
+            products = [{'id': str(i), 'sales': i, 'query': query} for i in range(max_products or 3)]
+            if query == 'частично':
+                return ProductList(products, missing_ids=[99])
+            return ProductList(products)
+        finally:
+            with self.lock:
+                self.active[query] -= 1
+
+
+class FakeHistory:
+    def __init__(self):
+        self.snapshots = []
+
+    def append_snapshot(self, products):
+        self.snapshots.append(products)
+
+
+def run_monitor(monitor: WatchlistMonitor, seconds: float):
+    thread = threading.Thread(target=monitor.run)
+    thread.start()
+    time.sleep(seconds)
+    monitor.stop()
+    thread.join(10)
+    assert not thread.is_alive()
+
+
+def test_monitor_concurrency_budget():
+    """Одновременно не больше concurrency запросов, один запрос не выполняется параллельно сам с собой"""
+    print("\n🧪 Тест монитора...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        parser = FakeParser(delay=0.05)
+        items = [WatchItem(f"запрос {i}", interval=0.01, max_products=2) for i in range(5)]
+        items.append(WatchItem('сбой', interval=0.01))
+        monitor = WatchlistMonitor(parser, items, tmp, concurrency=2, jitter=0.5, spread=0)
+        run_monitor(monitor, 0.8)
+
+        assert parser.max_total == 2 and parser.max_per_query == 1
+        # Ошибка одного запроса не останавливает монитор и не исключает запрос из расписания
+        assert all(parser.calls[item.query] >= 2 for item in items), parser.calls
+        assert len(monitor.scheduler) == len(items)
+
+    print("✅ Лимит параллельности соблюдается")
+    return True
+
+
+def test_monitor_persistence():
+    """Каждый запуск дописывается строкой JSON в <slug>.jsonl и в историю метрик"""
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = os.path.join(tmp, 'results')
+        history = FakeHistory()
+        items = [WatchItem("Куртка женская", interval=0.05, max_products=3), WatchItem('сбой', interval=0.05),
+                 WatchItem('частично', interval=0.05, max_products=2)]
+        monitor = WatchlistMonitor(FakeParser(delay=0.01), items, output_dir, concurrency=1, spread=0,
+                                   history=history)
+        run_monitor(monitor, 0.3)
+
+        assert sorted(os.listdir(output_dir)) == ['куртка_женская.jsonl', 'частично.jsonl']
+        with open(os.path.join(output_dir, 'куртка_женская.jsonl'), 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        # Частичные результаты сохраняются с пометкой, но не попадают в историю метрик
+        with open(os.path.join(output_dir, 'частично.jsonl'), 'r', encoding='utf-8') as f:
+            partial_records = [json.loads(line) for line in f]
+        assert partial_records and all(r['partial'] and r['missing_ids'] == ['99'] for r in partial_records)
+        assert len(records) >= 2 and len(history.snapshots) == len(records)
+        assert all(len(snapshot) == 3 for snapshot in history.snapshots)
+        record = records[0]
+        assert record['query'] == "Куртка женская" and record['count'] == 3
+        assert record['partial'] is False and record['missing_ids'] == []
+        assert [p['id'] for p in record['products']] == ['0', '1', '2']
+        assert record['duration'] >= 0.01 and 'T' in record['timestamp']
+
+        try:
+            WatchlistMonitor(FakeParser(), items, output_dir, concurrency=0)
+            assert False, "ожидалась ошибка concurrency"
+        except ValueError:
+            pass
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_load_watchlist, test_scheduler, test_monitor_concurrency_budget, test_monitor_persistence]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
@@ -4,7 +4,12 @@
 Тест новых диапазонов серверов WildBerries
 """
 
+import os
+import tempfile
+
 from wb_parser import WBParser
+from wb_basket import BasketResolver
+from wb_deadline import Deadline
 
 
 def test_server_ranges():
@@ -120,6 +125,154 @@ def test_server_ranges():
     return all_passed
 
 
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeBasketTransport:
+    """Транспорт без сети: товары vol >= 6600 лежат на basket-33, остальные на basket-32"""
+
+    def __init__(self):
+        self.probed_urls = []
+        self.timeouts = []
+
+    def head(self, url, timeout=None, **kwargs):
+        self.probed_urls.append(url)
+        self.timeouts.append(timeout)
+        vol = int(url.split('/vol')[1].split('/')[0])
+        host = "33" if vol >= 6600 else "32"
+        return FakeResponse(200 if f"basket-{host}." in url else 404)
+
+
+def test_basket_resolver():
+    """Тест определения basket для неизвестных vol и кэша на диске"""
+    print("\n🧪 Тест резолвера basket для неизвестных диапазонов...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path = os.path.join(tmp, 'basket_cache.json')
+        transport = FakeBasketTransport()
+        resolver = BasketResolver(cache_path=cache_path, transport=transport)
+        parser = WBParser(basket_resolver=resolver)
+
+        # Известные диапазоны не требуют запросов
+        assert parser.generate_image_urls(164105063, 1)[0].startswith("https://basket-11.")
+        assert not transport.probed_urls
+
+        assert resolver.resolve(650012345) == "32"
+        assert resolver.resolve(670012345) == "33"
+        probes = len(transport.probed_urls)
+        assert probes > 0
+
+        # Повторный запрос к тому же vol берётся из кэша
+        assert parser.generate_image_urls(670099999, 1)[0].startswith("https://basket-33.wbbasket.ru/vol6700/")
+        assert len(transport.probed_urls) == probes
+
+        # Кэш переживает перезапуск, vol между двумя точками одного basket известен без запросов
+        reopened = BasketResolver(cache_path=cache_path, transport=FakeBasketTransport())
+        assert reopened.lookup(6700) == "33"
+        reopened.learn(6900, "33")
+        assert reopened.lookup(6800) == "33"
+        assert reopened.lookup(6550) is None
+
+    print("✅ Резолвер basket работает")
+    return True
+
+
+def test_basket_resolver_deadline():
+    """После истечения deadline basket предсказывается без HEAD запросов, до - таймауты не больше остатка"""
+    print("\n🧪 Тест резолвера basket с бюджетом времени...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        transport = FakeBasketTransport()
+        resolver = BasketResolver(cache_path=os.path.join(tmp, 'basket_cache.json'), transport=transport)
+        parser = WBParser(basket_resolver=resolver)
+        expired = Deadline(-1)
+
+        assert resolver.resolve(670012345, deadline=expired) == "32"
+        resolver.resolve_many([680012345, 690012345], deadline=expired)
+        merged = parser.merge_with_wb_data([{'id': '670012345'}], {670012345: {'pics': 2, 'wb_data': {}}},
+                                           deadline=expired)
+        assert merged[0]['image_urls'][0].startswith("https://basket-32.wbbasket.ru/vol6700/")
+        assert not transport.probed_urls
+
+        resolver.resolve_many([670012345], deadline=Deadline(2))
+        assert transport.probed_urls and all(0 < timeout <= 2 for timeout in transport.timeouts)
+        assert resolver.lookup(6700) == "33"
+
+    print("✅ Пробы basket ограничены бюджетом времени")
+    return True
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class MissingBasketTransport(FakeBasketTransport):
+    """Товаров из missing_vols нет ни на одном basket"""
+
+    def __init__(self, missing_vols=()):
+        super().__init__()
+        self.missing_vols = set(missing_vols)
+
+    def head(self, url, timeout=None, **kwargs):
+        response = super().head(url, timeout=timeout, **kwargs)
+        if int(url.split('/vol')[1].split('/')[0]) in self.missing_vols:
+            return FakeResponse(404)
+        return response
+
+
+def test_basket_negative_cache():
+    """Vol, для которого basket не найден, не проверяется повторно до истечения failure_ttl"""
+    print("\n🧪 Тест отрицательного кэша basket...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        transport = MissingBasketTransport(missing_vols=[6700, 6900])
+        clock = FakeClock()
+        resolver = BasketResolver(cache_path=os.path.join(tmp, 'basket_cache.json'), transport=transport,
+                                  failure_ttl=60, clock=clock)
+
+        assert resolver.resolve(670012345) == "32"
+        probes = len(transport.probed_urls)
+        assert probes > 0 and resolver.recently_failed(6700)
+
+        # Повторы в пределах failure_ttl - без запросов
+        assert resolver.resolve(670099999) == "32"
+        resolver.resolve_many([670012345, 670054321])
+        assert len(transport.probed_urls) == probes
+
+        # Другие vol проверяются как обычно
+        assert resolver.resolve(680012345) == "33" and len(transport.probed_urls) > probes
+
+        # После failure_ttl vol проверяется снова
+        transport.missing_vols.discard(6700)
+        probes = len(transport.probed_urls)
+        assert resolver.resolve(670012345) == "32" and len(transport.probed_urls) == probes
+        clock.now += 61
+        assert not resolver.recently_failed(6700)
+        assert resolver.resolve(670012345) == "33" and resolver.lookup(6700) == "33"
+
+        # Неудача из-за истёкшего бюджета времени не кэшируется
+        class ExpiringDeadline(Deadline):
+            checks = 0
+
+            @property
+            def expired(self):
+                self.checks += 1
+                return self.checks > 2
+
+        probes = len(transport.probed_urls)
+        assert resolver.resolve(690012345, deadline=ExpiringDeadline(10)) == "33"
+        assert len(transport.probed_urls) > probes and not resolver.recently_failed(6900)
+
+    print("✅ Недавно не найденные vol не проверяются повторно")
+    return True
+
+
 def demo_new_servers():
     """Демонстрация новых серверов"""
     print("\n🎯 ДЕМО: Новые серверы WildBerries")
@@ -154,6 +307,9 @@ def main():
     print("=" * 60)
     
     success = test_server_ranges()
+    success = test_basket_resolver() and success
+    success = test_basket_resolver_deadline() and success
+    success = test_basket_negative_cache() and success
     demo_new_servers()
     
     print("\n" + "=" * 60)
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест кэша страниц выдачи WB и предзагрузки следующей страницы
+"""
+
+import threading
+import time
+import urllib.parse
+
+from mayak_api import MayakAPI
+from wb_parser import WBParser
+from wb_search_cache import SearchPageCache
+
+TOTAL = 250
+PAGE_SIZE = 100
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self._data = data
+        self.text = str(data)
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+class FakeWBTransport:
+    """Выдача WB на TOTAL товаров по PAGE_SIZE на страницу, каждый ответ через delay сек"""
+
+    def __init__(self, delay: float = 0.1):
+        self.delay = delay
+        self.pages = []
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None, **kwargs):
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+        page = int(params['page'][0])
+        with self._lock:
+            self.pages.append(page)
+        time.sleep(self.delay)
+        start = (page - 1) * PAGE_SIZE
+        ids = range(start + 1, min(start + PAGE_SIZE, TOTAL) + 1)
+        return FakeResponse({"total": TOTAL, "products": [{"id": i, "pics": 1, "name": f"Товар {i}"} for i in ids]})
+
+
+class SlowMayakAPI(MayakAPI):
+    """Обогащение без сети, каждый чанк - delay сек"""
+
+    def __init__(self, delay: float = 0.05):
+        super().__init__()
+        self.delay = delay
+
+    def get_products_info(self, codes, deadline=None):
+        time.sleep(self.delay)
+        return [{'id': str(code), 'sales': int(code)} for code in codes]
+
+
+def make_parser(prefetch: bool) -> WBParser:
+    parser = WBParser(transport=FakeWBTransport(), prefetch=prefetch)
+    parser.mayak_api = SlowMayakAPI()
+    return parser
+
+
+def test_next_page_prefetch():
+    """Страница 2 загружается, пока обогащается страница 1; её запрос не ждёт WB"""
+    print("🧪 Тест предзагрузки следующей страницы...")
+
+    parser = make_parser(prefetch=True)
+    parser.get_products_detailed_info_with_pics("куртка", page=1, max_products=100)
+
+    started = time.monotonic()
+    products = parser.get_products_detailed_info_with_pics("куртка", page=2, max_products=100)
+    assert len(products) == 100
+
+    # Страница 3 последняя (total=250): страница 4 не предзагружается
+    parser.get_products_detailed_info_with_pics("куртка", page=3, max_products=100)
+    time.sleep(0.15)
+    assert sorted(parser.transport.pages) == [1, 2, 3], parser.transport.pages
+
+    stats = parser.search_cache.stats()
+    assert stats['prefetches'] == 2 and stats['prefetch_hits'] == 2, stats
+    assert time.monotonic() - started < 1.0
+
+    # Без prefetch одиночный запрос страницы ничего не загружает заранее
+    parser = make_parser(prefetch=False)
+    parser.get_products_detailed_info_with_pics("куртка", page=1, max_products=10)
+    time.sleep(0.15)
+    assert parser.transport.pages == [1]
+
+    print("✅ Следующая страница берётся из кэша")
+    return True
+
+
+def test_crawl_prefetch():
+    """Постраничный обход: каждая страница загружается один раз, следующая - заранее"""
+    parser = make_parser(prefetch=False)
+    results = parser.get_products_for_queries(["куртка"], pages=3, max_products=TOTAL)
+    assert len(results["куртка"]) == TOTAL
+    assert sorted(parser.transport.pages) == [1, 2, 3]
+    assert parser.search_cache.stats()['prefetch_hits'] == 2
+    return True
+
+
+def test_cache_limits():
+    """Идущая загрузка не дублируется, лишние фоновые загрузки пропускаются"""
+    calls = []
+
+    def slow_fetch(url, deadline=None):
+        calls.append(url)
+        time.sleep(0.1)
+        return {"url": url}
+
+    cache = SearchPageCache(slow_fetch, max_prefetch=2)
+    assert cache.prefetch("a") and cache.prefetch("b")
+    assert not cache.prefetch("c") and not cache.prefetch("a")
+    assert cache.get("a") == {"url": "a"} and cache.get("a") == {"url": "a"}
+    time.sleep(0.15)
+    assert sorted(calls) == ["a", "b"]
+
+    stats = cache.stats()
+    assert stats['prefetch_skipped'] == 1 and stats['prefetch_hits'] == 1 and stats['prefetching'] == 0
+
+    # Ошибки не кэшируются
+    cache = SearchPageCache(lambda url, deadline=None: None)
+    assert cache.get("x") is None and cache.stats()['pages'] == 0
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_next_page_prefetch, test_crawl_prefetch, test_cache_limits]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
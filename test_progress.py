@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест промежуточных результатов: on_progress после каждого чанка Mayak
+и сообщение бота с предварительным топом
+"""
+
+import asyncio
+from collections import Counter
+
+from mayak_api import MayakAPI
+from test_deadline import FakeWBParser, SlowMayakTransport
+import tg_bot
+from tg_bot import ProgressReporter
+
+
+class FakeResolver:
+    """Резолвер basket без сети: запоминает, сколько раз уточнялся каждый товар"""
+
+    def __init__(self):
+        self.resolved = Counter()
+
+    def resolve_many(self, product_ids, max_workers=8, deadline=None):
+        self.resolved.update(product_ids)
+
+    def resolve(self, product_id, deadline=None):
+        return '01'
+
+
+class CountingWBParser(FakeWBParser):
+    def __init__(self):
+        super().__init__(basket_resolver=FakeResolver())
+        self.mayak_api = MayakAPI(transport=SlowMayakTransport(delay=0))
+        self.merges = 0
+
+    def merge_with_wb_data(self, mayak_products, wb_products, deadline=None):
+        self.merges += 1
+        return super().merge_with_wb_data(mayak_products, wb_products, deadline=deadline)
+
+
+def test_on_progress():
+    """После каждого чанка - все товары на текущий момент; каждый чанк объединяется с WB один раз"""
+    print("🧪 Тест промежуточных результатов...")
+
+    parser = CountingWBParser()
+    progress = []
+    products = parser.get_products_detailed_info_with_pics(
+        "куртка", max_products=60, on_progress=lambda so_far, done, total: progress.append((so_far, done, total)))
+
+    assert [(len(so_far), done, total) for so_far, done, total in progress] == [(20, 1, 3), (40, 2, 3), (60, 3, 3)]
+    for so_far, _, _ in progress:
+        sales = [p['sales'] for p in so_far]
+        assert sales == sorted(sales, reverse=True)
+        assert all(p['name'] and p['image_urls'] for p in so_far)
+    # Промежуточные товары - копии: итоговое объединение их не меняет
+    assert not {id(p) for p in progress[-1][0]} & {id(p) for p in products}
+    assert [p['id'] for p in progress[-1][0]] == [p['id'] for p in products]
+
+    # Этап merge замеряется один раз за запрос, basket уточняется дважды: по чанку и в итоговом объединении
+    assert parser.merges == 1
+    assert set(parser.basket_resolver.resolved.values()) == {2} and len(parser.basket_resolver.resolved) == 60
+
+    print("✅ on_progress получает накопленные товары")
+    return True
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.sent = self.text = text
+        self.edits = []
+
+    async def edit_text(self, text, disable_web_page_preview=None):
+        self.edits.append(text)
+        self.text = text
+
+
+class FakeIncoming:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, disable_web_page_preview=None):
+        message = FakeMessage(text)
+        self.replies.append(message)
+        return message
+
+
+class FakeUpdate:
+    def __init__(self):
+        self.message = FakeIncoming()
+
+
+def test_progress_reporter():
+    """Одно сообщение: первый чанк сразу, следующие не чаще PROGRESS_EDIT_INTERVAL, итог - правкой"""
+    products = [{'id': 1, 'name': 'Куртка', 'sales': 100}, {'id': 2, 'sales': 50}]
+    original_interval = tg_bot.PROGRESS_EDIT_INTERVAL
+
+    async def scenario(interval):
+        tg_bot.PROGRESS_EDIT_INTERVAL = interval
+        update = FakeUpdate()
+        reporter = ProgressReporter(update, asyncio.get_running_loop())
+
+        def parse():
+            # Вызовы приходят из потока парсера
+            reporter([], 0, 3)
+            for done in (1, 2, 3):
+                reporter(products[:done], done, 3)
+
+        await asyncio.to_thread(parse)
+        await reporter.finish("✅ Готово")
+        return update.message.replies
+
+    try:
+        replies = asyncio.run(scenario(60))
+        assert len(replies) == 1
+        message = replies[0]
+        assert "получено 1/3" in message.sent and "1. Куртка — 100 продаж" in message.sent
+        assert message.edits == ["✅ Готово"] and message.text == "✅ Готово"
+
+        replies = asyncio.run(scenario(0))
+        assert len(replies) == 1
+        message = replies[0]
+        assert "получено 1/3" in message.sent and "получено 2/3" in message.edits[0]
+        assert "2. Товар 2 — 50 продаж" in message.edits[1]
+        assert message.edits[-1] == "✅ Готово"
+
+        # Пустой результат: сообщение не отправляется и не заменяется
+        async def nothing():
+            update = FakeUpdate()
+            reporter = ProgressReporter(update, asyncio.get_running_loop())
+            reporter([], 1, 1)
+            await reporter.finish("✅ Готово")
+            return update.message.replies
+
+        assert asyncio.run(nothing()) == []
+    finally:
+        tg_bot.PROGRESS_EDIT_INTERVAL = original_interval
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_on_progress, test_progress_reporter]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест журнала запросов: запись, ротация, частые запросы для прогрева кэша
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+from unittest import mock
+
+from test_batch import FakeMayakAPI, FakeWBParser
+from wb_query_log import QueryLog
+from wb_sales_parser import CliContext, build_arg_parser, run
+
+
+def test_query_log():
+    """Запросы дописываются в журнал и считаются по нормализованной форме"""
+    print("🧪 Тест журнала запросов...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log = QueryLog(os.path.join(tmp, 'queries.jsonl'))
+        now = time.time()
+        log.record("Куртка женская", 1.5, 20, source='bot', ts=now - 3600, cached=False)
+        log.record("куртка  женская", 0.1, 20, source='bot', ts=now - 60, cached=True)
+        log.record("кроссовки", 2.0, 15, ts=now - 120)
+        log.record("пуховик", 3.0, 0, ts=now - 10 * 86400)
+
+        entries = list(log.entries())
+        assert len(entries) == 4
+        assert entries[0] == {'query': "Куртка женская", 'ts': round(now - 3600, 3), 'latency': 1.5,
+                              'count': 20, 'source': 'bot', 'cached': False}
+
+        top = log.top_queries(days=7, now=now)
+        assert top == [("куртка  женская", 2), ("кроссовки", 1)], top
+        assert log.top_queries(days=30, limit=1, now=now) == [("куртка  женская", 2)]
+
+    print("✅ Журнал запросов работает")
+    return True
+
+
+def test_rotation():
+    """При превышении размера журнал ротирует только писатель с rotate=True, чтение идёт по всем файлам по порядку"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rotated.jsonl')
+        log = QueryLog(path, max_bytes=400, backup_count=2, rotate=True)
+        for i in range(30):
+            log.record(f"запрос {i}", 0.5, i)
+
+        files = log.files()
+        assert files[-1] == os.path.abspath(path) and len(files) == 3
+        assert all(os.path.getsize(f) <= 400 for f in files)
+
+        # Старые записи вытесняются, порядок сохраняется
+        counts = [entry['count'] for entry in log.entries()]
+        assert counts == list(range(30 - len(counts), 30)), counts
+
+        # Писатель без ротации (CLI) дописывает в текущий файл и ничего не переименовывает
+        cli_log = QueryLog(path, max_bytes=400, backup_count=2)
+        for i in range(10):
+            cli_log.record("ещё", 0.1, 100 + i)
+        assert log.files() == files and os.path.getsize(path) > 400
+        assert [entry['count'] for entry in log.entries()][-10:] == list(range(100, 110))
+    return True
+
+
+def append_entries(path, worker, count):
+    log = QueryLog(path)
+    for i in range(count):
+        log.record(f"запрос {worker}", 0.1, i, source=f"w{worker}")
+
+
+def test_multiprocess_append():
+    """Записи нескольких процессов в один журнал не теряются и не перемешиваются"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'shared.jsonl')
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=append_entries, args=(path, worker, 200)) for worker in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            assert process.exitcode == 0
+
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        entries = list(QueryLog(path).entries())
+        assert len(lines) == len(entries) == 800
+        for worker in range(4):
+            counts = [e['count'] for e in entries if e['source'] == f"w{worker}"]
+            assert counts == list(range(200))
+    return True
+
+
+class FakeCliContext(CliContext):
+    """Контекст CLI с парсером без сети (выдача WB и Mayak из test_batch)"""
+
+    def get_parser(self, mayak_cookies, basket_cache=None):
+        parser = FakeWBParser()
+        parser.mayak_api = FakeMayakAPI()
+        return parser
+
+
+def test_cli_batch_entries():
+    """Запросы, обогащённые одним пакетом, записываются с пометкой cumulative"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'queries.jsonl')
+        cookies = os.path.join(tmp, 'cookies.txt')
+        with open(cookies, 'w', encoding='utf-8') as f:
+            f.write('sid=1')
+
+        with mock.patch.dict(os.environ, {'WB_QUERY_LOG': path}):
+            for argv in (['-q', 'куртка', '--pages', '2'], ['-q', 'куртка', '-q', 'пуховик', '--pages', '2']):
+                run(build_arg_parser().parse_args(argv + ['--cookies-file', cookies]), FakeCliContext())
+
+        single, *batch = QueryLog(path).entries()
+        assert single['query'] == 'куртка' and single['count'] == 3 and 'cumulative' not in single
+        assert [(e['query'], e['count'], e['cumulative'], e['batch']) for e in batch] == [
+            ('куртка', 3, True, 2), ('пуховик', 2, True, 2)]
+        assert batch[0]['latency'] == batch[1]['latency']
+    return True
+
+
+if __name__ == "__main__":
+    tests = [test_query_log, test_rotation, test_multiprocess_append, test_cli_batch_entries]
+    success = all(test() for test in tests)
+    exit(0 if success else 1)
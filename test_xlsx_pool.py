@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тест сборки .xlsx в пуле процессов: та же книга, что и в текущем процессе
+"""
+
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from openpyxl import load_workbook
+from PIL import Image
+
+from wb_export import WorkbookPool, build_thumbnails, compact_rows, products_to_xlsx_bytes
+
+
+def make_products(count: int):
+    return [
+        {
+            'id': str(100000 + i),
+            'name': f"Товар {i}",
+            'sales': 1000 - i,
+            'revenue': (1000 - i) * 1500,
+            'image_urls': [f"https://basket-01.wbbasket.ru/{i}/{n}.webp" for n in range(1, 1 + i % 4)],
+            'wb_data': {'большое поле': 'x' * 1000},
+        }
+        for i in range(count)
+    ]
+
+
+def sheet_values(xlsx_bytes: bytes):
+    sheet = load_workbook(io.BytesIO(xlsx_bytes)).active
+    return [list(row) for row in sheet.iter_rows(values_only=True)]
+
+
+def test_xlsx_pool():
+    """Книги из пула совпадают с собранными на месте, одновременные выгрузки выполняются"""
+    print("🧪 Тест пула сборки .xlsx...")
+
+    products = make_products(30)
+    rows = compact_rows(products, max_images=3)
+    assert rows[5] == ('100005', 'Товар 5', 995, 1492500,
+                       ('https://basket-01.wbbasket.ru/5/1.webp',))
+
+    expected = sheet_values(products_to_xlsx_bytes(products))
+    assert expected[0][:4] == ["Ссылка", "Название", "Количество продаж", "Сумма продаж"]
+    assert expected[2][4] == '=IMAGE("https://basket-01.wbbasket.ru/1/1.webp"; 1)'
+
+    pool = WorkbookPool(workers=2)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda _: products_to_xlsx_bytes(products, pool=pool), range(4)))
+    finally:
+        pool.shutdown(wait=True)
+
+    assert all(sheet_values(xlsx) == expected for xlsx in results)
+
+    print("✅ Пул сборки .xlsx работает")
+    return True
+
+
+class LocalDownloader:
+    """Загрузчик без сети: изображения товара - локальные файлы из paths"""
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def download_products(self, products, max_images=None):
+        return {str(p['id']): self.paths[:max_images] for p in products}
+
+
+def test_thumbnails_in_pool():
+    """С переданным пулом миниатюры готовятся в его процессах, новый пул на выгрузку не создаётся"""
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(3):
+            path = os.path.join(tmp, f"{i}.png")
+            Image.new('RGB', (900, 1200), (i * 80, 0, 0)).save(path)
+            paths.append(path)
+        products = make_products(4)
+        downloader = LocalDownloader(paths)
+
+        pool = WorkbookPool(workers=2)
+        try:
+            thumbnails = build_thumbnails(products, 2, downloader=downloader, pool=pool)
+            executor = pool._get_executor()
+            xlsx = products_to_xlsx_bytes(products, embed_images=True, images_per_product=2,
+                                          downloader=downloader, pool=pool)
+            assert pool._get_executor() is executor
+        finally:
+            pool.shutdown(wait=True)
+
+        assert set(thumbnails) == {p['id'] for p in products}
+        first = thumbnails[products[0]['id']]
+        assert len(first) == 2 and all(data.startswith(b'\xff\xd8') for data in first)
+        with Image.open(io.BytesIO(first[0])) as image:
+            assert image.size == (180, 240)
+        assert len(load_workbook(io.BytesIO(xlsx)).active._images) == 8
+    return True
+
+
+if __name__ == "__main__":
+    success = test_xlsx_pool() and test_thumbnails_in_pool()
+    exit(0 if success else 1)
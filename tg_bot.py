@@ -11,20 +11,50 @@ Telegram бот для получения Excel (.xlsx) по запросу quer
 Требования:
 - python-telegram-bot >= 21.4
 - openpyxl >= 3.1.5
+- Pillow (только при XLSX_EMBED_IMAGES=1)
 - Файл cookies.txt в корне проекта (по умолчанию)
+
+Переменные окружения:
+- TELEGRAM_BOT_TOKEN — токен бота
+- COOKIES_FILE — файл cookies Mayak, по аккаунту на строку, или каталог (по умолчанию cookies.txt)
+- XLSX_EMBED_IMAGES=1 — встраивать миниатюры вместо формул IMAGE(), XLSX_IMAGES_PER_PRODUCT — сколько (3)
+- XLSX_WORKERS — собирать .xlsx в пуле из стольких процессов (0 — в потоке запроса, по умолчанию)
+- RESULT_CACHE_TTL — сколько секунд повторный запрос отвечается готовым файлом из кэша (900)
+- RESULT_CACHE_SIZE — максимум запросов в кэше (64)
+- PROGRESSIVE_RESULTS=0 — отключить предварительный топ товаров по мере прихода данных Mayak
+- BOT_SLA — за сколько секунд бот гарантированно отвечает (60, 0 — без ограничения): по истечении
+  присылается частичный результат по уже обогащённым товарам
+- WB_QUERY_LOG — журнал запросов (по умолчанию query_log.jsonl рядом с ботом, пустое значение — не вести);
+  бот ротирует его по размеру, CLI и демон только дописывают
+- WARMUP_TIME — время «ЧЧ:ММ», когда частые запросы из журнала заранее загружаются в кэш результатов
+  (незадолго до часов пик: результат живёт RESULT_CACHE_TTL), WARMUP_QUERIES — сколько запросов (10),
+  WARMUP_DAYS — за сколько последних дней считать частоту (7)
+- METRICS_PORT — порт локального эндпоинта метрик Prometheus http://127.0.0.1:<порт>/metrics (не задан — выключен)
+- WB_HEDGE=1 — дублировать медленные GET запросы к WB и Mayak (WB_HEDGE_PERCENTILE, WB_HEDGE_BUDGET)
 """
 
+import asyncio
 import io
 import logging
 import os
-from datetime import datetime
-from typing import List, Dict, Any
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Callable, Tuple
 
 from telegram import Update, InputFile
 from telegram.constants import ChatAction
+from telegram.error import TelegramError
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 
 from wb_parser import WBParser
+from mayak_api import load_cookie_sets
+from wb_export import products_to_xlsx_bytes, WorkbookPool
+from wb_cache import TTLCache, normalize_query
+from wb_deadline import Deadline
+from wb_query_log import QueryLog
+from wb_metrics import BOT_IN_FLIGHT, BOT_QUEUE_DEPTH, record_cache, stage, start_metrics_server
 
 # Логирование
 logging.basicConfig(
@@ -36,69 +66,227 @@ logger = logging.getLogger(__name__)
 
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 COOKIES_FILE = os.getenv('COOKIES_FILE', 'cookies.txt')
+# Встраивать миниатюры изображений в .xlsx вместо формул IMAGE()
+XLSX_EMBED_IMAGES = os.getenv('XLSX_EMBED_IMAGES', '0') == '1'
+XLSX_IMAGES_PER_PRODUCT = int(os.getenv('XLSX_IMAGES_PER_PRODUCT', '3'))
+# Кэш готовых результатов (товары + .xlsx) по нормализованному запросу
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', '900'))
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '64'))
+# Предварительный топ товаров, который редактируется по мере прихода чанков Mayak
+PROGRESSIVE_RESULTS = os.getenv('PROGRESSIVE_RESULTS', '1') == '1'
+PROGRESS_PREVIEW_SIZE = 5
+PROGRESS_EDIT_INTERVAL = 1.5
+# Гарантированное время ответа; часть бюджета оставляем на сборку и отправку .xlsx
+BOT_SLA = float(os.getenv('BOT_SLA', '60'))
+BOT_SLA_RESERVE = 5.0
+# Прогрев кэша результатов частыми запросами из журнала
+WARMUP_TIME = os.getenv('WARMUP_TIME', '')
+WARMUP_QUERIES = int(os.getenv('WARMUP_QUERIES', '10'))
+WARMUP_DAYS = float(os.getenv('WARMUP_DAYS', '7'))
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0') or 0)
+# Сколько парсеров (наборов cookies) держать: после смены cookies старые не нужны
+MAX_PARSERS = 4
+
+
+class QueryResult:
+    """Готовый результат запроса: товары и файл .xlsx"""
+
+    def __init__(self, query: str, products: List[Dict[str, Any]], xlsx_bytes: bytes, missing_count: int = 0):
+        self.query = query
+        self.products = products
+        self.xlsx_bytes = xlsx_bytes
+        self.missing_count = missing_count
+        self.created_at = datetime.now()
+
+    @property
+    def partial(self) -> bool:
+        """Не все товары удалось обогатить: истёк BOT_SLA или запросы Mayak не удались"""
+        return self.missing_count > 0
+
+    @property
+    def filename(self) -> str:
+        return f"wb_{self.created_at.strftime('%Y%m%d_%H%M%S')}.xlsx"
+
+
+result_cache = TTLCache(max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+# Сборка книг одновременных запросов на нескольких ядрах, без борьбы за GIL с циклом событий
+xlsx_pool = WorkbookPool.from_env()
+# Журнал ротирует только бот: CLI и демон лишь дописывают в тот же файл
+query_log = QueryLog.from_env(rotate=True)
+
+
+# Общие парсеры по наборам cookies: пул соединений, сессии Mayak и кэш страниц выдачи
+# переживают отдельные запросы
+_parsers: Dict[Tuple[str, ...], WBParser] = {}
+# Выполняемые запросы по нормализованному тексту: одинаковые запросы ждут один результат
+_in_flight: Dict[str, Future] = {}
+_lock = threading.Lock()
+
+
+def get_parser(mayak_cookies: List[str]) -> WBParser:
+    """Общий WBParser для набора cookies (создаётся при первом запросе)"""
+    key = tuple(mayak_cookies)
+    with _lock:
+        parser = _parsers.get(key)
+        if parser is None:
+            parser = _parsers[key] = WBParser(mayak_cookies=mayak_cookies)
+            while len(_parsers) > MAX_PARSERS:
+                _parsers.pop(next(iter(_parsers)))
+        return parser
+
+
+def log_query(query: str, started: float, count: int, **extra: Any):
+    if query_log is not None:
+        query_log.record(query, time.monotonic() - started, count, source='bot', **extra)
+
+
+def build_query_result(query: str, mayak_cookies: List[str],
+                       on_progress: Optional[Callable[[List[Dict[str, Any]], int, int], None]] = None,
+                       deadline: Optional[Deadline] = None) -> Optional[QueryResult]:
+    """
+    Выполняет поиск, обогащение и сборку .xlsx; None, если ничего не найдено.
+    По истечении deadline собирает файл из уже обогащённых товаров (QueryResult.partial)
+    """
+    parser = get_parser(mayak_cookies)
+    enriched = parser.get_products_detailed_info_with_pics(query=query, page=1, max_products=100,
+                                                           on_progress=on_progress, deadline=deadline)
+    products = enriched[:20]
+    if not products:
+        return None
+
+    xlsx_bytes = products_to_xlsx_bytes(products, embed_images=XLSX_EMBED_IMAGES,
+                                        images_per_product=XLSX_IMAGES_PER_PRODUCT, pool=xlsx_pool)
+    return QueryResult(query, products, xlsx_bytes, missing_count=len(getattr(enriched, 'missing_ids', [])))
+
+
+def lookup_cached_result(query: str) -> Optional[QueryResult]:
+    """Результат запроса из кэша результатов (попадание или промах учитывается в метриках)"""
+    cached = result_cache.get(normalize_query(query))
+    record_cache('result', cached is not None)
+    return cached
+
+
+def request_deadline() -> Optional[Deadline]:
+    """Бюджет времени запроса: BOT_SLA за вычетом запаса на отправку файла"""
+    return Deadline.after(BOT_SLA and max(1.0, BOT_SLA - BOT_SLA_RESERVE))
 
 
-def products_to_xlsx_bytes(products: List[Dict[str, Any]]) -> bytes:
-    """Готовит Excel (.xlsx) в памяти.
-    Колонки: Ссылка, Название, Количество продаж, Изображение 1..N
-    Высота строк ~240px, ширина колонок с изображениями ~180px.
+def compute_query_result(query: str, mayak_cookies: List[str],
+                         on_progress: Optional[Callable[[List[Dict[str, Any]], int, int], None]] = None,
+                         deadline: Optional[Deadline] = None) -> Optional[QueryResult]:
     """
-    from openpyxl import Workbook
-    from openpyxl.utils import get_column_letter
-
-    # Определяем максимальное число изображений
-    max_images = 0
-    for p in products:
-        imgs = p.get('image_urls', []) or []
-        if len(imgs) > max_images:
-            max_images = len(imgs)
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "WB"
-
-    headers = ["Ссылка", "Название", "Количество продаж", "Сумма продаж"] + [f"Изображение {i}" for i in range(1, max_images + 1)]
-    ws.append(headers)
-
-    for p in products:
-        product_id = p.get('id', '')
-        url = f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx" if product_id else ''
-        name = p.get('name', '')
-        sales = p.get('sales', 0)
-        revenue = p.get('revenue', 0)
-        images = (p.get('image_urls', []) or [])[:max_images]
-        # Формируем строку без изображений
-        row = [url, name, sales, revenue]
-        # Добавляем ячейки с формулами IMAGE()
-        for img in images:
-            # Формула Excel: =IMAGE("url"; 1)
-            row.append(f"=IMAGE(\"{img}\"; 1)")
-        # Если изображений меньше максимума — добиваем пустыми
-        if len(images) < max_images:
-            row += [""] * (max_images - len(images))
-        ws.append(row)
-
-    # Устанавливаем размеры: высота строк и ширина колонок
-    # Excel измеряет высоту в пунктах (~0.75 pt на пиксель при 96 DPI)
-    row_height_points = 240 * 0.75  # ≈ 180 pt
-    for r in range(1, ws.max_row + 1):
-        ws.row_dimensions[r].height = row_height_points
-
-    # Ширина колонок: приблизим 180 px к ширине Excel (~ px/7)
-    image_col_width = round(180 / 7.0, 2)  # ≈ 25.71
-
-    # Зададим разумные ширины для первых трёх колонок
-    base_widths = [45, 50, 18]
-    for idx, width in enumerate(base_widths, start=1):
-        ws.column_dimensions[get_column_letter(idx)].width = width
-
-    # Колонки изображений начинаются с 4-й
-    for col_idx in range(4, 4 + max_images):
-        ws.column_dimensions[get_column_letter(col_idx)].width = image_col_width
-
-    stream = io.BytesIO()
-    wb.save(stream)
-    return stream.getvalue()
+    build_query_result в бюджете времени бота (по умолчанию request_deadline()) с сохранением
+    полного результата в кэш. Частичный результат не кэшируется: следующий запрос может успеть целиком.
+
+    Одинаковые (после normalize_query) одновременные запросы выполняются один раз:
+    остальные ждут результат первого в пределах своего бюджета (по истечении - None)
+    """
+    deadline = deadline or request_deadline()
+    cache_key = normalize_query(query)
+    with _lock:
+        # Запрос мог завершиться между проверкой кэша вызывающим и этим вызовом
+        cached = result_cache.get_with_time(cache_key, count=False)
+        if cached is not None:
+            return cached[0]
+        future = _in_flight.get(cache_key)
+        owner = future is None
+        if owner:
+            future = _in_flight[cache_key] = Future()
+
+    if not owner:
+        logger.info(f"Запрос '{query}' уже выполняется, ожидаем его результат")
+        try:
+            return future.result(timeout=deadline.remaining() if deadline is not None else None)
+        except FuturesTimeoutError:
+            logger.warning(f"Истёк бюджет времени в ожидании результата запроса '{query}'")
+            return None
+
+    try:
+        result = build_query_result(query, mayak_cookies, on_progress, deadline)
+    except Exception as e:
+        with _lock:
+            _in_flight.pop(cache_key, None)
+        future.set_exception(e)
+        raise
+    with _lock:
+        if result is not None and not result.partial:
+            result_cache.set(cache_key, result)
+        _in_flight.pop(cache_key, None)
+    future.set_result(result)
+    return result
+
+
+async def reply_with_result(update: Update, result: QueryResult, cached: bool = False) -> None:
+    caption = f"Результат для запроса: {result.query}"
+    if cached:
+        caption += f"\nПо состоянию на {result.created_at.strftime('%d.%m.%Y %H:%M')}"
+    if result.partial:
+        caption += (f"\n⚠️ Частичный результат: данные по {result.missing_count} товарам "
+                    f"не получены, повторите запрос позже")
+    with stage('telegram_upload'):
+        await update.message.reply_document(document=InputFile(io.BytesIO(result.xlsx_bytes),
+                                                                filename=result.filename),
+                                            caption=caption)
+
+
+def format_preview(products: List[Dict[str, Any]], header: str) -> str:
+    """Текст топа товаров для сообщения"""
+    lines = [header]
+    for i, p in enumerate(products[:PROGRESS_PREVIEW_SIZE], 1):
+        name = p.get('name') or f"Товар {p.get('id', '')}"
+        lines.append(f"{i}. {name[:60]} — {p.get('sales', 0):,} продаж\n"
+                     f"https://www.wildberries.ru/catalog/{p.get('id', '')}/detail.aspx")
+    return '\n'.join(lines)
+
+
+class ProgressReporter:
+    """
+    Показывает предварительный топ товаров одним сообщением и редактирует его
+    по мере прихода чанков Mayak. Вызывается из потока парсера.
+    """
+
+    def __init__(self, update: Update, loop: asyncio.AbstractEventLoop):
+        self.update = update
+        self.loop = loop
+        self.message = None
+        self._last_text = None
+        self._last_sent = 0.0
+        self._pending = []
+        self._lock = asyncio.Lock()
+
+    def __call__(self, products: List[Dict[str, Any]], done: int, total: int):
+        if not products:
+            return
+        now = time.monotonic()
+        # Первый чанк показываем сразу, дальше не чаще PROGRESS_EDIT_INTERVAL
+        if self._pending and now - self._last_sent < PROGRESS_EDIT_INTERVAL:
+            return
+        self._last_sent = now
+        text = format_preview(products, f"⏳ Предварительный топ по продажам (получено {done}/{total} частей данных):")
+        self._pending.append(asyncio.run_coroutine_threadsafe(self._show(text), self.loop))
+
+    async def _show(self, text: str):
+        async with self._lock:
+            if text == self._last_text:
+                return
+            try:
+                if self.message is None:
+                    self.message = await self.update.message.reply_text(text, disable_web_page_preview=True)
+                else:
+                    await self.message.edit_text(text, disable_web_page_preview=True)
+                self._last_text = text
+            except TelegramError as e:
+                logger.warning(f"Не удалось обновить предварительный результат: {e}")
+
+    async def finish(self, text: Optional[str] = None):
+        """Дожидается отправки обновлений и при необходимости заменяет текст сообщения"""
+        for future in self._pending:
+            try:
+                await asyncio.wrap_future(future)
+            except Exception as e:
+                logger.warning(f"Ошибка обновления предварительного результата: {e}")
+        if text and self.message is not None:
+            await self._show(text)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -115,16 +303,28 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    with BOT_IN_FLIGHT.track_inprogress(), stage('bot_request'):
+        await process_query(update, context)
+
+
+async def process_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = (update.message.text or '').strip()
     if not query:
         await update.message.reply_text("Пустой запрос. Пришлите текст запроса.")
         return
 
+    started = time.monotonic()
+    cached = lookup_cached_result(query)
+    if cached is not None:
+        logger.info(f"Результат для запроса '{query}' взят из кэша")
+        await reply_with_result(update, cached, cached=True)
+        log_query(query, started, len(cached.products), cached=True)
+        return
+
     await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.UPLOAD_DOCUMENT)
 
     try:
-        with open(COOKIES_FILE, 'r') as f:
-            mayak_cookies = f.read().strip()
+        mayak_cookies = load_cookie_sets(COOKIES_FILE)
         if not mayak_cookies:
             await update.message.reply_text("Файл cookies пуст. Заполните cookies.txt")
             return
@@ -136,27 +336,96 @@ async def handle_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text(f"Ошибка чтения cookies: {e}")
         return
 
+    reporter = ProgressReporter(update, asyncio.get_running_loop()) if PROGRESSIVE_RESULTS else None
     try:
-        parser = WBParser(mayak_cookies=mayak_cookies)
-        products = parser.get_products_detailed_info_with_pics(query=query, page=1, max_products=100)
-        if products:
-            products = products[:20]
-        if not products:
+        # Парсинг синхронный: выполняем в потоке, чтобы не блокировать обработку других сообщений.
+        # Бюджет отсчитывается до постановки в поток: ожидание свободного потока входит в SLA
+        result = await asyncio.to_thread(compute_query_result, query, mayak_cookies, reporter, request_deadline())
+        if result is None:
+            if reporter:
+                await reporter.finish()
             await update.message.reply_text("Ничего не найдено или ошибка при получении данных.")
+            log_query(query, started, 0)
             return
 
-        xlsx_bytes = products_to_xlsx_bytes(products)
-        filename = f"wb_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        await update.message.reply_document(document=InputFile(io.BytesIO(xlsx_bytes), filename=filename),
-                                            caption=f"Результат для запроса: {query}")
+        if reporter:
+            await reporter.finish(format_preview(
+                result.products, f"✅ Топ по продажам, полный файл ниже ({len(result.products)} товаров):"))
+        await reply_with_result(update, result)
+        log_query(query, started, len(result.products), partial=result.partial)
     except Exception as e:
         logger.exception("Ошибка в обработке запроса")
         await update.message.reply_text(f"Ошибка: {e}")
 
 
+def seconds_until(clock_time: str, now: Optional[datetime] = None) -> float:
+    """Секунд до ближайшего наступления времени «ЧЧ:ММ»"""
+    now = now or datetime.now()
+    hours, minutes = (int(part) for part in clock_time.split(':'))
+    target = now.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+async def warm_up_cache(mayak_cookies: List[str], queries: List[str]) -> int:
+    """
+    Заранее выполняет запросы и кладёт результаты в кэш, чтобы первый пользователь
+    получил ответ из кэша. Запросы выполняются по одному, чтобы не создавать пик нагрузки.
+
+    Returns:
+        Количество прогретых запросов
+    """
+    warmed = 0
+    for query in queries:
+        cache_key = normalize_query(query)
+        if cache_key in result_cache:
+            continue
+        try:
+            result = await asyncio.to_thread(build_query_result, query, mayak_cookies)
+        except Exception as e:
+            logger.warning(f"Прогрев запроса '{query}' не удался: {e}")
+            continue
+        if result is not None and not result.partial:
+            result_cache.set(cache_key, result)
+            warmed += 1
+    return warmed
+
+
+async def warm_up_loop() -> None:
+    """Каждый день в WARMUP_TIME прогревает кэш самыми частыми запросами из журнала"""
+    while True:
+        await asyncio.sleep(seconds_until(WARMUP_TIME))
+        try:
+            queries = [query for query, _ in query_log.top_queries(days=WARMUP_DAYS, limit=WARMUP_QUERIES)]
+            if not queries:
+                continue
+            started = time.monotonic()
+            warmed = await warm_up_cache(load_cookie_sets(COOKIES_FILE), queries)
+            logger.info(f"Прогрев кэша: {warmed} из {len(queries)} частых запросов "
+                        f"за {time.monotonic() - started:.0f} сек")
+        except Exception:
+            logger.exception("Ошибка прогрева кэша")
+
+
+async def post_init(application: Application) -> None:
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        BOT_QUEUE_DEPTH.set_function(application.update_queue.qsize)
+    if WARMUP_TIME and query_log is not None:
+        seconds_until(WARMUP_TIME)  # проверка формата до запуска
+        application.bot_data['warm_up_task'] = asyncio.create_task(warm_up_loop())
+        logger.info(f"Прогрев кэша частыми запросами ежедневно в {WARMUP_TIME}")
+
+
+async def post_shutdown(application: Application) -> None:
+    if xlsx_pool is not None:
+        xlsx_pool.shutdown()
+
+
 def build_app() -> Application:
     token = TELEGRAM_BOT_TOKEN or ""
-    return Application.builder().token(token).build()
+    return Application.builder().token(token).post_init(post_init).post_shutdown(post_shutdown).build()
 
 
 def main() -> None:
@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP API сервис поверх WBParser и MayakAPI
+
+Асинхронный HTTP/1.1 сервер (asyncio, без внешних зависимостей) с одним общим
+WBParser/HttpTransport на все запросы, ограничением одновременно обрабатываемых
+запросов и потоковой выдачей результатов.
+
+Эндпоинты (GET):
+- /health                                   - проверка работоспособности
+- /search?q=<запрос>&page=1                 - товары из поиска WB (без Mayak)
+- /enrich?ids=1,2,3                         - данные Mayak по ID товаров (NDJSON отдаётся по мере прихода чанков);
+                                              коды без данных Mayak - в поле missing_ids (json)
+                                              или последней строкой {"missing_ids": [...]} (ndjson)
+- /products?q=<запрос>&page=1&max_products=20&filter=<выражение>
+                                            - полный цикл: поиск WB + Mayak + изображения;
+                                              partial и missing_ids - как у /enrich
+- /export?q=<запрос>&...                    - то же в виде .xlsx
+
+Параметр format: json (по умолчанию), ndjson или csv.
+
+Пока обрабатывается страница page, следующая загружается в фоне (кэш страниц
+WBParser), поэтому запрос page+1 при постраничном просмотре не ждёт WB.
+Отключается флагом --no-prefetch.
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional, AsyncIterator, Iterable, Callable
+from urllib.parse import urlsplit, parse_qs
+
+from wb_parser import WBParser
+from mayak_api import load_cookie_sets
+from wb_filters import ProductFilter, get_wb_price, get_wb_rating, get_wb_feedbacks
+from wb_export import products_to_xlsx_bytes
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'json': 'application/json; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+CSV_FIELDS = ['id', 'name', 'sales', 'revenue', 'avg_price', 'lost_revenue', 'pics', 'image_urls']
+
+STATUS_TEXT = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    502: 'Bad Gateway',
+    503: 'Service Unavailable',
+}
+
+MAX_HEADER_LINES = 100
+# Тело запроса не используется: большее тело не вычитывается, соединение закрывается
+MAX_BODY_BYTES = 64 * 1024
+
+
+class HttpError(Exception):
+    """Ошибка обработки запроса с HTTP статусом"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class StreamError(Exception):
+    """Ошибка после отправки заголовков потокового ответа: статус уже не изменить, соединение закрывается"""
+
+
+class Request:
+    """Разобранный HTTP запрос"""
+
+    def __init__(self, method: str, target: str, version: str, headers: Dict[str, str]):
+        self.method = method
+        self.version = version
+        self.headers = headers
+        parts = urlsplit(target)
+        self.path = parts.path
+        self.params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive'
+        return connection != 'close'
+
+    def param(self, name: str, default: Optional[str] = None, required: bool = False) -> Optional[str]:
+        value = self.params.get(name, default)
+        if required and not value:
+            raise HttpError(400, f"Не задан параметр {name}")
+        return value
+
+    def int_param(self, name: str, default: int) -> int:
+        value = self.params.get(name)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise HttpError(400, f"Параметр {name} должен быть числом")
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Request]:
+    """Читает строку запроса и заголовки; None, если клиент закрыл соединение"""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(400, "Некорректная строка запроса")
+
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(400, "Слишком много заголовков")
+
+    # Тело запроса не используется, но должно быть вычитано для keep-alive
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HttpError(400, "Некорректный заголовок Content-Length")
+    if length < 0:
+        raise HttpError(400, "Некорректный заголовок Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, f"Тело запроса больше {MAX_BODY_BYTES} байт")
+    if length:
+        await reader.readexactly(length)
+    return Request(method.upper(), target, version, headers)
+
+
+def _status_line(status: int) -> str:
+    return f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+
+
+async def send_body(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str,
+                    keep_alive: bool, extra_headers: Optional[Dict[str, str]] = None):
+    head = _status_line(status)
+    head += f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+    head += f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+    for name, value in (extra_headers or {}).items():
+        head += f"{name}: {value}\r\n"
+    writer.write(head.encode('latin-1') + b"\r\n" + body)
+    await writer.drain()
+
+
+async def send_stream(writer: asyncio.StreamWriter, content_type: str, chunks: AsyncIterator[bytes],
+                      keep_alive: bool):
+    """
+    Отправляет ответ 200 с Transfer-Encoding: chunked по мере готовности частей
+
+    Raises:
+        StreamError: Ошибка при получении частей после отправки заголовков; завершающий
+            чанк не отправляется, и клиент по закрытию соединения видит, что ответ оборван
+    """
+    head = _status_line(200)
+    head += f"Content-Type: {content_type}\r\nTransfer-Encoding: chunked\r\n"
+    head += f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    writer.write(head.encode('latin-1'))
+    try:
+        async for chunk in chunks:
+            if chunk:
+                writer.write(f"{len(chunk):X}\r\n".encode('latin-1') + chunk + b"\r\n")
+                await writer.drain()
+    except ConnectionError:
+        raise
+    except Exception as e:
+        raise StreamError(str(e)) from e
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+async def send_json(writer: asyncio.StreamWriter, status: int, data: Any, keep_alive: bool):
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    await send_body(writer, status, body, FORMATS['json'], keep_alive)
+
+
+def csv_line(values: Iterable[Any]) -> bytes:
+    stream = io.StringIO()
+    csv.writer(stream).writerow(values)
+    return stream.getvalue().encode('utf-8')
+
+
+def product_row(product: Dict[str, Any]) -> List[Any]:
+    row = []
+    for field in CSV_FIELDS:
+        value = product.get(field, '')
+        if isinstance(value, list):
+            value = ' '.join(str(v) for v in value)
+        row.append(value)
+    return row
+
+
+async def encode_rows(fmt: str, rows: AsyncIterator[Dict[str, Any]], meta: Dict[str, Any],
+                      trailer: Optional[Callable[[], Dict[str, Any]]] = None) -> AsyncIterator[bytes]:
+    """
+    Кодирует поток товаров в json / ndjson / csv
+
+    Args:
+        fmt: Формат ответа
+        rows: Поток товаров
+        meta: Поля ответа json, известные до начала выдачи
+        trailer: Вызывается после выдачи всех товаров; его поля добавляются в конец
+            ответа json, а непустой результат - последней строкой ndjson (в csv не выводится)
+    """
+    if fmt == 'ndjson':
+        async for row in rows:
+            yield json.dumps(row, ensure_ascii=False).encode('utf-8') + b"\n"
+        extra = trailer() if trailer else None
+        if extra:
+            yield json.dumps(extra, ensure_ascii=False).encode('utf-8') + b"\n"
+    elif fmt == 'csv':
+        yield csv_line(CSV_FIELDS)
+        async for row in rows:
+            yield csv_line(product_row(row))
+    else:
+        prefix = json.dumps(meta, ensure_ascii=False)[:-1]
+        yield (prefix + (', ' if meta else '') + '"products": [').encode('utf-8')
+        first = True
+        async for row in rows:
+            yield (b'' if first else b', ') + json.dumps(row, ensure_ascii=False).encode('utf-8')
+            first = False
+        extra = trailer() if trailer else None
+        suffix = json.dumps(extra, ensure_ascii=False)[1:] if extra else '}'
+        yield ("]" + (', ' if extra else '') + suffix).encode('utf-8')
+
+
+async def iterate(items: Iterable[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    for item in items:
+        yield item
+
+
+def search_row(product: Dict[str, Any]) -> Dict[str, Any]:
+    """Компактное представление товара из поиска WB"""
+    return {
+        'id': product.get('id'),
+        'name': product.get('name', ''),
+        'brand': product.get('brand', ''),
+        'price': get_wb_price(product),
+        'rating': get_wb_rating(product),
+        'feedbacks': get_wb_feedbacks(product),
+        'pics': product.get('pics', 0),
+    }
+
+
+class ApiServer:
+    """HTTP API сервис с общим WBParser и ограничением параллельности"""
+
+    def __init__(self, parser: WBParser, max_concurrency: int = 8, queue_timeout: float = 10):
+        """
+        Args:
+            parser: Общий парсер (один пул соединений на все запросы)
+            max_concurrency: Максимум одновременно обрабатываемых запросов к WB/Mayak
+            queue_timeout: Сколько секунд запрос может ждать свободного слота, затем 503
+        """
+        self.parser = parser
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='api')
+        self.routes = {
+            '/health': self.handle_health,
+            '/search': self.handle_search,
+            '/enrich': self.handle_enrich,
+            '/products': self.handle_products,
+            '/export': self.handle_export,
+        }
+
+    async def run_blocking(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def acquire_slot(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HttpError(503, "Сервис перегружен, повторите запрос позже")
+
+    @staticmethod
+    def response_format(request: Request) -> str:
+        fmt = request.param('format', 'json').lower()
+        if fmt not in FORMATS:
+            raise HttpError(400, f"Неизвестный формат: {fmt}. Доступны: {', '.join(FORMATS)}")
+        return fmt
+
+    def require_mayak(self):
+        if not self.parser.mayak_api:
+            raise HttpError(503, "Mayak API не инициализирован")
+
+    async def handle_health(self, request: Request, writer: asyncio.StreamWriter):
+        status = {'status': 'ok', 'mayak': bool(self.parser.mayak_api)}
+        if self.parser.search_cache is not None:
+            status['search_cache'] = self.parser.search_cache.stats()
+        await send_json(writer, 200, status, request.keep_alive)
+
+    async def handle_search(self, request: Request, writer: asyncio.StreamWriter):
+        query = request.param('q', required=True)
+        page = request.int_param('page', 1)
+        fmt = self.response_format(request)
+
+        await self.acquire_slot()
+        try:
+            data = await self.run_blocking(self.parser.fetch_data, self.parser.build_url(query, page))
+            self.parser.prefetch_next_page(query, page, data)
+        finally:
+            self._slots.release()
+        if data is None:
+            # Пустая выдача 200 неотличима от запроса без результатов
+            raise HttpError(502, "Не удалось получить выдачу WB")
+
+        products = [search_row(p) for p in data.get('products', []) if isinstance(p, dict)]
+        meta = {'query': query, 'page': page, 'total': data.get('total', 0)}
+        await send_stream(writer, FORMATS[fmt], encode_rows(fmt, iterate(products), meta), request.keep_alive)
+
+    async def handle_enrich(self, request: Request, writer: asyncio.StreamWriter):
+        self.require_mayak()
+        ids_param = request.param('ids', required=True)
+        try:
+            ids = list(dict.fromkeys(int(value) for value in ids_param.split(',') if value.strip()))
+        except ValueError:
+            raise HttpError(400, "Параметр ids должен содержать ID товаров через запятую")
+        fmt = self.response_format(request)
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        sent = 0
+        missing_ids: List[str] = []
+
+        def on_chunk(products_so_far: List[Dict[str, Any]], chunk: int, total: int):
+            nonlocal sent
+            new_products = [dict(p) for p in products_so_far[sent:]]
+            sent = len(products_so_far)
+            loop.call_soon_threadsafe(queue.put_nowait, new_products)
+
+        async def rows() -> AsyncIterator[Dict[str, Any]]:
+            while True:
+                batch = await queue.get()
+                if batch is done:
+                    return
+                if isinstance(batch, Exception):
+                    raise batch
+                for product in batch:
+                    yield product
+
+        await self.acquire_slot()
+
+        async def produce():
+            try:
+                products = await self.run_blocking(self.parser.mayak_api.get_all_products_info, ids,
+                                                   on_chunk=on_chunk)
+                # Товары из повторов упавших чанков добавляются после последнего on_chunk
+                queue.put_nowait([dict(p) for p in products[sent:]])
+                missing_ids.extend(getattr(products, 'missing_ids', []))
+            except Exception as e:
+                # Ошибка передаётся в поток ответа: заголовки к этому моменту уже могут быть отправлены
+                queue.put_nowait(e)
+            finally:
+                self._slots.release()
+                queue.put_nowait(done)
+
+        producer = asyncio.create_task(produce())
+        try:
+            # Данные по каждому чанку Mayak отправляются клиенту сразу после получения
+            chunks = encode_rows(fmt, rows(), {'ids': len(ids)},
+                                 trailer=lambda: {'missing_ids': missing_ids} if missing_ids else {})
+            await send_stream(writer, FORMATS[fmt], chunks, request.keep_alive)
+        finally:
+            await producer
+
+    def _products_kwargs(self, request: Request) -> Dict[str, Any]:
+        expression = request.param('filter')
+        try:
+            product_filter = ProductFilter.from_expression(expression) if expression else None
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        return {
+            'query': request.param('q', required=True),
+            'page': request.int_param('page', 1),
+            'max_products': request.int_param('max_products', 20),
+            'product_filter': product_filter,
+        }
+
+    async def _get_products(self, kwargs: Dict[str, Any]) -> List[Dict[str, Any]]:
+        self.require_mayak()
+        await self.acquire_slot()
+        try:
+            return await self.run_blocking(self.parser.get_products_detailed_info_with_pics, **kwargs) or []
+        finally:
+            self._slots.release()
+
+    async def handle_products(self, request: Request, writer: asyncio.StreamWriter):
+        kwargs = self._products_kwargs(request)
+        fmt = self.response_format(request)
+        products = await self._get_products(kwargs)
+        meta = {'query': kwargs['query'], 'page': kwargs['page'], 'count': len(products),
+                'partial': getattr(products, 'partial', False)}
+        missing_ids = getattr(products, 'missing_ids', [])
+        chunks = encode_rows(fmt, iterate(products), meta,
+                             trailer=lambda: {'missing_ids': missing_ids} if missing_ids else {})
+        await send_stream(writer, FORMATS[fmt], chunks, request.keep_alive)
+
+    async def handle_export(self, request: Request, writer: asyncio.StreamWriter):
+        kwargs = self._products_kwargs(request)
+        products = await self._get_products(kwargs)
+        xlsx_bytes = await self.run_blocking(products_to_xlsx_bytes, products)
+        filename = f"wb_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        await send_body(writer, 200, xlsx_bytes, XLSX_CONTENT_TYPE, request.keep_alive,
+                        {'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    keep_alive = request.keep_alive
+                    if request.method != 'GET':
+                        raise HttpError(405, "Поддерживается только GET")
+                    handler = self.routes.get(request.path)
+                    if handler is None:
+                        raise HttpError(404, f"Неизвестный путь: {request.path}")
+                    await handler(request, writer)
+                except HttpError as e:
+                    await send_json(writer, e.status, {'error': e.message}, keep_alive)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    break
+                except StreamError:
+                    logger.exception("Ошибка во время потоковой выдачи, соединение закрыто")
+                    break
+                except Exception as e:
+                    logger.exception("Ошибка обработки запроса")
+                    await send_json(writer, 500, {'error': str(e)}, False)
+                    break
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        addresses = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+        logger.info(f"HTTP API запущен на {addresses}, параллельность {self.max_concurrency}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='HTTP API сервис для поиска и обогащения товаров WB',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Адрес (по умолчанию: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Порт (по умолчанию: 8080)')
+    parser.add_argument(
+        '--cookies-file',
+        type=str,
+        default='cookies.txt',
+        help='Файл с cookies для Mayak API (по умолчанию: cookies.txt)'
+    )
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        default=8,
+        help='Максимум одновременно обрабатываемых запросов (по умолчанию: 8)'
+    )
+    parser.add_argument(
+        '--queue-timeout',
+        type=float,
+        default=10,
+        help='Сколько секунд запрос ждёт свободного слота до ответа 503 (по умолчанию: 10)'
+    )
+    parser.add_argument(
+        '--no-prefetch',
+        action='store_true',
+        help='Не загружать следующую страницу выдачи WB в фоне'
+    )
+    args = parser.parse_args()
+
+    try:
+        mayak_cookies = load_cookie_sets(args.cookies_file)
+        if not mayak_cookies:
+            logger.error("Файл с cookies пуст.")
+            sys.exit(1)
+    except FileNotFoundError:
+        logger.error(f"Файл с cookies не найден: {args.cookies_file}")
+        sys.exit(1)
+
+    server = ApiServer(WBParser(mayak_cookies=mayak_cookies, prefetch=not args.no_prefetch), max_concurrency=args.max_concurrency,
+                       queue_timeout=args.queue_timeout)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        logger.info("HTTP API остановлен")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Определение сервера изображений (basket-NN.wbbasket.ru) по vol товара
+
+Известные диапазоны vol заданы таблицей BASKET_RANGES. Для vol за пределами
+таблицы BasketResolver проверяет предсказанный basket и соседние одновременными
+HEAD запросами и сохраняет найденные соответствия vol -> basket в файл кэша,
+после чего повторные обращения к этому диапазону обходятся без запросов.
+Vol, для которого ни один хост не ответил, не проверяется повторно в течение
+failure_ttl секунд (отрицательный кэш в памяти, на диск не сохраняется).
+"""
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Dict, Optional, Iterable
+
+import requests
+
+from http_transport import HttpTransport
+from wb_deadline import Deadline, is_expired, request_timeout
+
+logger = logging.getLogger(__name__)
+
+# Верхняя граница vol (включительно) -> номер basket
+BASKET_RANGES = [
+    (143, "01"),
+    (287, "02"),
+    (431, "03"),
+    (719, "04"),
+    (1007, "05"),
+    (1061, "06"),
+    (1115, "07"),
+    (1169, "08"),
+    (1313, "09"),
+    (1601, "10"),
+    (1655, "11"),
+    (1919, "12"),
+    (2045, "13"),
+    (2189, "14"),
+    (2405, "15"),
+    (2621, "16"),
+    (2837, "17"),
+    (3053, "18"),
+    (3269, "19"),
+    (3485, "20"),
+    (3701, "21"),
+    (3917, "22"),
+    (4133, "23"),
+    (4349, "24"),
+    (4565, "25"),
+    (4877, "26"),
+    (5189, "27"),
+    (5501, "28"),
+    (5813, "29"),
+    (6125, "30"),
+    (6437, "31"),
+]
+DEFAULT_BASKET = "32"
+LAST_KNOWN_VOL = BASKET_RANGES[-1][0]
+
+_RANGE_BOUNDS = [upper for upper, _ in BASKET_RANGES]
+
+PROBE_URL = "https://basket-{host}.wbbasket.ru/vol{vol}/part{part}/{product_id}/info/ru/card.json"
+
+
+def get_basket_host(vol: int) -> str:
+    """
+    Возвращает номер basket по vol согласно таблице диапазонов
+
+    Args:
+        vol: ID товара без последних 5 цифр
+
+    Returns:
+        Номер сервера ("01".."32")
+    """
+    index = bisect.bisect_left(_RANGE_BOUNDS, vol)
+    if index < len(BASKET_RANGES):
+        return BASKET_RANGES[index][1]
+    return DEFAULT_BASKET
+
+
+def format_basket(number: int) -> str:
+    return f"{number:02d}"
+
+
+class BasketResolver:
+    """Определяет basket для vol вне таблицы, проверяя хосты HEAD запросами, и кэширует результат"""
+
+    def __init__(self, cache_path: str = 'basket_cache.json', transport: Optional[HttpTransport] = None,
+                 probe_distance: int = 3, probe_timeout: float = 5, failure_ttl: float = 300,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            cache_path: Файл кэша найденных соответствий vol -> basket
+            transport: HTTP транспорт для HEAD запросов
+            probe_distance: Сколько соседних basket проверять выше предсказанного
+            probe_timeout: Таймаут одного HEAD запроса
+            failure_ttl: Сколько секунд не проверять vol, для которого basket не найден
+            clock: Источник времени для failure_ttl
+        """
+        self.cache_path = cache_path
+        self.transport = transport or HttpTransport()
+        self.probe_distance = probe_distance
+        self.probe_timeout = probe_timeout
+        self.failure_ttl = failure_ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._vol_locks: Dict[int, threading.Lock] = {}
+        self._failed: Dict[int, float] = {}
+        self._learned: Dict[int, str] = {}
+        self._learned_vols: List[int] = []
+        self._load_cache()
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._learned = {int(vol): str(host) for vol, host in data.get('learned', {}).items()}
+            self._learned_vols = sorted(self._learned)
+            logger.info(f"Загружено {len(self._learned)} соответствий vol -> basket из {self.cache_path}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Ошибка чтения кэша basket {self.cache_path}: {e}")
+
+    def _save_cache(self):
+        data = {'learned': {str(vol): self._learned[vol] for vol in self._learned_vols}}
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.error(f"Ошибка записи кэша basket {self.cache_path}: {e}")
+
+    def lookup(self, vol: int) -> Optional[str]:
+        """
+        Ищет basket для vol без сетевых запросов
+
+        Returns:
+            Номер basket или None, если vol вне известных диапазонов
+        """
+        if vol <= LAST_KNOWN_VOL:
+            return get_basket_host(vol)
+
+        with self._lock:
+            if vol in self._learned:
+                return self._learned[vol]
+            # Между двумя подтверждёнными vol одного basket диапазон считается известным
+            index = bisect.bisect_left(self._learned_vols, vol)
+            if 0 < index < len(self._learned_vols):
+                lower = self._learned[self._learned_vols[index - 1]]
+                upper = self._learned[self._learned_vols[index]]
+                if lower == upper:
+                    return lower
+        return None
+
+    def predict(self, vol: int) -> str:
+        """Предсказание basket для неизвестного vol: basket ближайшего меньшего известного vol"""
+        with self._lock:
+            index = bisect.bisect_left(self._learned_vols, vol)
+            if index:
+                return self._learned[self._learned_vols[index - 1]]
+        return DEFAULT_BASKET
+
+    def recently_failed(self, vol: int) -> bool:
+        """True, если basket для vol не удалось определить менее failure_ttl секунд назад"""
+        with self._lock:
+            failed_at = self._failed.get(vol)
+            if failed_at is None:
+                return False
+            if self._clock() - failed_at < self.failure_ttl:
+                return True
+            del self._failed[vol]
+            return False
+
+    def _probe(self, host: str, vol: int, product_id: int, deadline: Optional[Deadline] = None) -> bool:
+        url = PROBE_URL.format(host=host, vol=vol, part=product_id // 1000, product_id=product_id)
+        try:
+            response = self.transport.head(url, timeout=request_timeout(deadline, self.probe_timeout))
+            return response.status_code == 200
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"HEAD {url}: {e}")
+            return False
+
+    def probe(self, product_id: int, deadline: Optional[Deadline] = None) -> Optional[str]:
+        """
+        Проверяет предсказанный basket и соседние одновременными HEAD запросами
+
+        Args:
+            product_id: ID товара, по карточке которого проверяется хост
+            deadline: Таймаут HEAD запросов не больше оставшегося времени
+
+        Returns:
+            Номер basket, ответивший 200, или None
+        """
+        vol = product_id // 100000
+        predicted = int(self.predict(vol))
+        numbers = [predicted] + [predicted + step for step in range(1, self.probe_distance + 1)]
+        if predicted > 1:
+            numbers.append(predicted - 1)
+        hosts = [format_basket(number) for number in numbers]
+
+        found = []
+        with ThreadPoolExecutor(max_workers=len(hosts)) as executor:
+            futures = {executor.submit(self._probe, host, vol, product_id, deadline): host for host in hosts}
+            for future in as_completed(futures):
+                if future.result():
+                    found.append(futures[future])
+
+        if not found:
+            logger.warning(f"Не удалось определить basket для vol {vol} (проверены {', '.join(hosts)})")
+            return None
+
+        # Если ответили несколько хостов, берём ближайший к предсказанию
+        host = min(found, key=hosts.index)
+        logger.info(f"Определён basket {host} для vol {vol}")
+        return host
+
+    def learn(self, vol: int, host: str):
+        with self._lock:
+            if vol not in self._learned:
+                bisect.insort(self._learned_vols, vol)
+            self._learned[vol] = host
+            self._failed.pop(vol, None)
+            self._save_cache()
+
+    def resolve(self, product_id: int, deadline: Optional[Deadline] = None) -> str:
+        """
+        Возвращает basket для товара, при необходимости определяя его по сети
+
+        Args:
+            product_id: ID товара
+            deadline: После истечения basket берётся из таблицы или предсказывается без запросов
+
+        Returns:
+            Номер basket (предсказанный, если определить не удалось или недавно не удалось)
+        """
+        vol = product_id // 100000
+        host = self.lookup(vol)
+        if host is not None:
+            return host
+        if is_expired(deadline) or self.recently_failed(vol):
+            return self.predict(vol)
+
+        with self._lock:
+            vol_lock = self._vol_locks.setdefault(vol, threading.Lock())
+
+        # Один vol проверяется одним потоком, остальные ждут результата (не дольше deadline)
+        if not vol_lock.acquire(timeout=-1 if deadline is None else deadline.remaining()):
+            return self.predict(vol)
+        try:
+            host = self.lookup(vol)
+            if host is not None:
+                return host
+            # Пока ждали, vol мог проверить и не найти другой поток
+            if is_expired(deadline) or self.recently_failed(vol):
+                return self.predict(vol)
+            host = self.probe(product_id, deadline)
+            if host is None:
+                # Неудача из-за истёкшего бюджета времени ничего не говорит о хостах
+                if not is_expired(deadline):
+                    with self._lock:
+                        self._failed[vol] = self._clock()
+                return self.predict(vol)
+            self.learn(vol, host)
+            return host
+        finally:
+            vol_lock.release()
+
+    def resolve_many(self, product_ids: Iterable[int], max_workers: int = 8, deadline: Optional[Deadline] = None):
+        """
+        Заранее определяет basket для всех неизвестных vol из списка товаров (параллельно)
+
+        Args:
+            product_ids: ID товаров
+            max_workers: Количество одновременно проверяемых vol
+            deadline: Пробы не выполняются после истечения, таймауты не больше оставшегося времени
+        """
+        if is_expired(deadline):
+            return
+        unknown = {}
+        for product_id in product_ids:
+            vol = product_id // 100000
+            if vol not in unknown and self.lookup(vol) is None and not self.recently_failed(vol):
+                unknown[vol] = product_id
+        if not unknown:
+            return
+
+        logger.info(f"Определение basket для {len(unknown)} неизвестных vol")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda product_id: self.resolve(product_id, deadline), unknown.values()))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Пакетное обогащение товаров с дедупликацией SKU
+
+Товары WB собираются по нескольким страницам и запросам, каждый уникальный SKU
+запрашивается у Mayak один раз, а результат раздаётся всем запросам,
+в выдаче которых он встретился.
+"""
+
+import logging
+from typing import List, Dict, Any, Hashable, Optional
+
+from wb_deadline import ProductList
+
+logger = logging.getLogger(__name__)
+
+
+class EnrichmentBatch:
+    """Набор товаров WB по ключам (запросам) с общей дедупликацией SKU"""
+
+    def __init__(self):
+        # ключ -> {id: {pics, wb_data}} в порядке выдачи WB
+        self._groups: Dict[Hashable, Dict[int, Dict[str, Any]]] = {}
+        self._references = 0
+
+    def add_query(self, key: Hashable):
+        """Регистрирует ключ, даже если для него не найдётся товаров"""
+        self._groups.setdefault(key, {})
+
+    def add(self, key: Hashable, wb_products: Dict[int, Dict[str, Any]], max_products: Optional[int] = None):
+        """
+        Добавляет товары WB для ключа. Повторы SKU внутри ключа игнорируются
+        (сохраняется первое вхождение - более высокая позиция в выдаче).
+
+        Args:
+            key: Ключ группы (обычно поисковый запрос)
+            wb_products: Результат extract_products_with_pics
+            max_products: Максимальное количество товаров для ключа
+        """
+        group = self._groups.setdefault(key, {})
+        for product_id, info in wb_products.items():
+            if max_products and len(group) >= max_products:
+                break
+            self._references += 1
+            if product_id not in group:
+                group[product_id] = info
+
+    def count(self, key: Hashable) -> int:
+        return len(self._groups.get(key, {}))
+
+    def unique_ids(self) -> List[int]:
+        """Уникальные SKU всех групп в порядке первого появления"""
+        seen = {}
+        for group in self._groups.values():
+            for product_id in group:
+                seen.setdefault(product_id, None)
+        return list(seen)
+
+    def enrich(self, parser) -> Dict[Hashable, ProductList]:
+        """
+        Запрашивает данные Mayak для уникальных SKU и раздаёт их по группам
+
+        Args:
+            parser: WBParser с инициализированным Mayak API
+
+        Returns:
+            Словарь {ключ: товары с объединенными данными, отсортированные по продажам};
+            коды товаров группы, не обогащённые Mayak, - в missing_ids
+        """
+        unique_ids = self.unique_ids()
+        logger.info(f"Дедупликация: {self._references} вхождений -> {len(unique_ids)} уникальных товаров "
+                    f"в {len(self._groups)} запросах")
+
+        mayak_products = parser.mayak_api.get_all_products_info(unique_ids) if unique_ids else []
+        by_id = {}
+        for product in mayak_products:
+            try:
+                by_id[int(product.get('id', 0))] = product
+            except (TypeError, ValueError):
+                continue
+        missing = set(getattr(mayak_products, 'missing_ids', None) or [])
+
+        results = {}
+        for key, group in self._groups.items():
+            # Копируем, так как merge_with_wb_data дополняет словари товара
+            products = [dict(by_id[product_id]) for product_id in group if product_id in by_id]
+            products = parser.mayak_api.sort_products_by_sales(products, reverse=True)
+            group_missing = [product_id for product_id in group if str(product_id) in missing]
+            results[key] = ProductList(parser.merge_with_wb_data(products, group), missing_ids=group_missing)
+        return results
@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарки горячих участков на чистом Python
+
+Каждый участок (генерация ссылок на изображения, разбор ответа WB, объединение
+с данными Mayak, сортировка, таблица, CSV, .xlsx) прогоняется на синтетических
+данных от 100 до 1 000 000 товаров. Замеряются пропускная способность (товаров
+в секунду, лучшая из --repeat попыток) и пик выделенной памяти (tracemalloc,
+отдельным прогоном - трассировка замедляет код).
+
+Результаты сравниваются с сохранённой базой (bench_baseline.json): падение
+пропускной способности больше --max-slowdown или рост памяти больше
+--max-memory-growth считается регрессией, и скрипт завершается с кодом 1.
+Участки с регрессией перед этим замеряются ещё --confirm раз (берётся лучший
+результат), чтобы разовый шум соседних процессов не валил проверку.
+Пропускная способность зависит от машины - база хранится локально (не в git)
+вместе с отпечатком машины, и база с другой машины или версии Python только
+показывается для сведения: регрессии по ней не проверяются (--ignore-host - проверять).
+
+Использование:
+    python3 wb_bench.py                                # сравнить с bench_baseline.json
+    python3 wb_bench.py --save-baseline                # сохранить текущие результаты как базу
+    python3 wb_bench.py --sizes 100,10000 --cases merge,write_csv --repeat 3
+"""
+
+import argparse
+import functools
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from mayak_api import MayakAPI
+from wb_export import products_to_xlsx_bytes
+from wb_parser import WBParser
+from wb_sales_parser import write_csv
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (100, 10000, 1000000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+DEFAULT_MAX_SLOWDOWN = 0.25
+DEFAULT_MAX_MEMORY_GROWTH = 0.25
+# Минимальное время одной попытки: быстрые участки на малых объёмах повторяются в цикле
+MIN_RUN_TIME = 0.2
+# После этого времени попытки прекращаются (на миллионе товаров одна попытка идёт секунды)
+MAX_CASE_TIME = 5.0
+# Рост памяти меньше этого порога не считается регрессией (шум аллокатора на малых объёмах)
+MEMORY_NOISE_BYTES = 64 * 1024
+
+WORDS = ('платье', 'летнее', 'женское', 'хлопок', 'миди', 'черное', 'белое', 'оверсайз', 'льняное', 'вечернее')
+BRANDS = ('Zarina', 'Befree', 'Love Republic', 'Gloria Jeans', 'Incity', '')
+
+
+# Данные последнего объёма переиспользуются участками (на миллионе товаров сборка идёт десятки секунд)
+@functools.lru_cache(maxsize=1)
+def make_wb_data(size: int, seed: int = 1) -> Dict[str, Any]:
+    """Ответ поиска WB на size товаров (поля, которые использует парсер, и немного лишних)"""
+    rnd = random.Random(seed)
+    products = []
+    for i in range(size):
+        product_id = rnd.randint(10_000_000, 600_000_000)
+        products.append({
+            'id': product_id,
+            'name': ' '.join(rnd.choice(WORDS) for _ in range(3)),
+            'brand': rnd.choice(BRANDS),
+            'pics': rnd.randint(0, 15),
+            'rating': rnd.randint(0, 5),
+            'feedbacks': rnd.randint(0, 5000),
+            'sizes': [{'price': {'product': rnd.randint(500, 10000) * 100}}],
+        })
+    return {'total': size, 'products': products}
+
+
+def make_mayak_products(wb_data: Dict[str, Any], seed: int = 2) -> List[Dict[str, Any]]:
+    """Ответ Mayak для товаров выдачи"""
+    rnd = random.Random(seed)
+    products = []
+    for product in wb_data['products']:
+        sales = rnd.randint(0, 20000)
+        avg_price = rnd.randint(500, 10000)
+        products.append({'id': str(product['id']), 'sales': sales, 'revenue': sales * avg_price,
+                         'avg_price': avg_price, 'lost_revenue': rnd.randint(0, 100000)})
+    return products
+
+
+@functools.lru_cache(maxsize=1)
+def make_merged_products(size: int) -> List[Dict[str, Any]]:
+    """Итоговые товары (Mayak + WB), как их получают сортировка, таблица и выгрузки (участки их не меняют)"""
+    wb_data = make_wb_data(size)
+    parser = WBParser()
+    return parser.merge_with_wb_data(make_mayak_products(wb_data), parser.extract_products_with_pics(wb_data))
+
+
+class BenchCase:
+    """Участок кода: setup готовит данные на size товаров, run выполняет замеряемую работу"""
+
+    def __init__(self, name: str, setup: Callable[[int], Any], run: Callable[[Any], Any],
+                 max_size: Optional[int] = None):
+        """
+        Args:
+            name: Имя участка (ключ в базе)
+            setup: size -> состояние (в замер не входит)
+            run: Замеряемая работа над состоянием
+            max_size: Наибольший объём, на котором участок имеет смысл гонять
+        """
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.max_size = max_size
+
+
+def _parser_and_wb_data(size: int):
+    return WBParser(), make_wb_data(size)
+
+
+def _generate_image_urls(state):
+    parser, wb_data = state
+    for product in wb_data['products']:
+        parser.generate_image_urls(product['id'], product['pics'])
+
+
+def _extract_products_with_pics(state):
+    parser, wb_data = state
+    parser.extract_products_with_pics(wb_data)
+
+
+def _merge_setup(size: int):
+    parser, wb_data = _parser_and_wb_data(size)
+    return parser, make_mayak_products(wb_data), parser.extract_products_with_pics(wb_data)
+
+
+def _merge(state):
+    # merge_with_wb_data дополняет словари Mayak теми же ключами - повторные прогоны равноценны
+    parser, mayak_products, wb_products = state
+    parser.merge_with_wb_data(mayak_products, wb_products)
+
+
+def _mayak_and_products(size: int):
+    return MayakAPI(), make_merged_products(size)
+
+
+def _sort_products_by_sales(state):
+    api, products = state
+    api.sort_products_by_sales(products, reverse=True)
+
+
+def _format_products_table(state):
+    api, products = state
+    api.format_products_table(products)
+
+
+def _write_csv(products):
+    # Диск в замер не входит: важна сборка строк
+    write_csv(os.devnull, products, regions=['-1257786'])
+
+
+def _products_to_xlsx_bytes(products):
+    products_to_xlsx_bytes(products)
+
+
+BENCHMARKS: Dict[str, BenchCase] = {case.name: case for case in (
+    BenchCase('generate_image_urls', _parser_and_wb_data, _generate_image_urls),
+    BenchCase('extract_products_with_pics', _parser_and_wb_data, _extract_products_with_pics),
+    BenchCase('merge', _merge_setup, _merge),
+    BenchCase('sort_products_by_sales', _mayak_and_products, _sort_products_by_sales),
+    BenchCase('format_products_table', _mayak_and_products, _format_products_table),
+    BenchCase('write_csv', make_merged_products, _write_csv),
+    # openpyxl держит всю книгу в памяти: миллион строк - десятки минут и гигабайты
+    BenchCase('products_to_xlsx_bytes', make_merged_products, _products_to_xlsx_bytes, max_size=10000),
+)}
+
+
+def result_key(name: str, size: int) -> str:
+    return f"{name}@{size}"
+
+
+def measure(case: BenchCase, size: int, repeat: int = 5) -> Dict[str, Any]:
+    """
+    Замеряет участок на size товаров
+
+    Args:
+        case: Участок
+        size: Количество товаров
+        repeat: Попыток замера времени (берётся лучшая; не больше, чем укладывается в MAX_CASE_TIME)
+
+    Returns:
+        {'size', 'seconds' (одна работа), 'items_per_sec', 'peak_bytes'}
+    """
+    state = case.setup(size)
+
+    # Сколько раз повторять работу в одной попытке, чтобы она длилась не меньше MIN_RUN_TIME
+    started = time.perf_counter()
+    case.run(state)
+    once = time.perf_counter() - started
+    loops = max(1, int(MIN_RUN_TIME / once) + 1) if once < MIN_RUN_TIME else 1
+
+    best = once
+    spent = once
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            if spent >= MAX_CASE_TIME:
+                break
+            started = time.perf_counter()
+            for _ in range(loops):
+                case.run(state)
+            elapsed = time.perf_counter() - started
+            spent += elapsed
+            best = min(best, elapsed / loops)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        case.run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'size': size, 'seconds': best, 'items_per_sec': size / best if best > 0 else None, 'peak_bytes': peak}
+
+
+def run_benchmarks(names: List[str], sizes: List[int], repeat: int = 5,
+                   on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Прогоняет участки names на объёмах sizes (объёмы больше max_size участка пропускаются)
+
+    Returns:
+        Результаты {"<участок>@<объём>": результат measure}
+    """
+    results = {}
+    for size in sizes:
+        for name in names:
+            case = BENCHMARKS[name]
+            if case.max_size is not None and size > case.max_size:
+                continue
+            result = measure(case, size, repeat)
+            results[result_key(name, size)] = result
+            if on_result:
+                on_result(result_key(name, size), result)
+            gc.collect()
+    make_wb_data.cache_clear()
+    make_merged_products.cache_clear()
+    return results
+
+
+def best_result(first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+    """Лучший из двух замеров одного участка: наибольшая пропускная способность и наименьший пик памяти"""
+    best = dict(first if (first['items_per_sec'] or 0) >= (second['items_per_sec'] or 0) else second)
+    best['peak_bytes'] = min(first['peak_bytes'], second['peak_bytes'])
+    return best
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            max_slowdown: float = DEFAULT_MAX_SLOWDOWN,
+            max_memory_growth: float = DEFAULT_MAX_MEMORY_GROWTH) -> List[str]:
+    """
+    Сравнивает результаты с базой
+
+    Args:
+        results: Текущие результаты
+        baseline: Результаты базы (участки, которых нет в базе, не сравниваются)
+        max_slowdown: Допустимое падение пропускной способности (0.25 - на 25%)
+        max_memory_growth: Допустимый рост пика памяти (0.25 - на 25%)
+
+    Returns:
+        Описания регрессий (пустой список - регрессий нет)
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if base.get('items_per_sec') and result.get('items_per_sec'):
+            ratio = result['items_per_sec'] / base['items_per_sec']
+            if ratio < 1 - max_slowdown:
+                regressions.append(f"{key}: пропускная способность {result['items_per_sec']:,.0f} товаров/сек, "
+                                   f"база {base['items_per_sec']:,.0f} ({(ratio - 1) * 100:+.0f}%)")
+        if base.get('peak_bytes') is not None:
+            growth = result['peak_bytes'] - base['peak_bytes']
+            if growth > MEMORY_NOISE_BYTES and result['peak_bytes'] > base['peak_bytes'] * (1 + max_memory_growth):
+                regressions.append(f"{key}: пик памяти {format_bytes(result['peak_bytes'])}, "
+                                   f"база {format_bytes(base['peak_bytes'])} "
+                                   f"({growth / max(base['peak_bytes'], 1) * 100:+.0f}%)")
+    return regressions
+
+
+def host_fingerprint() -> Dict[str, Any]:
+    """Отпечаток машины и интерпретатора, от которых зависят абсолютные замеры"""
+    return {
+        'node': platform.node(),
+        'system': platform.system(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'python': f"{platform.python_implementation()} {platform.python_version()}",
+    }
+
+
+def host_mismatch(baseline_host: Optional[Dict[str, Any]],
+                  current: Optional[Dict[str, Any]] = None) -> List[str]:
+    """
+    Отличия отпечатка машины базы от текущей
+
+    Args:
+        baseline_host: Отпечаток из файла базы (None - база без отпечатка)
+        current: Текущий отпечаток (по умолчанию host_fingerprint())
+
+    Returns:
+        Описания отличий; пустой список, если база снята на этой же машине
+    """
+    current = current or host_fingerprint()
+    if not baseline_host:
+        return ['отпечаток машины в базе отсутствует']
+    return [f"{key}: {baseline_host.get(key)!r} -> {value!r}"
+            for key, value in current.items() if baseline_host.get(key) != value]
+
+
+def _read_baseline(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, Any]]:
+    """Результаты из файла базы; пустой словарь, если файла нет"""
+    return _read_baseline(path).get('results', {})
+
+
+def load_baseline_host(path: str) -> Optional[Dict[str, Any]]:
+    """Отпечаток машины, на которой снята база; None, если его нет"""
+    return _read_baseline(path).get('host')
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, Any]]):
+    """
+    Сохраняет результаты как базу. Записи других участков и объёмов сохраняются,
+    если база снята на этой же машине, иначе заменяются
+    """
+    merged = load_baseline(path) if not host_mismatch(load_baseline_host(path)) else {}
+    merged.update(results)
+    data = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': host_fingerprint(),
+        'results': dict(sorted(merged.items())),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def format_bytes(value: float) -> str:
+    for unit in ('Б', 'КБ', 'МБ'):
+        if abs(value) < 1024:
+            return f"{value:.0f} {unit}"
+        value /= 1024
+    return f"{value:.1f} ГБ"
+
+
+def print_result(key: str, result: Dict[str, Any], base: Optional[Dict[str, Any]] = None):
+    line = (f"   {key:<36} {result['items_per_sec'] or 0:>14,.0f} товаров/сек "
+            f"{result['seconds'] * 1000:>11.2f} мс  пик {format_bytes(result['peak_bytes']):>8}")
+    if base and base.get('items_per_sec') and result.get('items_per_sec'):
+        line += f"  ({(result['items_per_sec'] / base['items_per_sec'] - 1) * 100:+.0f}% к базе)"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Микробенчмарки горячих участков с проверкой регрессий относительно базы',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--sizes', type=str, default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='Объёмы данных через запятую (по умолчанию: 100,10000,1000000)')
+    parser.add_argument('--cases', type=str,
+                        help=f"Участки через запятую (по умолчанию все: {', '.join(BENCHMARKS)})")
+    parser.add_argument('--repeat', type=int, default=5, help='Попыток замера времени (по умолчанию: 5)')
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE,
+                        help='Файл базы (по умолчанию: bench_baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Сохранить результаты как базу вместо сравнения')
+    parser.add_argument('--max-slowdown', type=float, default=DEFAULT_MAX_SLOWDOWN,
+                        help='Допустимое падение пропускной способности, доля (по умолчанию: 0.25)')
+    parser.add_argument('--max-memory-growth', type=float, default=DEFAULT_MAX_MEMORY_GROWTH,
+                        help='Допустимый рост пика памяти, доля (по умолчанию: 0.25)')
+    parser.add_argument('--confirm', type=int, default=2,
+                        help='Повторных замеров участка с регрессией (по умолчанию: 2)')
+    parser.add_argument('--ignore-host', action='store_true',
+                        help='Проверять регрессии, даже если база снята на другой машине')
+    parser.add_argument('--json', type=str, help='Сохранить результаты в JSON')
+    parser.add_argument('--verbose', action='store_true', help='Подробный лог (замедляет участки)')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    names = [name.strip() for name in args.cases.split(',')] if args.cases else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Неизвестные участки: {', '.join(unknown)}")
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+
+    baseline = {} if args.save_baseline else load_baseline(args.baseline)
+    mismatch = host_mismatch(load_baseline_host(args.baseline)) if baseline else []
+    gate = bool(baseline) and (not mismatch or args.ignore_host)
+    if mismatch:
+        print(f"⚠️  База {args.baseline} снята на другой машине ({'; '.join(mismatch)})")
+        print("   Сравнение только для сведения" if not gate else "   Регрессии проверяются (--ignore-host)")
+    print(f"⏱️  Участков: {len(names)}, объёмы: {', '.join(f'{size:,}' for size in sizes)}")
+    results = run_benchmarks(names, sizes, repeat=args.repeat,
+                             on_result=lambda key, result: print_result(key, result, baseline.get(key)))
+
+    if gate:
+        for _ in range(args.confirm):
+            suspects = [key for key in results if compare({key: results[key]}, baseline,
+                                                          args.max_slowdown, args.max_memory_growth)]
+            if not suspects:
+                break
+            print(f"🔁 Повторный замер: {', '.join(suspects)}")
+            for key in suspects:
+                name, size = key.rsplit('@', 1)
+                results[key] = best_result(results[key], measure(BENCHMARKS[name], int(size), args.repeat))
+                print_result(key, results[key], baseline.get(key))
+                gc.collect()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✅ Результаты сохранены: {args.json}")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print(f"✅ База сохранена: {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"⚠️  База {args.baseline} не найдена - сравнивать не с чем (--save-baseline, чтобы создать)")
+        return
+    if not gate:
+        print("\n⚠️  Регрессии не проверялись: сохраните базу на этой машине (--save-baseline)")
+        return
+
+    regressions = compare(results, baseline, args.max_slowdown, args.max_memory_growth)
+    if regressions:
+        print(f"\n❌ Регрессии ({len(regressions)}):")
+        for regression in regressions:
+            print(f"   {regression}")
+        raise SystemExit(1)
+    print("\n✅ Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ограниченный кэш с временем жизни записей (TTL) и вытеснением по LRU
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Нормализует поисковый запрос для ключа кэша: регистр, ё/е, лишние пробелы"""
+    return ' '.join(query.lower().replace('ё', 'е').split())
+
+
+class TTLCache:
+    """Потокобезопасный кэш на max_entries записей, каждая живёт ttl секунд"""
+
+    def __init__(self, max_entries: int = 64, ttl: float = 900, clock: Callable[[], float] = time.time):
+        """
+        Args:
+            max_entries: Максимальное количество записей (старые вытесняются)
+            ttl: Время жизни записи в секундах
+            clock: Источник времени
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get_with_time(key, count=False) is not None
+
+    def get_with_time(self, key: Hashable, count: bool = True) -> Optional[Tuple[Any, float]]:
+        """
+        Возвращает (значение, время сохранения) или None, если записи нет или она устарела
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[1], entry[0]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.get_with_time(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
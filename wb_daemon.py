@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Фоновый демон для wb_sales_parser.py
+
+Демон держит «тёплыми» импорты, WBParser/MayakAPI с общим пулом соединений,
+BasketResolver и хранилища изображений. wb_sales_parser.py при запуске пересылает
+аргументы демону через Unix сокет и выводит его stdout/stderr по мере поступления;
+если демон не запущен, команда выполняется в текущем процессе как обычно.
+
+    python3 wb_daemon.py serve          # запустить (в фоне: nohup python3 wb_daemon.py serve &)
+    python3 wb_daemon.py status
+    python3 wb_daemon.py stop
+
+Путь к сокету задаётся WB_DAEMON_SOCKET, отключить пересылку - WB_NO_DAEMON=1.
+Относительные пути аргументов и переменных IMAGE_CACHE_DIR, WB_QUERY_LOG считаются
+от каталога клиента, значения этих переменных берутся из окружения клиента; остальные
+настройки (WB_HTTP_BACKEND, MAYAK_* и т. п.) - из окружения демона.
+Модуль импортирует только стандартную библиотеку: клиентская часть не должна
+замедлять запуск CLI.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from typing import List, Dict, Any, Optional, TextIO
+
+# Настройка логирования
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_DATEFMT = '%H:%M:%S'
+logging.basicConfig(
+    level=logging.INFO,
+    format=LOG_FORMAT,
+    datefmt=LOG_DATEFMT
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = os.environ.get('WB_DAEMON_SOCKET') or os.path.join(
+    tempfile.gettempdir(), f"wb_daemon_{getattr(os, 'getuid', lambda: 0)()}.sock"
+)
+
+# Аргументы wb_sales_parser.py с путями: относительные пути считаются от каталога клиента
+PATH_ARGS = ('cookies_file', 'csv', 'xlsx', 'download_images', 'basket_cache')
+# Переменные окружения клиента, которые run() читает при каждом запуске
+CLIENT_ENV = ('IMAGE_CACHE_DIR', 'WB_QUERY_LOG')
+DEFAULT_IMAGE_DIR = 'images'
+
+MAX_WARM_PARSERS = 8
+WARM_MODULES = ('wb_sales_parser', 'wb_parser', 'wb_basket', 'wb_images', 'http_transport')
+
+
+def _connect(socket_path: str) -> Optional[socket.socket]:
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def _send_request(socket_path: str, request: Dict[str, Any],
+                  stdout: TextIO, stderr: TextIO) -> Optional[Dict[str, Any]]:
+    """Отправляет запрос демону и пересылает его вывод; None, если демон недоступен"""
+    sock = _connect(socket_path)
+    if sock is None:
+        return None
+
+    with sock, sock.makefile('rb') as reader:
+        sock.sendall(json.dumps(request, ensure_ascii=False).encode('utf-8') + b"\n")
+        for line in reader:
+            frame = json.loads(line)
+            stream = frame.get('stream')
+            if stream:
+                target = stdout if stream == 'out' else stderr
+                target.write(frame['data'])
+                target.flush()
+            else:
+                return frame
+
+    stderr.write("Соединение с демоном wb_daemon прервано\n")
+    return {'exit': 1}
+
+
+def forward_to_daemon(argv: List[str], socket_path: Optional[str] = None,
+                      stdout: Optional[TextIO] = None, stderr: Optional[TextIO] = None) -> Optional[int]:
+    """
+    Выполняет команду wb_sales_parser.py в демоне
+
+    Args:
+        argv: Аргументы командной строки
+        socket_path: Путь к сокету демона
+        stdout: Куда выводить stdout команды (по умолчанию sys.stdout)
+        stderr: Куда выводить stderr команды (по умолчанию sys.stderr)
+
+    Returns:
+        Код завершения команды или None, если демон не запущен
+    """
+    env = {name: os.environ[name] for name in CLIENT_ENV if name in os.environ}
+    request = {'argv': list(argv), 'cwd': os.getcwd(), 'env': env}
+    reply = _send_request(socket_path or DEFAULT_SOCKET, request, stdout or sys.stdout, stderr or sys.stderr)
+    return None if reply is None else reply.get('exit', 1)
+
+
+def send_command(command: str, socket_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Служебная команда демону (status, stop); None, если демон не запущен"""
+    return _send_request(socket_path or DEFAULT_SOCKET, {'command': command}, sys.stdout, sys.stderr)
+
+
+class ThreadLocalStream:
+    """
+    Поток вывода, который в потоках обработки запросов и запущенных из них потоках
+    (пулы загрузки изображений, проб basket, чанков Mayak) пишет клиенту, а в остальных -
+    в исходный поток
+    """
+
+    def __init__(self, fallback: TextIO):
+        self.fallback = fallback
+        self._local = threading.local()
+        self._inherited: 'weakref.WeakKeyDictionary[threading.Thread, TextIO]' = weakref.WeakKeyDictionary()
+
+    def bind(self, stream: Optional[TextIO]):
+        self._local.stream = stream
+
+    def inherit(self, thread: threading.Thread):
+        """Поток thread, запускаемый из текущего, будет писать туда же, куда и текущий"""
+        stream = self.bound
+        if stream is not None:
+            self._inherited[thread] = stream
+
+    @property
+    def bound(self) -> Optional[TextIO]:
+        stream = getattr(self._local, 'stream', None)
+        if stream is None:
+            stream = self._inherited.get(threading.current_thread())
+        # Долгоживущий поток пережил запустившую его команду: её клиенту больше не пишем
+        if stream is not None and getattr(stream, 'finished', False):
+            return None
+        return stream
+
+    @property
+    def target(self) -> TextIO:
+        return self.bound or self.fallback
+
+    def write(self, data: str) -> int:
+        return self.target.write(data)
+
+    def flush(self):
+        self.target.flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self.fallback, name)
+
+
+class ClientLogHandler(logging.Handler):
+    """Дублирует записи логов из потока обработки команды в stderr клиента"""
+
+    def __init__(self, stream: ThreadLocalStream):
+        super().__init__()
+        self.stream = stream
+
+    def emit(self, record: logging.LogRecord):
+        target = self.stream.bound
+        if target is not None:
+            try:
+                target.write(self.format(record) + "\n")
+            except Exception:
+                self.handleError(record)
+
+
+class SocketStream:
+    """Текстовый поток, отправляющий записи клиенту кадрами JSON"""
+
+    def __init__(self, wfile, name: str, lock: threading.Lock):
+        self.wfile = wfile
+        self.name = name
+        self._lock = lock
+        self.closed = False
+        self.finished = False
+
+    def write(self, data: str) -> int:
+        if data and not self.closed:
+            frame = json.dumps({'stream': self.name, 'data': data}, ensure_ascii=False).encode('utf-8') + b"\n"
+            with self._lock:
+                try:
+                    self.wfile.write(frame)
+                    self.wfile.flush()
+                except OSError:
+                    # Клиент отключился: команда доработает, вывод отбрасывается
+                    self.closed = True
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        """Команда завершена: вывод оставшихся после неё потоков идёт в лог демона"""
+        self.finished = True
+
+    def isatty(self) -> bool:
+        return False
+
+
+class WarmContext:
+    """Контекст для wb_sales_parser.run(), переиспользующий парсеры и хранилища между командами"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._transport = None
+        self._parsers: Dict[Any, Any] = {}
+        self._stores: Dict[str, Any] = {}
+        self._downloaders: Dict[Any, Any] = {}
+
+    def get_parser(self, mayak_cookies: List[str], basket_cache: Optional[str] = None):
+        from http_transport import default_transport
+        from wb_basket import BasketResolver
+        from wb_parser import WBParser
+
+        key = (tuple(mayak_cookies), basket_cache)
+        with self._lock:
+            wb_parser = self._parsers.get(key)
+            if wb_parser is None:
+                if self._transport is None:
+                    self._transport = default_transport()
+                wb_parser = WBParser(mayak_cookies=mayak_cookies, transport=self._transport)
+                if basket_cache:
+                    wb_parser.basket_resolver = BasketResolver(basket_cache, transport=self._transport)
+                self._parsers[key] = wb_parser
+                # После смены cookies старые парсеры не нужны
+                while len(self._parsers) > MAX_WARM_PARSERS:
+                    self._parsers.pop(next(iter(self._parsers)))
+            return wb_parser
+
+    def get_image_store(self, root: str):
+        from wb_images import ImageStore
+
+        with self._lock:
+            store = self._stores.get(root)
+            if store is None:
+                store = self._stores[root] = ImageStore(root)
+            return store
+
+    def get_image_downloader(self, root: str, max_workers: int, transport=None):
+        from wb_images import ImageDownloader
+
+        store = self.get_image_store(root)
+        with self._lock:
+            downloader = self._downloaders.get((root, max_workers))
+            if downloader is None:
+                downloader = ImageDownloader(store, transport=transport or self._transport, max_workers=max_workers)
+                self._downloaders[(root, max_workers)] = downloader
+            return downloader
+
+    @property
+    def parser_count(self) -> int:
+        return len(self._parsers)
+
+
+class ClientContext:
+    """WarmContext для одной команды: пути по умолчанию и переменные окружения клиента"""
+
+    def __init__(self, warm: WarmContext, cwd: str, env: Optional[Dict[str, str]] = None):
+        self.warm = warm
+        self.cwd = cwd
+        self.env = env or {}
+
+    def resolve(self, path: str) -> str:
+        return os.path.join(self.cwd, os.path.expanduser(path))
+
+    def get_parser(self, mayak_cookies: List[str], basket_cache: Optional[str] = None):
+        return self.warm.get_parser(mayak_cookies, basket_cache)
+
+    def get_image_store(self, root: str):
+        return self.warm.get_image_store(self.resolve(root))
+
+    def get_image_downloader(self, root: str, max_workers: int, transport=None):
+        return self.warm.get_image_downloader(self.resolve(root), max_workers, transport)
+
+    def image_dir(self) -> str:
+        return self.resolve(self.env.get('IMAGE_CACHE_DIR', DEFAULT_IMAGE_DIR))
+
+    def query_log(self):
+        from wb_query_log import QueryLog
+
+        return QueryLog.from_env(self.env, cwd=self.cwd)
+
+
+def resolve_paths(args: argparse.Namespace, cwd: str):
+    """Делает пути в аргументах абсолютными относительно каталога клиента"""
+    for name in PATH_ARGS:
+        value = getattr(args, name, None)
+        if value:
+            setattr(args, name, os.path.join(cwd, os.path.expanduser(value)))
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return
+        self.server.wb_daemon.handle(request, self.wfile)
+
+
+class WBDaemon:
+    """Демон, выполняющий команды wb_sales_parser.py в потоках на общем WarmContext"""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET):
+        self.socket_path = socket_path
+        self.context = WarmContext()
+        self.started_at = time.time()
+        self.requests = 0
+        self.active = 0
+        self._server: Optional[socketserver.ThreadingUnixStreamServer] = None
+        self._stdout: Optional[ThreadLocalStream] = None
+        self._stderr: Optional[ThreadLocalStream] = None
+        self._saved_streams = None
+        self._saved_thread_start = None
+        self._log_handler: Optional[ClientLogHandler] = None
+
+    def _send(self, wfile, frame: Dict[str, Any]):
+        try:
+            wfile.write(json.dumps(frame, ensure_ascii=False).encode('utf-8') + b"\n")
+            wfile.flush()
+        except OSError:
+            pass
+
+    def handle(self, request: Dict[str, Any], wfile):
+        command = request.get('command')
+        if command == 'status':
+            self._send(wfile, {'exit': 0, 'status': self.status()})
+        elif command == 'stop':
+            self._send(wfile, {'exit': 0})
+            threading.Thread(target=self.shutdown, daemon=True).start()
+        else:
+            self.requests += 1
+            self.active += 1
+            try:
+                exit_code = self.run_command(request.get('argv', []), request.get('cwd') or os.getcwd(), wfile,
+                                             request.get('env'))
+            finally:
+                self.active -= 1
+            self._send(wfile, {'exit': exit_code})
+
+    def run_command(self, argv: List[str], cwd: str, wfile, env: Optional[Dict[str, str]] = None) -> int:
+        """Выполняет wb_sales_parser.run() с выводом в сокет клиента"""
+        from wb_sales_parser import build_arg_parser, run
+
+        lock = threading.Lock()
+        streams = (SocketStream(wfile, 'out', lock), SocketStream(wfile, 'err', lock))
+        self._stdout.bind(streams[0])
+        self._stderr.bind(streams[1])
+        started = time.monotonic()
+        exit_code = 0
+        try:
+            arg_parser = build_arg_parser()
+            arg_parser.prog = 'wb_sales_parser.py'
+            args = arg_parser.parse_args(argv)
+            resolve_paths(args, cwd)
+            run(args, ClientContext(self.context, cwd, env))
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                exit_code = e.code
+            elif e.code is not None:
+                sys.stderr.write(f"{e.code}\n")
+                exit_code = 1
+        except Exception:
+            logger.exception("Ошибка выполнения команды")
+            exit_code = 1
+        finally:
+            for stream in streams:
+                stream.finish()
+            self._stdout.bind(None)
+            self._stderr.bind(None)
+        logger.info(f"Команда {argv} завершена с кодом {exit_code} за {time.monotonic() - started:.2f} сек")
+        return exit_code
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'pid': os.getpid(),
+            'uptime': round(time.time() - self.started_at, 1),
+            'requests': self.requests,
+            'active': self.active,
+            'parsers': self.context.parser_count,
+        }
+
+    def _install_streams(self):
+        """Подменяет sys.stdout/sys.stderr на потоко-локальные и направляет логи команд клиенту"""
+        self._saved_streams = (sys.stdout, sys.stderr)
+        self._stdout = ThreadLocalStream(sys.stdout)
+        self._stderr = ThreadLocalStream(sys.stderr)
+        sys.stdout, sys.stderr = self._stdout, self._stderr
+
+        # Собственный лог демона остаётся без изменений, клиент получает копию записей своей команды
+        self._log_handler = ClientLogHandler(self._stderr)
+        self._log_handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATEFMT))
+        logging.getLogger().addHandler(self._log_handler)
+
+        # Потоки, запущенные командой, наследуют её вывод
+        self._saved_thread_start = original_start = threading.Thread.start
+        streams = (self._stdout, self._stderr)
+
+        def start(thread: threading.Thread):
+            for stream in streams:
+                stream.inherit(thread)
+            original_start(thread)
+
+        threading.Thread.start = start
+
+    def _restore_streams(self):
+        threading.Thread.start = self._saved_thread_start
+        logging.getLogger().removeHandler(self._log_handler)
+        sys.stdout, sys.stderr = self._saved_streams
+
+    def bind(self):
+        """Создаёт сокет (доступный только владельцу); ошибка, если демон уже запущен"""
+        if os.path.exists(self.socket_path):
+            sock = _connect(self.socket_path)
+            if sock is not None:
+                sock.close()
+                raise RuntimeError(f"Демон уже запущен: {self.socket_path}")
+            os.unlink(self.socket_path)
+
+        old_umask = os.umask(0o177)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon_threads = True
+        self._server.wb_daemon = self
+
+    def serve_forever(self):
+        """Обрабатывает команды до вызова shutdown()"""
+        if self._server is None:
+            self.bind()
+
+        # Прогреваем тяжёлые импорты до первой команды
+        for module in WARM_MODULES:
+            importlib.import_module(module)
+
+        self._install_streams()
+        logger.info(f"Демон запущен: {self.socket_path} (pid {os.getpid()})")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._restore_streams()
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            logger.info("Демон остановлен")
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Фоновый демон для ускорения запусков wb_sales_parser.py',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('command', choices=['serve', 'status', 'stop'], help='Действие')
+    parser.add_argument(
+        '--socket',
+        type=str,
+        default=DEFAULT_SOCKET,
+        help=f'Путь к Unix сокету (по умолчанию: {DEFAULT_SOCKET})'
+    )
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        daemon = WBDaemon(args.socket)
+        try:
+            daemon.bind()
+        except (RuntimeError, OSError) as e:
+            logger.error(f"Не удалось запустить демон: {e}")
+            sys.exit(1)
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=daemon.shutdown).start())
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    reply = send_command(args.command, args.socket)
+    if reply is None:
+        print("Демон не запущен")
+        sys.exit(1)
+    if args.command == 'status':
+        for key, value in reply.get('status', {}).items():
+            print(f"{key}: {value}")
+    else:
+        print("Демон остановлен")
+
+
+if __name__ == "__main__":
+    main()
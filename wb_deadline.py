@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бюджет времени на запрос и частичные результаты
+
+Deadline передаётся вниз по цепочке WB -> Mayak: каждый HTTP запрос получает
+таймаут не больше оставшегося времени, а после истечения новые запросы не
+выполняются. Результат возвращается как ProductList - обычный список товаров
+с пометкой partial и кодами товаров, которые не успели обогатить.
+"""
+
+import time
+from typing import Any, Callable, Iterable, List, Optional, Union
+
+DEFAULT_TIMEOUT = 30.0
+# requests/urllib3 не принимают таймаут 0 (ValueError): если бюджет истёк между проверкой
+# is_expired и запросом, запрос получает минимальный таймаут и завершается ошибкой таймаута
+MIN_TIMEOUT = 0.01
+
+
+class Deadline:
+    """Момент, к которому запрос должен завершиться"""
+
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            seconds: Бюджет времени от текущего момента, сек
+            clock: Источник времени
+        """
+        self._clock = clock
+        self.seconds = seconds
+        self.expires_at = clock() + seconds
+
+    @classmethod
+    def after(cls, seconds: Optional[float]) -> Optional['Deadline']:
+        """Deadline через seconds секунд или None, если бюджет не задан (нет ограничения)"""
+        return cls(seconds) if seconds else None
+
+    def remaining(self) -> float:
+        """Оставшееся время, сек (не меньше 0)"""
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self._clock() >= self.expires_at
+
+    def timeout(self, default: float = DEFAULT_TIMEOUT) -> float:
+        """Таймаут HTTP запроса: default, но не больше оставшегося времени (и не меньше MIN_TIMEOUT)"""
+        return max(MIN_TIMEOUT, min(default, self.remaining()))
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining():.2f})"
+
+
+def request_timeout(deadline: Optional[Deadline], default: float = DEFAULT_TIMEOUT) -> float:
+    """Таймаут HTTP запроса с учётом необязательного deadline"""
+    return default if deadline is None else deadline.timeout(default)
+
+
+def is_expired(deadline: Optional[Deadline]) -> bool:
+    return deadline is not None and deadline.expired
+
+
+class ProductList(list):
+    """
+    Список товаров с пометкой о неполноте
+
+    Attributes:
+        partial: True, если часть товаров не обогащена (истёк deadline или запросы Mayak не удались)
+        missing_ids: Коды товаров, по которым нет данных Mayak
+    """
+
+    def __init__(self, products: Iterable[Any] = (), partial: bool = False,
+                 missing_ids: Optional[List[Union[int, str]]] = None):
+        super().__init__(products)
+        self.missing_ids: List[str] = [str(code) for code in missing_ids or []]
+        self.partial = partial or bool(self.missing_ids)
+
+    @classmethod
+    def like(cls, products: Iterable[Any], source: Any) -> 'ProductList':
+        """Новый список products с пометками source (если source - ProductList)"""
+        return cls(products, partial=getattr(source, 'partial', False),
+                   missing_ids=getattr(source, 'missing_ids', None))
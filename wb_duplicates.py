@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Поиск дублирующихся карточек (один товар под разными SKU) по перцептивному хэшу
+главного изображения
+
+Хэши (dHash) считаются в пуле процессов, индексируются в BK-дереве по расстоянию
+Хэмминга, поэтому поиск соседей не требует попарного сравнения всех изображений.
+Близкие карточки объединяются в группы с суммарными продажами.
+
+Требуется Pillow (pip install Pillow).
+"""
+
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HASH_SIZE = 8
+DEFAULT_MAX_DISTANCE = 6
+
+
+def dhash_file(path: str, hash_size: int = DEFAULT_HASH_SIZE) -> Optional[int]:
+    """
+    Вычисляет разностный перцептивный хэш (dHash) изображения
+
+    Args:
+        path: Путь к файлу изображения
+        hash_size: Размер хэша (hash_size * hash_size бит)
+
+    Returns:
+        Хэш в виде целого числа или None, если файл не читается
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError("Для поиска дубликатов по изображениям установите Pillow: pip install Pillow")
+
+    try:
+        with Image.open(path) as image:
+            pixels = list(image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не удалось прочитать изображение {path}: {e}")
+        return None
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def compute_hashes(paths: Dict[Any, str], workers: Optional[int] = None,
+                   hash_size: int = DEFAULT_HASH_SIZE) -> Dict[Any, int]:
+    """
+    Считает хэши изображений в пуле процессов
+
+    Args:
+        paths: Словарь {ключ (ID товара): путь к изображению}
+        workers: Количество процессов (по умолчанию по числу ядер)
+        hash_size: Размер хэша
+
+    Returns:
+        Словарь {ключ: хэш} для успешно прочитанных изображений
+    """
+    keys = list(paths)
+    if not keys:
+        return {}
+
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(keys) // (workers * 4))
+    # spawn: compute_hashes вызывается и из потоков демона, fork из многопоточного процесса небезопасен
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        values = executor.map(dhash_file, [paths[key] for key in keys],
+                              [hash_size] * len(keys), chunksize=chunksize)
+        hashes = {key: value for key, value in zip(keys, values) if value is not None}
+
+    logger.info(f"Вычислено {len(hashes)} перцептивных хэшей ({workers} процессов)")
+    return hashes
+
+
+class BKTree:
+    """BK-дерево для поиска хэшей в пределах расстояния Хэмминга"""
+
+    def __init__(self):
+        # Узел: [хэш, список элементов, {расстояние: дочерний узел}]
+        self._root = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: int, item: Any):
+        self._size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        Ищет элементы с хэшем на расстоянии не больше max_distance
+
+        Returns:
+            Список (расстояние, элемент)
+        """
+        if self._root is None:
+            return []
+
+        found = []
+        stack = [self._root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= max_distance:
+                found.extend((distance, item) for item in items)
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in children.items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+        return found
+
+
+def group_duplicates(products: List[Dict[str, Any]], hashes: Dict[str, int],
+                     max_distance: int = DEFAULT_MAX_DISTANCE) -> List[Dict[str, Any]]:
+    """
+    Группирует товары с близкими хэшами главного изображения
+
+    Args:
+        products: Товары (id, sales, revenue, ...)
+        hashes: Словарь {ID товара (строка): хэш}
+        max_distance: Максимальное расстояние Хэмминга для дубликатов
+
+    Returns:
+        Группы из 2 и более товаров, отсортированные по суммарным продажам:
+        {'ids', 'sales', 'revenue', 'products'}
+    """
+    by_id = {str(product.get('id')): product for product in products}
+    tree = BKTree()
+    for product_id, value in hashes.items():
+        if product_id in by_id:
+            tree.add(value, product_id)
+
+    parent = {product_id: product_id for product_id in hashes if product_id in by_id}
+
+    def find(product_id: str) -> str:
+        while parent[product_id] != product_id:
+            parent[product_id] = parent[parent[product_id]]
+            product_id = parent[product_id]
+        return product_id
+
+    for product_id in parent:
+        for _, neighbour in tree.search(hashes[product_id], max_distance):
+            root_a, root_b = find(product_id), find(neighbour)
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+    members: Dict[str, List[Dict[str, Any]]] = {}
+    for product_id in parent:
+        members.setdefault(find(product_id), []).append(by_id[product_id])
+
+    groups = []
+    for group_products in members.values():
+        if len(group_products) < 2:
+            continue
+        group_products.sort(key=lambda p: p.get('sales', 0), reverse=True)
+        groups.append({
+            'ids': [str(p.get('id')) for p in group_products],
+            'sales': sum(p.get('sales', 0) or 0 for p in group_products),
+            'revenue': sum(p.get('revenue', 0) or 0 for p in group_products),
+            'products': group_products,
+        })
+
+    groups.sort(key=lambda group: group['sales'], reverse=True)
+    logger.info(f"Найдено {len(groups)} групп дублирующихся карточек среди {len(parent)} товаров")
+    return groups
+
+
+def find_duplicate_listings(products: List[Dict[str, Any]], downloader,
+                            max_distance: int = DEFAULT_MAX_DISTANCE,
+                            workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Загружает главные изображения товаров и группирует дублирующиеся карточки
+
+    Args:
+        products: Товары с полем image_urls
+        downloader: wb_images.ImageDownloader
+        max_distance: Максимальное расстояние Хэмминга для дубликатов
+        workers: Количество процессов для вычисления хэшей
+
+    Returns:
+        Группы дубликатов (см. group_duplicates)
+    """
+    main_images = downloader.download_products(products, max_images=1)
+    paths = {product_id: images[0] for product_id, images in main_images.items() if images}
+    hashes = compute_hashes(paths, workers=workers)
+    return group_duplicates(products, hashes, max_distance=max_distance)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Экспорт товаров в Excel (.xlsx)
+
+Изображения в книге задаются одним из двух способов:
+- формулы =IMAGE("url"; 1) - книга маленькая, но картинки загружает Excel при открытии
+  (нужен свежий Excel и доступ в сеть);
+- встроенные миниатюры (embed_images=True) - первые N изображений товара загружаются,
+  уменьшаются до размера ячейки в пуле процессов (WorkbookPool, если передан) и
+  встраиваются в книгу, книга открывается быстро и без сети.
+
+Сборка книги openpyxl - чистый Python и занимает процессор. Для одновременных
+выгрузок (Telegram бот) её можно вынести в пул процессов WorkbookPool: в процесс
+передаются только компактные строки (ID, название, продажи, сумма, ссылки на
+изображения) и миниатюры, обратно возвращаются байты .xlsx.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Размер ячейки изображения в пикселях
+IMAGE_CELL_WIDTH = 180
+IMAGE_CELL_HEIGHT = 240
+DEFAULT_EMBED_IMAGES = 3
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', 'images')
+
+# Строка книги: (ID товара, название, продажи, сумма продаж, ссылки на изображения)
+WorkbookRow = Tuple[str, str, Any, Any, Tuple[str, ...]]
+
+
+def make_thumbnail(path: str, width: int = IMAGE_CELL_WIDTH, height: int = IMAGE_CELL_HEIGHT) -> Optional[bytes]:
+    """
+    Уменьшает изображение до размера ячейки (с сохранением пропорций) и кодирует в JPEG
+
+    Args:
+        path: Путь к исходному изображению
+        width: Максимальная ширина, px
+        height: Максимальная высота, px
+
+    Returns:
+        Содержимое JPEG или None, если изображение не читается
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image.thumbnail((width, height), Image.LANCZOS)
+            stream = io.BytesIO()
+            image.convert('RGB').save(stream, format='JPEG', quality=85, optimize=True)
+            return stream.getvalue()
+    except (OSError, ValueError) as e:
+        logger.warning(f"Не удалось уменьшить изображение {path}: {e}")
+        return None
+
+
+def build_thumbnails(products: List[Dict[str, Any]], images_per_product: int = DEFAULT_EMBED_IMAGES,
+                     downloader=None, workers: Optional[int] = None,
+                     pool: Optional['WorkbookPool'] = None) -> Dict[str, List[Optional[bytes]]]:
+    """
+    Загружает первые изображения товаров и уменьшает их в пуле процессов
+
+    Args:
+        products: Товары с полем image_urls
+        images_per_product: Сколько первых изображений брать у товара
+        downloader: wb_images.ImageDownloader (по умолчанию - хранилище IMAGE_CACHE_DIR)
+        workers: Количество процессов временного пула (если pool не передан)
+        pool: Долгоживущий WorkbookPool; без него на вызов создаётся временный пул (spawn)
+
+    Returns:
+        Словарь {ID товара: миниатюры JPEG по порядку}
+    """
+    if downloader is None:
+        from wb_images import ImageStore, ImageDownloader
+        downloader = ImageDownloader(ImageStore(IMAGE_CACHE_DIR))
+
+    downloaded = downloader.download_products(products, max_images=images_per_product)
+    paths = [path for product_paths in downloaded.values() for path in product_paths]
+    unique_paths = list(dict.fromkeys(paths))
+
+    thumbnails = {}
+    if unique_paths and pool is not None:
+        thumbnails = dict(zip(unique_paths, pool.make_thumbnails(unique_paths)))
+        logger.info(f"Подготовлено {len(thumbnails)} миниатюр (пул сборки .xlsx)")
+    elif unique_paths:
+        workers = workers or os.cpu_count() or 1
+        # spawn: fork из многопоточного процесса (загрузка изображений, бот) небезопасен
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            results = executor.map(make_thumbnail, unique_paths, chunksize=_chunksize(len(unique_paths), workers))
+            thumbnails = dict(zip(unique_paths, results))
+        logger.info(f"Подготовлено {len(thumbnails)} миниатюр ({workers} процессов)")
+
+    return {
+        product_id: [thumbnails.get(path) for path in product_paths]
+        for product_id, product_paths in downloaded.items()
+    }
+
+
+def _chunksize(count: int, workers: int) -> int:
+    return max(1, count // (workers * 4))
+
+
+def compact_rows(products: List[Dict[str, Any]], max_images: int) -> List[WorkbookRow]:
+    """Оставляет от товаров только поля, которые попадают в книгу"""
+    return [
+        (str(p.get('id', '')), p.get('name', ''), p.get('sales', 0), p.get('revenue', 0),
+         tuple((p.get('image_urls', []) or [])[:max_images]))
+        for p in products
+    ]
+
+
+def products_to_xlsx_bytes(products: List[Dict[str, Any]], embed_images: bool = False,
+                           images_per_product: int = DEFAULT_EMBED_IMAGES,
+                           downloader=None, workers: Optional[int] = None,
+                           pool: Optional['WorkbookPool'] = None) -> bytes:
+    """Готовит Excel (.xlsx) в памяти.
+    Колонки: Ссылка, Название, Количество продаж, Сумма продаж, Изображение 1..N
+    Высота строк ~240px, ширина колонок с изображениями ~180px.
+    С embed_images=True вместо формул IMAGE() встраиваются миниатюры первых
+    images_per_product изображений товара. С pool книга собирается и миниатюры
+    готовятся в пуле процессов.
+    """
+    # wb_metrics импортируется лениво: wb_export импортирует клиент CLI, который только
+    # пересылает аргументы демону, и ему не нужны requests и http.server
+    from wb_metrics import stage
+
+    with stage('xlsx_build'):
+        return _products_to_xlsx_bytes(products, embed_images, images_per_product, downloader, workers, pool)
+
+
+def _products_to_xlsx_bytes(products: List[Dict[str, Any]], embed_images: bool, images_per_product: int,
+                            downloader, workers: Optional[int], pool: Optional['WorkbookPool']) -> bytes:
+    thumbnails = None
+    if embed_images:
+        thumbnails = build_thumbnails(products, images_per_product, downloader=downloader, workers=workers,
+                                      pool=pool)
+
+    # Определяем максимальное число изображений
+    max_images = 0
+    for p in products:
+        imgs = p.get('image_urls', []) or []
+        if len(imgs) > max_images:
+            max_images = len(imgs)
+    if embed_images:
+        max_images = min(max_images, images_per_product)
+
+    rows = compact_rows(products, max_images)
+    if pool is not None:
+        return pool.serialize(rows, max_images, thumbnails)
+    return rows_to_xlsx_bytes(rows, max_images, thumbnails)
+
+
+def rows_to_xlsx_bytes(rows: List[WorkbookRow], max_images: int,
+                       thumbnails: Optional[Dict[str, List[Optional[bytes]]]] = None) -> bytes:
+    """
+    Собирает книгу из компактных строк (выполняется и в процессах WorkbookPool)
+
+    Args:
+        rows: Результат compact_rows
+        max_images: Количество колонок изображений
+        thumbnails: Миниатюры {ID товара: JPEG по порядку}; None - формулы IMAGE()
+
+    Returns:
+        Содержимое .xlsx
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    embed_images = thumbnails is not None
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "WB"
+
+    headers = ["Ссылка", "Название", "Количество продаж", "Сумма продаж"] + [f"Изображение {i}" for i in range(1, max_images + 1)]
+    ws.append(headers)
+    first_image_col = 5
+
+    for product_id, name, sales, revenue, images in rows:
+        url = f"https://www.wildberries.ru/catalog/{product_id}/detail.aspx" if product_id else ''
+        # Формируем строку без изображений
+        row = [url, name, sales, revenue]
+        if embed_images:
+            ws.append(row)
+            _embed_thumbnails(ws, thumbnails.get(product_id, []), ws.max_row, first_image_col)
+            continue
+        # Добавляем ячейки с формулами IMAGE()
+        for img in images:
+            # Формула Excel: =IMAGE("url"; 1)
+            row.append(f"=IMAGE(\"{img}\"; 1)")
+        # Если изображений меньше максимума — добиваем пустыми
+        if len(images) < max_images:
+            row += [""] * (max_images - len(images))
+        ws.append(row)
+
+    # Устанавливаем размеры: высота строк и ширина колонок
+    # Excel измеряет высоту в пунктах (~0.75 pt на пиксель при 96 DPI)
+    row_height_points = IMAGE_CELL_HEIGHT * 0.75  # ≈ 180 pt
+    for r in range(1, ws.max_row + 1):
+        ws.row_dimensions[r].height = row_height_points
+
+    # Ширина колонок: приблизим 180 px к ширине Excel (~ px/7)
+    image_col_width = round(IMAGE_CELL_WIDTH / 7.0, 2)  # ≈ 25.71
+
+    # Зададим разумные ширины для первых четырёх колонок
+    base_widths = [45, 50, 18, 18]
+    for idx, width in enumerate(base_widths, start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = width
+
+    # Колонки изображений начинаются с 5-й
+    for col_idx in range(first_image_col, first_image_col + max_images):
+        ws.column_dimensions[get_column_letter(col_idx)].width = image_col_width
+
+    stream = io.BytesIO()
+    wb.save(stream)
+    return stream.getvalue()
+
+
+class WorkbookPool:
+    """
+    Пул процессов для сборки книг и миниатюр: одновременные выгрузки используют несколько
+    ядер и не конкурируют за GIL с вызывающим процессом. Процессы создаются при первой
+    выгрузке методом spawn (fork из многопоточного процесса небезопасен).
+    """
+
+    def __init__(self, workers: int = 2):
+        """
+        Args:
+            workers: Количество процессов
+        """
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional['WorkbookPool']:
+        """Пул на XLSX_WORKERS процессов или None, если переменная не задана или 0"""
+        workers = int(os.getenv('XLSX_WORKERS', '0') or 0)
+        return cls(workers) if workers > 0 else None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                logger.info(f"Пул сборки .xlsx: {self.workers} процессов")
+            return self._executor
+
+    def submit(self, rows: List[WorkbookRow], max_images: int,
+               thumbnails: Optional[Dict[str, List[Optional[bytes]]]] = None) -> Future:
+        """Отправляет сборку книги в пул; результат Future - байты .xlsx"""
+        return self._get_executor().submit(rows_to_xlsx_bytes, rows, max_images, thumbnails)
+
+    def serialize(self, rows: List[WorkbookRow], max_images: int,
+                  thumbnails: Optional[Dict[str, List[Optional[bytes]]]] = None) -> bytes:
+        """Собирает книгу в пуле; если пул сломан (процесс убит), пересоздаёт его и собирает на месте"""
+        try:
+            return self.submit(rows, max_images, thumbnails).result()
+        except BrokenProcessPool as e:
+            logger.warning(f"Пул сборки .xlsx недоступен, собираем в текущем процессе: {e}")
+            self.shutdown()
+            return rows_to_xlsx_bytes(rows, max_images, thumbnails)
+
+    def make_thumbnails(self, paths: List[str]) -> List[Optional[bytes]]:
+        """Миниатюры изображений в пуле (make_thumbnail по порядку); если пул сломан - на месте"""
+        try:
+            return list(self._get_executor().map(make_thumbnail, paths,
+                                                  chunksize=_chunksize(len(paths), self.workers)))
+        except BrokenProcessPool as e:
+            logger.warning(f"Пул сборки .xlsx недоступен, миниатюры готовятся в текущем процессе: {e}")
+            self.shutdown()
+            return [make_thumbnail(path) for path in paths]
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _embed_thumbnails(ws, thumbnails: List[Optional[bytes]], row: int, first_col: int):
+    """Встраивает миниатюры в ячейки строки, начиная с колонки first_col"""
+    from openpyxl.drawing.image import Image as XLImage
+    from openpyxl.utils import get_column_letter
+
+    for offset, data in enumerate(thumbnails):
+        if not data:
+            continue
+        image = XLImage(io.BytesIO(data))
+        ws.add_image(image, f"{get_column_letter(first_col + offset)}{row}")
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Фильтры товаров по данным поиска WB (цена, рейтинг, отзывы, фото, бренд)
+
+Фильтр применяется к ответу WB до запросов к Mayak, поэтому данные о продажах
+запрашиваются только для товаров, которые могут попасть в итоговый результат.
+
+Пример выражения:
+    price >= 1000 and price <= 5000 and rating >= 4.5 and brand not in Zara|Mango
+"""
+
+import logging
+import operator
+import re
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def get_wb_price(product: Dict[str, Any]) -> Optional[float]:
+    """
+    Извлекает цену товара (в рублях) из данных поиска WB
+
+    Args:
+        product: Товар из ответа WB API
+
+    Returns:
+        Цена со скидкой или None, если цена не найдена
+    """
+    for size in product.get('sizes') or []:
+        price = (size or {}).get('price') or {}
+        value = price.get('product') or price.get('total')
+        if value:
+            return value / 100
+    value = product.get('salePriceU') or product.get('priceU')
+    if value:
+        return value / 100
+    return None
+
+
+def get_wb_rating(product: Dict[str, Any]) -> Optional[float]:
+    """Рейтинг товара по отзывам (reviewRating, иначе rating)"""
+    value = product.get('reviewRating')
+    if value is None:
+        value = product.get('rating')
+    return value
+
+
+def get_wb_feedbacks(product: Dict[str, Any]) -> Optional[int]:
+    """Количество отзывов о товаре"""
+    value = product.get('feedbacks')
+    if value is None:
+        value = product.get('nmFeedbacks')
+    return value
+
+
+def get_wb_brand(product: Dict[str, Any]) -> str:
+    """Бренд товара в нижнем регистре (для сравнения без учёта регистра)"""
+    return (product.get('brand') or '').strip().lower()
+
+
+FIELD_GETTERS = {
+    'price': get_wb_price,
+    'rating': get_wb_rating,
+    'feedbacks': get_wb_feedbacks,
+    'pics': lambda product: product.get('pics', 0),
+    'brand': get_wb_brand,
+}
+
+NUMERIC_OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '>': operator.gt,
+    '<': operator.lt,
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+CONDITION_RE = re.compile(
+    r'^\s*(?P<field>\w+)\s*(?P<op>>=|<=|==|!=|>|<|=|not\s+in\b|in\b)\s*(?P<value>.+?)\s*$',
+    re.IGNORECASE
+)
+
+Condition = Tuple[str, str, Any]
+
+
+class ProductFilter:
+    """Набор условий на поля товара WB; товар проходит, если выполнены все условия"""
+
+    def __init__(self,
+                 min_price: Optional[float] = None,
+                 max_price: Optional[float] = None,
+                 min_rating: Optional[float] = None,
+                 min_feedbacks: Optional[int] = None,
+                 min_pics: Optional[int] = None,
+                 brands: Optional[Iterable[str]] = None,
+                 exclude_brands: Optional[Iterable[str]] = None):
+        self.conditions: List[Condition] = []
+
+        if min_price is not None:
+            self.add_condition('price', '>=', min_price)
+        if max_price is not None:
+            self.add_condition('price', '<=', max_price)
+        if min_rating is not None:
+            self.add_condition('rating', '>=', min_rating)
+        if min_feedbacks is not None:
+            self.add_condition('feedbacks', '>=', min_feedbacks)
+        if min_pics is not None:
+            self.add_condition('pics', '>=', min_pics)
+        if brands:
+            self.add_condition('brand', 'in', brands)
+        if exclude_brands:
+            self.add_condition('brand', 'not in', exclude_brands)
+
+    def __bool__(self) -> bool:
+        return bool(self.conditions)
+
+    def __repr__(self) -> str:
+        return f"ProductFilter({self.describe()})"
+
+    def add_condition(self, field: str, op: str, value: Any) -> 'ProductFilter':
+        """
+        Добавляет условие
+
+        Args:
+            field: Поле (price, rating, feedbacks, pics, brand)
+            op: Оператор (>=, <=, >, <, =, !=, in, not in)
+            value: Значение; для in/not in - список значений
+
+        Returns:
+            Этот же фильтр (для цепочек вызовов)
+        """
+        field = field.lower()
+        op = ' '.join(op.lower().split())
+        if field not in FIELD_GETTERS:
+            raise ValueError(f"Неизвестное поле фильтра: {field}")
+
+        if op in ('in', 'not in'):
+            if isinstance(value, str):
+                value = value.split('|')
+            value = frozenset(str(v).strip().lower() for v in value if str(v).strip())
+        elif op in NUMERIC_OPERATORS:
+            if field == 'brand':
+                value = str(value).strip().lower()
+            else:
+                value = float(value)
+        else:
+            raise ValueError(f"Неизвестный оператор фильтра: {op}")
+
+        self.conditions.append((field, op, value))
+        return self
+
+    @classmethod
+    def from_expression(cls, expression: str) -> 'ProductFilter':
+        """
+        Создаёт фильтр из выражения вида "price >= 1000 and brand in Zara|Mango"
+
+        Args:
+            expression: Условия, разделённые "and"
+
+        Returns:
+            Фильтр
+        """
+        product_filter = cls()
+        for part in re.split(r'\s+and\s+', expression.strip(), flags=re.IGNORECASE):
+            if not part.strip():
+                continue
+            match = CONDITION_RE.match(part)
+            if not match:
+                raise ValueError(f"Некорректное условие фильтра: '{part}'")
+            product_filter.add_condition(match.group('field'), match.group('op'), match.group('value'))
+        return product_filter
+
+    def extend(self, other: 'ProductFilter') -> 'ProductFilter':
+        """Добавляет условия другого фильтра"""
+        self.conditions.extend(other.conditions)
+        return self
+
+    def matches(self, product: Dict[str, Any]) -> bool:
+        """
+        Проверяет товар WB на соответствие всем условиям
+
+        Args:
+            product: Товар из ответа WB API
+
+        Returns:
+            True, если товар проходит фильтр
+        """
+        for field, op, expected in self.conditions:
+            actual = FIELD_GETTERS[field](product)
+            if op == 'in':
+                if actual not in expected:
+                    return False
+            elif op == 'not in':
+                if actual in expected:
+                    return False
+            elif actual is None or not NUMERIC_OPERATORS[op](actual, expected):
+                # Товар без значения поля не проходит числовое условие
+                return False
+        return True
+
+    def apply(self, wb_products: Dict[int, Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """
+        Фильтрует результат extract_products_with_pics, сохраняя порядок выдачи WB
+
+        Args:
+            wb_products: Словарь {id: {pics, wb_data}}
+
+        Returns:
+            Отфильтрованный словарь
+        """
+        if not self.conditions:
+            return wb_products
+
+        filtered = {
+            product_id: info
+            for product_id, info in wb_products.items()
+            if self.matches(info.get('wb_data') or {'pics': info.get('pics', 0)})
+        }
+        logger.info(f"Фильтр ({self.describe()}): оставлено {len(filtered)} из {len(wb_products)} товаров")
+        return filtered
+
+    def describe(self) -> str:
+        parts = []
+        for field, op, value in self.conditions:
+            if isinstance(value, frozenset):
+                value = '|'.join(sorted(value))
+            elif isinstance(value, float) and value.is_integer():
+                value = int(value)
+            parts.append(f"{field} {op} {value}")
+        return ' and '.join(parts)
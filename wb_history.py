@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Компактное хранилище истории метрик товаров (sales, revenue, avg_price, lost_revenue)
+
+Каждая колонка хранится в отдельном файле фиксированной ширины (typed array),
+файлы читаются через mmap без копирования. Индекс "ID товара -> номера строк"
+строится при открытии хранилища по колонке product_id.
+
+Строки дописываются снимками (snapshot) в порядке неубывания времени, поэтому
+строки каждого товара упорядочены по времени и диапазон читается бинарным поиском.
+"""
+
+import logging
+import mmap
+import os
+import threading
+import time
+from array import array
+from typing import List, Dict, Any, Optional, Iterable
+
+logger = logging.getLogger(__name__)
+
+SECONDS_PER_DAY = 86400
+
+# Колонка -> typecode массива
+COLUMNS = {
+    'product_id': 'q',
+    'ts': 'q',
+    'sales': 'q',
+    'revenue': 'd',
+    'avg_price': 'd',
+    'lost_revenue': 'd',
+}
+METRIC_FIELDS = ('sales', 'revenue', 'avg_price', 'lost_revenue')
+
+
+class ProductHistoryStore:
+    """Колоночное хранилище истории метрик товаров, индексированное по ID товара"""
+
+    def __init__(self, path: str):
+        """
+        Открывает (или создаёт) хранилище в каталоге
+
+        Args:
+            path: Каталог с файлами колонок
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._maps: Dict[str, Any] = {}
+        self._index: Dict[int, array] = {}
+        self._rows = 0
+        self._last_ts: Optional[int] = None
+        self._load_index()
+
+    def _column_path(self, column: str) -> str:
+        return os.path.join(self.path, f"{column}.{COLUMNS[column]}")
+
+    def _load_index(self):
+        ids = array(COLUMNS['product_id'])
+        id_path = self._column_path('product_id')
+        if os.path.exists(id_path):
+            with open(id_path, 'rb') as f:
+                ids.frombytes(f.read())
+
+        # Обрезаем недописанные строки, если процесс упал посреди append
+        rows = len(ids)
+        for column, typecode in COLUMNS.items():
+            column_path = self._column_path(column)
+            size = os.path.getsize(column_path) if os.path.exists(column_path) else 0
+            rows = min(rows, size // array(typecode).itemsize)
+        if rows < len(ids):
+            logger.warning(f"Хранилище {self.path}: обрезано {len(ids) - rows} неполных строк")
+        for column, typecode in COLUMNS.items():
+            column_path = self._column_path(column)
+            if os.path.exists(column_path):
+                with open(column_path, 'r+b') as f:
+                    f.truncate(rows * array(typecode).itemsize)
+        del ids[rows:]
+
+        index: Dict[int, array] = {}
+        for row, product_id in enumerate(ids):
+            rows_array = index.get(product_id)
+            if rows_array is None:
+                rows_array = index[product_id] = array('q')
+            rows_array.append(row)
+
+        self._index = index
+        self._rows = rows
+        self._last_ts = self._column('ts')[rows - 1] if rows else None
+        logger.info(f"Открыто хранилище истории {self.path}: {rows} строк, {len(index)} товаров")
+
+    def _column(self, column: str) -> memoryview:
+        """Возвращает колонку как memoryview поверх mmap (только чтение)"""
+        mapping = self._maps.get(column)
+        if mapping is None:
+            typecode = COLUMNS[column]
+            size = self._rows * array(typecode).itemsize
+            if size == 0:
+                return memoryview(array(typecode))
+            with open(self._column_path(column), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            raw = memoryview(mapped)
+            mapping = self._maps[column] = (mapped, raw, raw.cast(typecode))
+        return mapping[2]
+
+    def _release_maps(self):
+        for mapped, raw, view in self._maps.values():
+            view.release()
+            raw.release()
+            mapped.close()
+        self._maps = {}
+
+    def close(self):
+        with self._lock:
+            self._release_maps()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def product_ids(self) -> List[int]:
+        return list(self._index)
+
+    def append_snapshot(self, products: Iterable[Dict[str, Any]], ts: Optional[int] = None) -> int:
+        """
+        Дописывает снимок метрик товаров
+
+        Args:
+            products: Товары в формате Mayak (id, sales, revenue, avg_price, lost_revenue)
+            ts: Время снимка (unix time, секунды); не меньше времени предыдущего снимка.
+                По умолчанию - текущее время
+
+        Returns:
+            Время записанного снимка
+        """
+        columns = {column: array(typecode) for column, typecode in COLUMNS.items()}
+        for product in products:
+            try:
+                product_id = int(product.get('id'))
+            except (TypeError, ValueError):
+                continue
+            columns['product_id'].append(product_id)
+            columns['sales'].append(int(product.get('sales') or 0))
+            for field in ('revenue', 'avg_price', 'lost_revenue'):
+                columns[field].append(float(product.get(field) or 0))
+
+        count = len(columns['product_id'])
+
+        with self._lock:
+            ts = int(time.time()) if ts is None else int(ts)
+            if not count:
+                return ts
+            if self._last_ts is not None and ts < self._last_ts:
+                raise ValueError(f"Время снимка {ts} меньше последнего записанного {self._last_ts}")
+
+            columns['ts'] = array(COLUMNS['ts'], [ts]) * count
+            self._release_maps()
+            for column, values in columns.items():
+                with open(self._column_path(column), 'ab') as f:
+                    values.tofile(f)
+
+            for offset, product_id in enumerate(columns['product_id']):
+                rows_array = self._index.get(product_id)
+                if rows_array is None:
+                    rows_array = self._index[product_id] = array('q')
+                rows_array.append(self._rows + offset)
+            self._rows += count
+            self._last_ts = ts
+
+        logger.info(f"В хранилище истории записано {count} товаров (ts={ts})")
+        return ts
+
+    def _row_range(self, product_id: int, start: Optional[int], end: Optional[int]) -> array:
+        rows = self._index.get(int(product_id))
+        if not rows:
+            return array('q')
+        ts_column = self._column('ts')
+
+        def lower_bound(value: int) -> int:
+            lo, hi = 0, len(rows)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if ts_column[rows[mid]] < value:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return lo
+
+        lo = lower_bound(start) if start is not None else 0
+        hi = lower_bound(end + 1) if end is not None else len(rows)
+        return rows[lo:hi]
+
+    def read_range(self, product_id: int, start: Optional[int] = None, end: Optional[int] = None,
+                   fields: Iterable[str] = METRIC_FIELDS) -> Dict[str, array]:
+        """
+        Читает историю товара за интервал времени [start, end]
+
+        Args:
+            product_id: ID товара
+            start: Начало интервала (unix time) или None
+            end: Конец интервала включительно (unix time) или None
+            fields: Метрики для чтения
+
+        Returns:
+            Словарь {'ts': array, <метрика>: array, ...}
+        """
+        with self._lock:
+            rows = self._row_range(product_id, start, end)
+            result = {}
+            for column in ('ts',) + tuple(fields):
+                source = self._column(column)
+                result[column] = array(COLUMNS[column], (source[row] for row in rows))
+            return result
+
+    def deltas(self, product_id: int, field: str = 'sales', start: Optional[int] = None,
+               end: Optional[int] = None) -> array:
+        """Разности метрики между соседними снимками товара"""
+        history = self.read_range(product_id, start, end, fields=(field,))
+        values = history[field]
+        return array('d', (float(b - a) for a, b in zip(values, values[1:])))
+
+    def velocity(self, product_id: int, field: str = 'sales', start: Optional[int] = None,
+                 end: Optional[int] = None) -> array:
+        """Скорость изменения метрики (в сутки) между соседними снимками товара"""
+        history = self.read_range(product_id, start, end, fields=(field,))
+        ts, values = history['ts'], history[field]
+        return array('d', (
+            (values[i + 1] - values[i]) * SECONDS_PER_DAY / (ts[i + 1] - ts[i])
+            for i in range(len(values) - 1)
+            if ts[i + 1] > ts[i]
+        ))
+
+    def _last_values_at(self, ts: int, field: str) -> Dict[int, Any]:
+        """Значения метрики на момент ts (последний снимок не позже ts) для всех товаров"""
+        ts_column = self._column('ts')
+        values = self._column(field)
+        result = {}
+        for product_id, rows in self._index.items():
+            lo, hi = 0, len(rows)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if ts_column[rows[mid]] <= ts:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo:
+                row = rows[lo - 1]
+                result[product_id] = (ts_column[row], values[row])
+        return result
+
+    def velocity_between(self, ts_from: int, ts_to: int, field: str = 'sales') -> Dict[int, float]:
+        """
+        Скорость изменения метрики (в сутки) между двумя моментами для всех товаров
+
+        Args:
+            ts_from: Начальный момент (unix time)
+            ts_to: Конечный момент (unix time)
+            field: Метрика
+
+        Returns:
+            Словарь {ID товара: изменение метрики в сутки}
+        """
+        with self._lock:
+            before = self._last_values_at(ts_from, field)
+            after = self._last_values_at(ts_to, field)
+
+        velocities = {}
+        for product_id, (ts_end, value_end) in after.items():
+            start = before.get(product_id)
+            if start is None:
+                continue
+            ts_start, value_start = start
+            if ts_end > ts_start:
+                velocities[product_id] = (value_end - value_start) * SECONDS_PER_DAY / (ts_end - ts_start)
+        return velocities
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Загрузка изображений товаров WB в локальное контентно-адресуемое хранилище
+
+Файлы сохраняются как objects/<2 символа>/<sha256>.<расширение>, одинаковые
+изображения (например, у перепродаваемых товаров) хранятся один раз.
+Журнал index.jsonl связывает URL с хэшем: при повторном запуске уже загруженные
+URL пропускаются, поэтому прерванную загрузку можно продолжить.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterable
+from urllib.parse import urlsplit
+
+import requests
+
+from http_transport import HttpTransport
+
+logger = logging.getLogger(__name__)
+
+IMAGE_HEADERS = {'Accept': 'image/avif,image/webp,image/*,*/*;q=0.8'}
+# Недописанный .part старше этого возраста (сек) остался от прерванного процесса;
+# более свежий может прямо сейчас записываться другим процессом с тем же хранилищем
+PARTIAL_FILE_MAX_AGE = 3600
+
+
+class ImageStore:
+    """Контентно-адресуемое хранилище изображений с журналом URL -> sha256"""
+
+    INDEX_FILE = 'index.jsonl'
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._by_url: Dict[str, str] = {}
+        self._load_index()
+        self._remove_partial_files()
+
+    def _load_index(self):
+        index_path = os.path.join(self.root, self.INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Недописанная последняя строка после аварийного завершения
+                    continue
+                path = os.path.join(self.root, record['path'])
+                if os.path.exists(path):
+                    self._by_url[record['url']] = record['path']
+        logger.info(f"Хранилище изображений {self.root}: {len(self._by_url)} загруженных URL")
+
+    def _remove_partial_files(self, max_age: float = PARTIAL_FILE_MAX_AGE):
+        """Удаляет .part файлы прерванных загрузок старше max_age секунд"""
+        now = time.time()
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for filename in filenames:
+                if not filename.endswith('.part'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    if now - os.path.getmtime(path) > max_age:
+                        os.remove(path)
+                except OSError:
+                    # Файл уже переименован или удалён другим процессом
+                    continue
+
+    def __len__(self) -> int:
+        return len(self._by_url)
+
+    def get(self, url: str) -> Optional[str]:
+        """Абсолютный путь к загруженному файлу или None"""
+        relative = self._by_url.get(url)
+        return os.path.join(self.root, relative) if relative else None
+
+    def put(self, url: str, content: bytes) -> str:
+        """
+        Сохраняет содержимое изображения
+
+        Args:
+            url: Исходный URL
+            content: Содержимое файла
+
+        Returns:
+            Абсолютный путь к файлу в хранилище
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        extension = posixpath.splitext(urlsplit(url).path)[1] or '.bin'
+        relative = os.path.join('objects', digest[:2], f"{digest}{extension}")
+        path = os.path.join(self.root, relative)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            if url not in self._by_url:
+                self._by_url[url] = relative
+                with open(os.path.join(self.root, self.INDEX_FILE), 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'url': url, 'path': relative, 'sha256': digest}) + '\n')
+        return path
+
+
+class ImageDownloader:
+    """Параллельная загрузка изображений с ограничением соединений на каждый basket"""
+
+    def __init__(self, store: ImageStore, transport: Optional[HttpTransport] = None,
+                 max_workers: int = 16, per_host: int = 4, timeout: float = 30, retries: int = 2):
+        """
+        Args:
+            store: Хранилище изображений
+            transport: HTTP транспорт (по умолчанию - пул на per_host соединений к каждому хосту)
+            max_workers: Общее количество одновременных загрузок
+            per_host: Одновременных загрузок с одного basket (соединения переиспользуются)
+            timeout: Таймаут запроса
+            retries: Повторы при ошибке
+        """
+        self.store = store
+        self.transport = transport or HttpTransport(pool_maxsize=per_host)
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self._host_slots: Dict[str, threading.Semaphore] = {}
+        self._slots_lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.Semaphore:
+        host = urlsplit(url).netloc
+        with self._slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.Semaphore(self.per_host)
+            return slot
+
+    def fetch(self, url: str) -> Optional[str]:
+        """Загружает одно изображение, возвращает путь в хранилище или None"""
+        path = self.store.get(url)
+        if path:
+            return path
+
+        for attempt in range(1, self.retries + 2):
+            try:
+                with self._host_slot(url):
+                    response = self.transport.get(url, headers=IMAGE_HEADERS, timeout=self.timeout)
+                if response.status_code == 404:
+                    logger.warning(f"Изображение не найдено: {url}")
+                    return None
+                response.raise_for_status()
+                return self.store.put(url, response.content)
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Ошибка загрузки {url} (попытка {attempt}): {e}")
+        return None
+
+    def download(self, urls: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Загружает изображения, уже загруженные пропускаются
+
+        Args:
+            urls: Ссылки на изображения
+
+        Returns:
+            Словарь {url: путь в хранилище или None при ошибке}
+        """
+        urls = list(dict.fromkeys(urls))
+        results = {url: self.store.get(url) for url in urls}
+        pending = [url for url, path in results.items() if path is None]
+        logger.info(f"Изображений: {len(urls)}, уже загружено: {len(urls) - len(pending)}, "
+                    f"к загрузке: {len(pending)}")
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='images') as executor:
+                for url, path in zip(pending, executor.map(self.fetch, pending)):
+                    results[url] = path
+
+        failed = sum(1 for path in results.values() if path is None)
+        if failed:
+            logger.warning(f"Не удалось загрузить {failed} изображений")
+        return results
+
+    def download_products(self, products: List[Dict[str, Any]],
+                          max_images: Optional[int] = None) -> Dict[str, List[str]]:
+        """
+        Загружает изображения товаров (поле image_urls)
+
+        Args:
+            products: Товары с полем image_urls
+            max_images: Сколько первых изображений загружать для товара (по умолчанию все)
+
+        Returns:
+            Словарь {ID товара: пути загруженных изображений по порядку}
+        """
+        per_product = {
+            str(product.get('id', '')): (product.get('image_urls') or [])[:max_images]
+            for product in products
+        }
+        paths = self.download(url for urls in per_product.values() for url in urls)
+        return {
+            product_id: [paths[url] for url in urls if paths.get(url)]
+            for product_id, urls in per_product.items()
+        }
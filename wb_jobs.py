@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Очередь заданий на SQLite и пул процессов-воркеров
+
+Задания (запросы WB) кладутся в файл SQLite; воркеры в отдельных процессах,
+в том числе на других хостах с общей файловой системой, берут задания в аренду
+(lease) на ограниченное время и продлевают её, пока работают. Если воркер упал,
+аренда истекает и задание забирает другой воркер, поэтому задания не теряются.
+Каждый воркер использует собственный WBParser, так что пропускная способность
+растёт с числом ядер.
+
+Примеры:
+    python3 wb_jobs.py enqueue --db jobs.db -q "куртка женская" -q "кроссовки" --max-products 50
+    python3 wb_jobs.py worker --db jobs.db --workers 4 --results-dir job_results
+    python3 wb_jobs.py status --db jobs.db
+
+Для файла очереди на сетевой ФС используйте --no-wal: режим WAL SQLite
+работает только в пределах одного хоста.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from typing import List, Dict, Any, Optional, Callable
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 3
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    query TEXT NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL,
+    result_path TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until);
+"""
+
+
+class IncompleteResult(Exception):
+    """Результат задания пустой или частичный: задание возвращается в очередь как неудачная попытка"""
+
+
+class Job:
+    """Задание, полученное воркером в аренду"""
+
+    def __init__(self, job_id: int, query: str, params: Dict[str, Any], attempts: int):
+        self.id = job_id
+        self.query = query
+        self.params = params
+        self.attempts = attempts
+
+    def __repr__(self) -> str:
+        return f"Job({self.id}, {self.query!r}, attempt={self.attempts})"
+
+
+class JobQueue:
+    """Долговечная очередь заданий в SQLite с арендой"""
+
+    def __init__(self, path: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, wal: bool = True,
+                 clock: Callable[[], float] = time.time):
+        """
+        Args:
+            path: Путь к файлу базы
+            lease_seconds: Длительность аренды задания (продлевается heartbeat)
+            max_attempts: Сколько раз задание выдаётся, прежде чем считается неудачным
+            wal: Режим WAL (только для локальной ФС)
+            clock: Источник времени (общий для всех хостов, поэтому time.time)
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        if wal:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _transaction(self):
+        """BEGIN IMMEDIATE: блокировка на запись берётся сразу, два воркера не получат одно задание"""
+        return _ImmediateTransaction(self._conn, self._lock)
+
+    def enqueue(self, query: str, **params) -> int:
+        """
+        Добавляет задание в очередь
+
+        Args:
+            query: Поисковый запрос
+            **params: page, max_products, filter (выражение ProductFilter)
+
+        Returns:
+            ID задания
+        """
+        now = self._clock()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (query, params, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (query, json.dumps(params, ensure_ascii=False), now, now)
+            )
+            return cursor.lastrowid
+
+    def lease(self, worker_id: str) -> Optional[Job]:
+        """
+        Берёт в аренду следующее задание: новое или с истёкшей арендой
+
+        Returns:
+            Задание или None, если очередь пуста
+        """
+        now = self._clock()
+        with self._transaction() as conn:
+            # Задания, исчерпавшие попытки и брошенные упавшим воркером
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = 'lease expired', lease_owner = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (STATUS_FAILED, now, STATUS_RUNNING, now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT id, query, params, attempts FROM jobs "
+                "WHERE status = ? OR (status = ? AND lease_until < ?) ORDER BY id LIMIT 1",
+                (STATUS_PENDING, STATUS_RUNNING, now)
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, query, params, attempts = row
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, lease_owner = ?, lease_until = ?, updated_at = ? "
+                "WHERE id = ?",
+                (STATUS_RUNNING, attempts + 1, worker_id, now + self.lease_seconds, now, job_id)
+            )
+        return Job(job_id, query, json.loads(params), attempts + 1)
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Продлевает аренду; False, если задание уже отдано другому воркеру"""
+        now = self._clock()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (now + self.lease_seconds, now, job_id, STATUS_RUNNING, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str, result_path: str) -> bool:
+        """Отмечает задание выполненным; False, если аренда потеряна"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result_path = ?, error = NULL, lease_owner = NULL, "
+                "lease_until = NULL, updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+                (STATUS_DONE, result_path, self._clock(), job_id, STATUS_RUNNING, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> bool:
+        """Возвращает задание в очередь или, если попытки исчерпаны, отмечает неудачным"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, "
+                "lease_owner = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (self.max_attempts, STATUS_FAILED, STATUS_PENDING, error, self._clock(),
+                 job_id, STATUS_RUNNING, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """Состояние задания"""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], row))
+
+    def stats(self) -> Dict[str, int]:
+        """Количество заданий по статусам"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in (STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED)}
+        counts.update(dict(rows))
+        return counts
+
+
+class _ImmediateTransaction:
+    def __init__(self, conn: sqlite3.Connection, lock: threading.Lock):
+        self._conn = conn
+        self._lock = lock
+
+    def __enter__(self) -> sqlite3.Connection:
+        self._lock.acquire()
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._lock.release()
+            raise
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self._lock.release()
+
+
+class JobWorker:
+    """Воркер: берёт задания из очереди, выполняет их на своём WBParser и сохраняет результат"""
+
+    def __init__(self, queue: JobQueue, parser, results_dir: str, worker_id: Optional[str] = None):
+        """
+        Args:
+            queue: Очередь заданий
+            parser: WBParser этого воркера
+            results_dir: Каталог для результатов (<job_id>.json)
+            worker_id: Идентификатор воркера (по умолчанию host:pid:случайный суффикс)
+        """
+        self.queue = queue
+        self.parser = parser
+        self.results_dir = results_dir
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        os.makedirs(results_dir, exist_ok=True)
+
+    def execute(self, job: Job) -> List[Dict[str, Any]]:
+        """
+        Выполняет запрос задания
+
+        Raises:
+            IncompleteResult: WB не вернул товаров (сбой поиска неотличим от пустой выдачи) или
+                часть товаров не обогащена Mayak, а попытки ещё остались
+        """
+        from wb_filters import ProductFilter
+
+        expression = job.params.get('filter')
+        products = self.parser.get_products_detailed_info_with_pics(
+            job.query,
+            page=job.params.get('page', 1),
+            max_products=job.params.get('max_products'),
+            product_filter=ProductFilter.from_expression(expression) if expression else None
+        )
+        if not products:
+            raise IncompleteResult("пустой результат поиска")
+        if getattr(products, 'partial', False):
+            message = f"частичный результат: не обогащено {len(products.missing_ids)} товаров"
+            if job.attempts < self.queue.max_attempts:
+                raise IncompleteResult(message)
+            # Последняя попытка: сохраняем то, что есть, с пометкой partial
+            logger.warning(f"[{self.worker_id}] Задание {job.id}: {message}, попытки исчерпаны")
+        return products
+
+    def write_result(self, job: Job, products: List[Dict[str, Any]]) -> str:
+        """Атомарно записывает результат; повторное выполнение задания перезаписывает файл"""
+        path = os.path.join(self.results_dir, f"{job.id}.json")
+        tmp_path = f"{path}.{self.worker_id.replace(':', '_')}.part"
+        record = {"job_id": job.id, "query": job.query, "params": job.params,
+                  "count": len(products), "partial": getattr(products, 'partial', False),
+                  "missing_ids": getattr(products, 'missing_ids', []), "products": products}
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+    def _heartbeat_loop(self, job: Job, done: threading.Event):
+        interval = max(1.0, self.queue.lease_seconds / 3)
+        while not done.wait(interval):
+            if not self.queue.heartbeat(job.id, self.worker_id):
+                logger.warning(f"Аренда задания {job.id} потеряна")
+                return
+
+    def run_once(self) -> bool:
+        """
+        Выполняет одно задание
+
+        Returns:
+            False, если очередь пуста
+        """
+        job = self.queue.lease(self.worker_id)
+        if job is None:
+            return False
+
+        logger.info(f"[{self.worker_id}] Задание {job.id}: '{job.query}' (попытка {job.attempts})")
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, args=(job, done), daemon=True)
+        heartbeat.start()
+        try:
+            products = self.execute(job)
+            path = self.write_result(job, products)
+        except Exception as e:
+            logger.error(f"[{self.worker_id}] Ошибка задания {job.id}: {e}")
+            self.queue.fail(job.id, self.worker_id, str(e))
+            return True
+        finally:
+            done.set()
+            heartbeat.join()
+
+        if self.queue.complete(job.id, self.worker_id, path):
+            logger.info(f"[{self.worker_id}] Задание {job.id} выполнено: {len(products)} товаров -> {path}")
+        else:
+            logger.warning(f"[{self.worker_id}] Задание {job.id} уже передано другому воркеру")
+        return True
+
+    def run(self, stop_event, poll_interval: float = 2.0, exit_when_empty: bool = False):
+        """Цикл воркера до установки stop_event"""
+        while not stop_event.is_set():
+            if not self.run_once():
+                if exit_when_empty:
+                    return
+                stop_event.wait(poll_interval)
+
+
+def worker_process(db_path: str, mayak_cookies: List[str], results_dir: str, lease_seconds: float,
+                   max_attempts: int, wal: bool, poll_interval: float, exit_when_empty: bool, stop_event):
+    """Точка входа процесса-воркера: собственные WBParser и соединение с базой"""
+    from wb_parser import WBParser
+
+    # Остановкой управляет родительский процесс через stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    queue = JobQueue(db_path, lease_seconds=lease_seconds, max_attempts=max_attempts, wal=wal)
+    try:
+        worker = JobWorker(queue, WBParser(mayak_cookies=mayak_cookies), results_dir)
+        worker.run(stop_event, poll_interval=poll_interval, exit_when_empty=exit_when_empty)
+    finally:
+        queue.close()
+
+
+def run_worker_pool(workers: int, db_path: str, mayak_cookies: List[str], results_dir: str,
+                    lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                    wal: bool = True, poll_interval: float = 2.0, exit_when_empty: bool = False):
+    """Запускает workers процессов-воркеров и ждёт их завершения (SIGINT/SIGTERM - мягкая остановка)"""
+    stop_event = multiprocessing.Event()
+    args = (db_path, mayak_cookies, results_dir, lease_seconds, max_attempts, wal,
+            poll_interval, exit_when_empty, stop_event)
+    processes = [
+        multiprocessing.Process(target=worker_process, args=args, name=f"wb-worker-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Запущено {workers} воркеров, очередь {db_path}")
+
+    def handle_signal(signum, frame):
+        logger.info("Получен сигнал остановки, воркеры завершают текущие задания...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    for process in processes:
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Очередь заданий WB на SQLite и пул процессов-воркеров',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--db', type=str, default='jobs.db', help='Файл очереди SQLite (по умолчанию: jobs.db)')
+    parser.add_argument('--no-wal', action='store_true', help='Не использовать WAL (очередь на сетевой ФС)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = subparsers.add_parser('enqueue', help='Добавить задания')
+    enqueue_parser.add_argument('-q', '--query', action='append', required=True, help='Поисковый запрос (можно несколько)')
+    enqueue_parser.add_argument('--page', type=int, default=1, help='Номер страницы (по умолчанию: 1)')
+    enqueue_parser.add_argument('--max-products', type=int, help='Максимальное количество товаров')
+    enqueue_parser.add_argument('--filter', type=str, help='Выражение фильтра, например "price >= 1000"')
+
+    worker_parser = subparsers.add_parser('worker', help='Запустить воркеры')
+    worker_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                               help='Количество процессов (по умолчанию: число ядер)')
+    worker_parser.add_argument('--cookies-file', type=str, default='cookies.txt',
+                               help='Файл с cookies для Mayak API (по умолчанию: cookies.txt)')
+    worker_parser.add_argument('--results-dir', type=str, default='job_results',
+                               help='Каталог результатов (по умолчанию: job_results)')
+    worker_parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS,
+                               help=f'Длительность аренды задания, сек (по умолчанию: {DEFAULT_LEASE_SECONDS})')
+    worker_parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                               help=f'Попыток на задание (по умолчанию: {DEFAULT_MAX_ATTEMPTS})')
+    worker_parser.add_argument('--exit-when-empty', action='store_true', help='Завершиться, когда очередь опустеет')
+
+    subparsers.add_parser('status', help='Статистика очереди')
+
+    args = parser.parse_args()
+    wal = not args.no_wal
+
+    if args.command == 'enqueue':
+        if args.filter:
+            from wb_filters import ProductFilter
+            try:
+                ProductFilter.from_expression(args.filter)
+            except ValueError as e:
+                logger.error(f"Ошибка в выражении фильтра: {e}")
+                sys.exit(1)
+        queue = JobQueue(args.db, wal=wal)
+        for query in args.query:
+            job_id = queue.enqueue(query, page=args.page, max_products=args.max_products, filter=args.filter)
+            print(f"{job_id}\t{query}")
+        queue.close()
+
+    elif args.command == 'worker':
+        try:
+            from mayak_api import load_cookie_sets
+            mayak_cookies = load_cookie_sets(args.cookies_file)
+            if not mayak_cookies:
+                logger.error("Файл с cookies пуст.")
+                sys.exit(1)
+        except FileNotFoundError:
+            logger.error(f"Файл с cookies не найден: {args.cookies_file}")
+            sys.exit(1)
+        run_worker_pool(args.workers, args.db, mayak_cookies, args.results_dir,
+                        lease_seconds=args.lease, max_attempts=args.max_attempts, wal=wal,
+                        exit_when_empty=args.exit_when_empty)
+
+    elif args.command == 'status':
+        queue = JobQueue(args.db, wal=wal)
+        for status, count in queue.stats().items():
+            print(f"{status}: {count}")
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочное тестирование воспроизведением журнала запросов
+
+Запросы из журнала (query_log.jsonl, см. wb_query_log.py; подходит любой JSONL
+с полями query и ts) воспроизводятся с исходными интервалами между ними
+(или ускоренными в --speed раз) против пайплайна бота (кэш результатов + сборка
+.xlsx) или библиотеки (WBParser.get_products_detailed_info_with_pics). WB и
+Mayak заменяются локальным сервером-заглушкой с заданной задержкой ответов,
+поэтому реальные API не нагружаются.
+
+Отчёт: пропускная способность, задержка в очереди (ожидание свободного
+обработчика), полное время ответа и доля попаданий в кэш.
+
+Использование:
+    python3 wb_loadgen.py --log query_log.jsonl --target bot --speed 60 --concurrency 1
+    python3 wb_loadgen.py --log query_log.jsonl --target library --concurrency 8 --accounts 3 --json report.json
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from mayak_api import MayakAPI
+from wb_cache import normalize_query
+from wb_parser import WBParser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GAP = 1.0
+STAND_IN_TOTAL = 1000
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Ответы в формате WB поиска (/search) и Mayak (/api/v1/wb/products)"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data: Any):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if parts.path == '/search':
+            self.server.stand_in.delay(self.server.stand_in.wb_latency)
+            self._send_json(self.server.stand_in.search_page(params.get('query', ''), int(params.get('page', 1))))
+        elif parts.path.rstrip('/').endswith('/wb/products'):
+            self.server.stand_in.delay(self.server.stand_in.mayak_latency)
+            self._send_json(self.server.stand_in.products(params.get('codes', '').split(',')))
+        else:
+            self.send_error(404)
+
+
+class StandInServer:
+    """Локальная заглушка WB и Mayak: детерминированная выдача по запросу, задержка ответов"""
+
+    def __init__(self, wb_latency: float = 0.2, mayak_latency: float = 0.3, host: str = '127.0.0.1', port: int = 0,
+                 seed: int = 0):
+        """
+        Args:
+            wb_latency: Средняя задержка ответа поиска WB, сек
+            mayak_latency: Средняя задержка ответа Mayak на чанк, сек
+            host: Адрес
+            port: Порт (0 - любой свободный)
+            seed: Зерно разброса задержек (от 0.5 до 1.5 средней)
+        """
+        self.wb_latency = wb_latency
+        self.mayak_latency = mayak_latency
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), StandInHandler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self, latency: float):
+        with self._rng_lock:
+            self.requests += 1
+            factor = self._rng.uniform(0.5, 1.5)
+        if latency > 0:
+            time.sleep(latency * factor)
+
+    @staticmethod
+    def search_page(query: str, page: int) -> Dict[str, Any]:
+        base = zlib.crc32(normalize_query(query).encode('utf-8')) % 10 ** 8 * 1000
+        start = (page - 1) * WBParser.PAGE_SIZE
+        ids = range(start, min(start + WBParser.PAGE_SIZE, STAND_IN_TOTAL))
+        return {
+            'total': STAND_IN_TOTAL,
+            'products': [{'id': 10 ** 8 + base + i, 'pics': 1 + i % 10, 'name': f"{query} {i}",
+                          'brand': f"Бренд {i % 7}"} for i in ids],
+        }
+
+    @staticmethod
+    def products(codes: List[str]) -> Dict[str, Any]:
+        products = {}
+        for code in codes:
+            if code:
+                sales = zlib.crc32(code.encode()) % 5000
+                products[code] = {'sales': sales, 'revenue': sales * 1500, 'avg_price': 1500}
+        return products
+
+    def start(self) -> 'StandInServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='stand-in', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def point_clients(self):
+        """Направляет WBParser и MayakAPI (всего процесса) на заглушку"""
+        WBParser.BASE_URL = f"{self.url}/search"
+        MayakAPI.BASE_URL = f"{self.url}/api/v1/"
+
+
+def load_schedule(path: str, limit: Optional[int] = None) -> List[Tuple[float, str]]:
+    """
+    Читает журнал запросов
+
+    Returns:
+        [(смещение от первого запроса в сек, запрос)] по времени; записи без ts
+        идут через DEFAULT_GAP секунд после предыдущей
+    """
+    entries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry, dict) and entry.get('query'):
+                entries.append(entry)
+
+    schedule = []
+    last_ts = None
+    for entry in entries:
+        ts = entry.get('ts')
+        if not isinstance(ts, (int, float)):
+            ts = (last_ts + DEFAULT_GAP) if last_ts is not None else 0.0
+        last_ts = ts
+        schedule.append((float(ts), entry['query']))
+
+    schedule.sort(key=lambda item: item[0])
+    if limit:
+        schedule = schedule[:limit]
+    if not schedule:
+        return []
+    first = schedule[0][0]
+    return [(ts - first, query) for ts, query in schedule]
+
+
+class LibraryTarget:
+    """Общий WBParser, как в HTTP API: кэш страниц выдачи и пул соединений на все запросы"""
+
+    name = 'library'
+
+    def __init__(self, mayak_cookies: List[str], max_products: int = 100):
+        self.parser = WBParser(mayak_cookies=mayak_cookies)
+        self.max_products = max_products
+
+    def __call__(self, query: str) -> int:
+        return len(self.parser.get_products_detailed_info_with_pics(query, max_products=self.max_products))
+
+    def cache_counters(self) -> Tuple[int, int]:
+        stats = self.parser.search_cache.stats() if self.parser.search_cache is not None else {}
+        return stats.get('hits', 0), stats.get('misses', 0)
+
+
+class BotTarget:
+    """Пайплайн Telegram бота: кэш результатов, затем поиск, обогащение и сборка .xlsx"""
+
+    name = 'bot'
+
+    def __init__(self, mayak_cookies: List[str]):
+        import tg_bot
+
+        self.bot = tg_bot
+        self.mayak_cookies = mayak_cookies
+
+    def __call__(self, query: str) -> int:
+        cached = self.bot.lookup_cached_result(query)
+        if cached is not None:
+            return len(cached.products)
+        result = self.bot.compute_query_result(query, self.mayak_cookies)
+        return len(result.products) if result is not None else 0
+
+    def cache_counters(self) -> Tuple[int, int]:
+        return self.bot.result_cache.hits, self.bot.result_cache.misses
+
+
+class Sample:
+    """Один воспроизведённый запрос: время прихода, начала и конца обработки (monotonic)"""
+
+    def __init__(self, query: str, arrival: float):
+        self.query = query
+        self.arrival = arrival
+        self.start = arrival
+        self.end = arrival
+        self.count = 0
+        self.error: Optional[str] = None
+
+    @property
+    def queue_delay(self) -> float:
+        return self.start - self.arrival
+
+    @property
+    def latency(self) -> float:
+        return self.end - self.arrival
+
+
+def replay(schedule: List[Tuple[float, str]], target: Callable[[str], int], concurrency: int = 1,
+           speed: float = 1.0) -> List[Sample]:
+    """
+    Воспроизводит запросы: каждый поступает в момент смещение / speed и ждёт свободного
+    из concurrency обработчиков
+
+    Returns:
+        Замеры по запросам в порядке поступления
+    """
+    if speed <= 0:
+        raise ValueError(f"Ускорение должно быть больше 0: {speed}")
+    samples: List[Sample] = []
+
+    def run_one(sample: Sample):
+        sample.start = time.monotonic()
+        try:
+            sample.count = target(sample.query)
+        except Exception as e:
+            sample.error = str(e)
+            logger.warning(f"Ошибка запроса '{sample.query}': {e}")
+        sample.end = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='replay') as executor:
+        started = time.monotonic()
+        for offset, query in schedule:
+            delay = started + offset / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            sample = Sample(query, time.monotonic())
+            samples.append(sample)
+            executor.submit(run_one, sample)
+    return samples
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Перцентиль p (0-100) методом ближайшего ранга; 0 для пустого списка"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def build_report(samples: List[Sample], cache_hits: int = 0, cache_misses: int = 0) -> Dict[str, Any]:
+    """Сводка по замерам: пропускная способность, очередь, время ответа, кэш"""
+    completed = [s for s in samples if s.error is None]
+    report: Dict[str, Any] = {'requests': len(samples), 'errors': len(samples) - len(completed)}
+    if not samples:
+        return report
+
+    duration = max(s.end for s in samples) - min(s.arrival for s in samples)
+    arrival_span = max(s.arrival for s in samples) - min(s.arrival for s in samples)
+    queue = [s.queue_delay for s in samples]
+    latency = [s.latency for s in completed]
+    service = [s.end - s.start for s in completed]
+    lookups = cache_hits + cache_misses
+    report.update({
+        'duration': round(duration, 3),
+        'offered_rate': round(len(samples) / arrival_span, 3) if arrival_span > 0 else None,
+        'throughput': round(len(completed) / duration, 3) if duration > 0 else None,
+        'queue_delay': {'p50': round(percentile(queue, 50), 3), 'p95': round(percentile(queue, 95), 3),
+                        'max': round(max(queue), 3)},
+        'latency': {'p50': round(percentile(latency, 50), 3), 'p95': round(percentile(latency, 95), 3),
+                    'p99': round(percentile(latency, 99), 3)},
+        'service_time_avg': round(sum(service) / len(service), 3) if service else None,
+        'cache_hit_rate': round(cache_hits / lookups, 3) if lookups else None,
+        'products_avg': round(sum(s.count for s in completed) / len(completed), 1) if completed else 0,
+    })
+    return report
+
+
+def print_report(report: Dict[str, Any], target: str, concurrency: int, speed: float):
+    print(f"\n📊 Воспроизведение: {report['requests']} запросов, цель {target}, "
+          f"обработчиков {concurrency}, ускорение x{speed:g}")
+    if not report['requests']:
+        return
+    offered = report['offered_rate']
+    print(f"   Длительность:        {report['duration']:.1f} сек")
+    print(f"   Поступление:         {offered:.2f} запр/сек" if offered else "   Поступление:         -")
+    print(f"   Пропускная способн.: {report['throughput'] or 0:.2f} запр/сек")
+    print(f"   Ожидание в очереди:  p50 {report['queue_delay']['p50']:.2f}, p95 {report['queue_delay']['p95']:.2f}, "
+          f"max {report['queue_delay']['max']:.2f} сек")
+    print(f"   Время ответа:        p50 {report['latency']['p50']:.2f}, p95 {report['latency']['p95']:.2f}, "
+          f"p99 {report['latency']['p99']:.2f} сек")
+    hit_rate = report['cache_hit_rate']
+    print(f"   Попадания в кэш:     {hit_rate * 100:.0f}%" if hit_rate is not None else "   Попадания в кэш:     -")
+    print(f"   Ошибок:              {report['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Нагрузочный тест: воспроизведение журнала запросов против локальных заглушек WB и Mayak',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--log', type=str, required=True, help='Журнал запросов (JSONL с полями query и ts)')
+    parser.add_argument('--target', choices=('bot', 'library'), default='bot',
+                        help='Что нагружать: пайплайн бота или WBParser (по умолчанию: bot)')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Во сколько раз ускорить поступление запросов (по умолчанию: 1 - исходные интервалы)')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Одновременно обрабатываемых запросов (бот по умолчанию обрабатывает по одному)')
+    parser.add_argument('--limit', type=int, help='Воспроизвести только первые N запросов')
+    parser.add_argument('--accounts', type=int, default=1, help='Аккаунтов Mayak (пул при > 1, по умолчанию: 1)')
+    parser.add_argument('--max-products', type=int, default=100,
+                        help='Товаров на запрос для цели library (по умолчанию: 100)')
+    parser.add_argument('--wb-latency', type=float, default=0.2, help='Задержка заглушки WB, сек (по умолчанию: 0.2)')
+    parser.add_argument('--mayak-latency', type=float, default=0.3,
+                        help='Задержка заглушки Mayak на чанк, сек (по умолчанию: 0.3)')
+    parser.add_argument('--json', type=str, help='Сохранить отчёт в JSON')
+    parser.add_argument('--verbose', action='store_true', help='Подробный лог пайплайна')
+    args = parser.parse_args()
+    if args.speed <= 0:
+        parser.error("--speed должен быть больше 0")
+    if args.concurrency < 1:
+        parser.error("--concurrency должен быть не меньше 1")
+
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    schedule = load_schedule(args.log, limit=args.limit)
+    if not schedule:
+        print(f"В журнале {args.log} нет запросов")
+        raise SystemExit(1)
+
+    stand_in = StandInServer(wb_latency=args.wb_latency, mayak_latency=args.mayak_latency).start()
+    stand_in.point_clients()
+    cookies = [f"sid=loadgen{i}" for i in range(1, args.accounts + 1)]
+    try:
+        target = BotTarget(cookies) if args.target == 'bot' else LibraryTarget(cookies, args.max_products)
+        hits_before, misses_before = target.cache_counters()
+        print(f"🚀 {len(schedule)} запросов за {schedule[-1][0] / args.speed:.1f} сек, заглушка {stand_in.url}")
+        samples = replay(schedule, target, concurrency=args.concurrency, speed=args.speed)
+        hits, misses = target.cache_counters()
+    finally:
+        stand_in.stop()
+
+    report = build_report(samples, hits - hits_before, misses - misses_before)
+    report.update({'target': args.target, 'concurrency': args.concurrency, 'speed': args.speed,
+                   'accounts': args.accounts, 'stand_in_requests': stand_in.requests})
+    print_report(report, args.target, args.concurrency, args.speed)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ Отчёт сохранён: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
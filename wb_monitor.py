@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+WB Monitor - долгоживущий режим мониторинга списка запросов (watchlist)
+
+Вместо запуска wb_sales_parser.py из cron на каждый запрос монитор держит
+один "тёплый" WBParser (и MayakAPI внутри него), планирует запросы по их
+интервалам с джиттером и ограничивает общее число одновременных запросов.
+
+Формат watchlist (JSON):
+{
+  "defaults": {"interval": 3600, "max_products": 20},
+  "queries": [
+    {"query": "куртка женская черная", "interval": 1800},
+    {"query": "кроссовки", "filter": "price >= 2000 and rating >= 4.5"},
+    "платье летнее"
+  ]
+}
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Set
+
+from wb_parser import WBParser
+from mayak_api import load_cookie_sets
+from wb_history import ProductHistoryStore
+from wb_filters import ProductFilter
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 3600
+DEFAULT_MAX_PRODUCTS = 20
+
+
+class WatchItem:
+    """Запрос из watchlist с собственным интервалом обновления"""
+
+    def __init__(self, query: str, interval: float = DEFAULT_INTERVAL,
+                 max_products: Optional[int] = DEFAULT_MAX_PRODUCTS, page: int = 1,
+                 product_filter: Optional[ProductFilter] = None):
+        if interval <= 0:
+            raise ValueError(f"Интервал для запроса '{query}' должен быть положительным")
+        self.query = query
+        self.interval = float(interval)
+        self.max_products = max_products
+        self.page = page
+        self.product_filter = product_filter
+
+    def __repr__(self) -> str:
+        return f"WatchItem({self.query!r}, interval={self.interval:g})"
+
+
+def load_watchlist(path: str) -> List[WatchItem]:
+    """
+    Загружает watchlist из JSON файла
+
+    Args:
+        path: Путь к файлу watchlist
+
+    Returns:
+        Список запросов для мониторинга
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if isinstance(data, list):
+        data = {"queries": data}
+
+    defaults = data.get("defaults", {})
+    default_interval = defaults.get("interval", DEFAULT_INTERVAL)
+    default_max_products = defaults.get("max_products", DEFAULT_MAX_PRODUCTS)
+
+    items = []
+    seen = set()
+    for entry in data.get("queries", []):
+        if isinstance(entry, str):
+            entry = {"query": entry}
+        query = (entry.get("query") or '').strip()
+        if not query:
+            logger.warning(f"Пропущена запись watchlist без запроса: {entry}")
+            continue
+        if query in seen:
+            logger.warning(f"Дубликат запроса в watchlist пропущен: '{query}'")
+            continue
+        seen.add(query)
+        items.append(WatchItem(
+            query=query,
+            interval=entry.get("interval", default_interval),
+            max_products=entry.get("max_products", default_max_products),
+            page=entry.get("page", 1),
+            product_filter=ProductFilter.from_expression(entry["filter"]) if entry.get("filter") else None,
+        ))
+
+    logger.info(f"Загружено {len(items)} запросов из watchlist: {path}")
+    return items
+
+
+class QueryScheduler:
+    """
+    Планировщик запросов: очередь с приоритетом по времени следующего запуска.
+
+    Первые запуски равномерно распределяются на отрезке spread секунд,
+    следующие - через interval с джиттером +-jitter (доля интервала),
+    чтобы запросы с одинаковым интервалом не совпадали по времени.
+    """
+
+    def __init__(self, items: List[WatchItem], jitter: float = 0.1, spread: float = 60.0,
+                 now: Optional[float] = None, rng: Optional[random.Random] = None):
+        self.jitter = max(0.0, jitter)
+        self._rng = rng or random.Random()
+        self._counter = itertools.count()
+        self._heap = []
+
+        now = time.monotonic() if now is None else now
+        count = len(items)
+        for index, item in enumerate(items):
+            offset = spread * index / count if count else 0.0
+            self.schedule(item, now + offset)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, item: WatchItem, run_at: float):
+        heapq.heappush(self._heap, (run_at, next(self._counter), item))
+
+    def reschedule(self, item: WatchItem, now: float) -> float:
+        """Планирует следующий запуск запроса, возвращает время запуска"""
+        delay = item.interval * (1 + self._rng.uniform(-self.jitter, self.jitter))
+        run_at = now + max(0.0, delay)
+        self.schedule(item, run_at)
+        return run_at
+
+    def next_run_time(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> Optional[WatchItem]:
+        """Извлекает запрос, время которого уже наступило"""
+        if self._heap and self._heap[0][0] <= now:
+            return heapq.heappop(self._heap)[2]
+        return None
+
+
+def query_slug(query: str) -> str:
+    """Формирует безопасное имя файла из запроса"""
+    slug = re.sub(r'[^\w-]+', '_', query.strip().lower()).strip('_')
+    return slug[:80] or 'query'
+
+
+class WatchlistMonitor:
+    """Долгоживущий монитор: выполняет запросы watchlist с общим лимитом параллельности"""
+
+    def __init__(self, parser: WBParser, items: List[WatchItem], output_dir: str,
+                 concurrency: int = 2, jitter: float = 0.1, spread: float = 60.0,
+                 history: Optional[ProductHistoryStore] = None):
+        if concurrency < 1:
+            raise ValueError("concurrency должен быть >= 1")
+        self.parser = parser
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.history = history
+        self.scheduler = QueryScheduler(items, jitter=jitter, spread=spread)
+        self._stop = threading.Event()
+        self._in_flight: Dict[Future, WatchItem] = {}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def stop(self):
+        self._stop.set()
+
+    def run_query(self, item: WatchItem) -> List[Dict[str, Any]]:
+        """Выполняет один запрос watchlist на общем парсере"""
+        return self.parser.get_products_detailed_info_with_pics(
+            item.query,
+            page=item.page,
+            max_products=item.max_products,
+            product_filter=item.product_filter
+        )
+
+    def persist(self, item: WatchItem, products: List[Dict[str, Any]], started_at: datetime,
+                duration: float):
+        """Дописывает результат запроса в файл <output_dir>/<slug>.jsonl (с признаком partial)"""
+        record = {
+            "query": item.query,
+            "timestamp": started_at.isoformat(timespec='seconds'),
+            "duration": round(duration, 3),
+            "count": len(products),
+            "partial": getattr(products, 'partial', False),
+            "missing_ids": getattr(products, 'missing_ids', []),
+            "products": products,
+        }
+        path = os.path.join(self.output_dir, f"{query_slug(item.query)}.jsonl")
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        logger.info(f"Сохранено {len(products)} товаров для запроса '{item.query}' в {path}")
+
+    def _execute(self, item: WatchItem):
+        started_at = datetime.now()
+        started = time.monotonic()
+        products = self.run_query(item) or []
+        self.persist(item, products, started_at, time.monotonic() - started)
+        if self.history is None:
+            return
+        if getattr(products, 'partial', False):
+            # Неполный снимок исказил бы скорость продаж и изменения между снимками
+            logger.warning(f"Частичный результат запроса '{item.query}' не записан в историю метрик: "
+                           f"не обогащено {len(products.missing_ids)} товаров")
+            return
+        self.history.append_snapshot(products)
+
+    def _collect_finished(self, done: Set[Future]):
+        now = time.monotonic()
+        for future in done:
+            item = self._in_flight.pop(future)
+            error = future.exception()
+            if error:
+                logger.error(f"Ошибка при обработке запроса '{item.query}': {error}")
+            # Следующий запуск отсчитывается от завершения, поэтому один запрос
+            # никогда не выполняется параллельно сам с собой
+            self.scheduler.reschedule(item, now)
+
+    def run(self):
+        """Главный цикл монитора, работает до вызова stop()"""
+        logger.info(f"Монитор запущен: {len(self.scheduler)} запросов, "
+                    f"параллельность {self.concurrency}")
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='monitor') as executor:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                while len(self._in_flight) < self.concurrency:
+                    item = self.scheduler.pop_due(now)
+                    if item is None:
+                        break
+                    logger.info(f"Запуск запроса '{item.query}'")
+                    self._in_flight[executor.submit(self._execute, item)] = item
+
+                next_run = self.scheduler.next_run_time()
+                timeout = 1.0 if next_run is None else min(1.0, max(0.0, next_run - now))
+                if len(self._in_flight) >= self.concurrency:
+                    timeout = 1.0
+
+                if self._in_flight:
+                    done, _ = wait(list(self._in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+                    self._collect_finished(done)
+                else:
+                    self._stop.wait(timeout)
+
+            if self._in_flight:
+                logger.info(f"Ожидание завершения {len(self._in_flight)} запросов...")
+                done, _ = wait(list(self._in_flight))
+                self._collect_finished(done)
+        logger.info("Монитор остановлен")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Мониторинг списка запросов WB с периодическим обновлением',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        '-w', '--watchlist',
+        type=str,
+        required=True,
+        help='JSON файл со списком запросов и интервалами'
+    )
+    parser.add_argument(
+        '--cookies-file',
+        type=str,
+        default='cookies.txt',
+        help='Файл с cookies для Mayak API (по умолчанию: cookies.txt)'
+    )
+    parser.add_argument(
+        '--output-dir',
+        type=str,
+        default='monitor_results',
+        help='Каталог для сохранения результатов (по умолчанию: monitor_results)'
+    )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=2,
+        help='Максимум одновременно выполняемых запросов (по умолчанию: 2)'
+    )
+    parser.add_argument(
+        '--jitter',
+        type=float,
+        default=0.1,
+        help='Джиттер интервала, доля от интервала (по умолчанию: 0.1)'
+    )
+    parser.add_argument(
+        '--spread',
+        type=float,
+        default=60.0,
+        help='За сколько секунд равномерно распределить первые запуски (по умолчанию: 60)'
+    )
+    parser.add_argument(
+        '--history-dir',
+        type=str,
+        help='Каталог хранилища истории метрик (sales, revenue, avg_price, lost_revenue)'
+    )
+
+    args = parser.parse_args()
+
+    try:
+        mayak_cookies = load_cookie_sets(args.cookies_file)
+        if not mayak_cookies:
+            logger.error("Файл с cookies пуст.")
+            sys.exit(1)
+    except FileNotFoundError:
+        logger.error(f"Файл с cookies не найден: {args.cookies_file}")
+        sys.exit(1)
+
+    try:
+        items = load_watchlist(args.watchlist)
+    except (OSError, ValueError) as e:
+        logger.error(f"Ошибка при чтении watchlist: {e}")
+        sys.exit(1)
+
+    if not items:
+        logger.error("Watchlist пуст.")
+        sys.exit(1)
+
+    monitor = WatchlistMonitor(
+        WBParser(mayak_cookies=mayak_cookies),
+        items,
+        output_dir=args.output_dir,
+        concurrency=args.concurrency,
+        jitter=args.jitter,
+        spread=args.spread,
+        history=ProductHistoryStore(args.history_dir) if args.history_dir else None,
+    )
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: monitor.stop())
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        monitor.stop()
+
+
+if __name__ == "__main__":
+    main()
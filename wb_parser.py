@@ -5,12 +5,21 @@ WildBerries Parser
 Программа для парсинга товаров с WildBerries через их API
 """
 
+import os
 import requests
 import json
 import urllib.parse
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Union, Tuple
 import logging
-from mayak_api import MayakAPI
+from concurrent.futures import ThreadPoolExecutor
+from mayak_pool import create_mayak_client
+from http_transport import HttpTransport, default_transport
+from wb_basket import BasketResolver, get_basket_host
+from wb_filters import ProductFilter
+from wb_batch import EnrichmentBatch
+from wb_deadline import Deadline, ProductList, is_expired, request_timeout
+from wb_search_cache import SearchPageCache, DEFAULT_TTL, DEFAULT_MAX_PREFETCH
+from wb_metrics import timed, upstream_call
 
 # Настройка логирования
 logging.basicConfig(
@@ -25,6 +34,9 @@ class WBParser:
 
     BASE_URL = "https://search.wb.ru/exactmatch/ru/common/v18/search"
 
+    # Товаров на странице выдачи
+    PAGE_SIZE = 100
+
     DEFAULT_PARAMS = {
         "ab_testing": "false",
         "appType": "64",
@@ -40,29 +52,39 @@ class WBParser:
         "suppressSpellcheck": "false"
     }
 
-    def __init__(self, mayak_cookies: Optional[str] = None):
-        self.session = requests.Session()
-        # Добавляем заголовки для имитации браузера
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-        })
+    def __init__(self, mayak_cookies: Optional[Union[str, List[str]]] = None, transport: Optional[HttpTransport] = None,
+                 basket_resolver: Optional[BasketResolver] = None, prefetch: Optional[bool] = None):
+        # Общий HTTP транспорт (пулы соединений и заголовки браузера) для WB и Mayak
+        self.transport = transport or default_transport()
+
+        # Резолвер basket для vol вне известных диапазонов (по умолчанию только таблица)
+        self.basket_resolver = basket_resolver
+
+        # Кэш страниц выдачи WB (WB_SEARCH_CACHE_TTL=0 отключает кэш и предзагрузку).
+        # prefetch - загружать следующую страницу в фоне и для одиночных запросов страницы
+        # (просмотр «следующей страницы»), по умолчанию из WB_PREFETCH=1
+        cache_ttl = float(os.getenv('WB_SEARCH_CACHE_TTL', str(DEFAULT_TTL)))
+        self.search_cache = None
+        if cache_ttl > 0:
+            self.search_cache = SearchPageCache(
+                self._fetch_url, ttl=cache_ttl,
+                max_prefetch=int(os.getenv('WB_PREFETCH_MAX', str(DEFAULT_MAX_PREFETCH))))
+        self.prefetch = os.getenv('WB_PREFETCH') == '1' if prefetch is None else prefetch
 
         # Инициализируем Mayak API клиент если переданы cookies
+        # (несколько наборов cookies - пул аккаунтов с параллельной обработкой чанков)
         self.mayak_api = None
         if mayak_cookies:
-            self.mayak_api = MayakAPI(mayak_cookies)
+            self.mayak_api = create_mayak_client(mayak_cookies, transport=self.transport)
 
-    def build_url(self, query: str, page: int = 1) -> str:
+    def build_url(self, query: str, page: int = 1, dest: Optional[str] = None) -> str:
         """
         Формирует URL для запроса к API WildBerries
 
         Args:
             query: Поисковый запрос
             page: Номер страницы (по умолчанию 1)
+            dest: Код региона выдачи (по умолчанию из DEFAULT_PARAMS)
 
         Returns:
             Сформированный URL
@@ -70,6 +92,8 @@ class WBParser:
         params = self.DEFAULT_PARAMS.copy()
         params["query"] = query
         params["page"] = str(page)
+        if dest:
+            params["dest"] = str(dest)
 
         # Кодируем параметры для URL
         encoded_params = urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
@@ -78,22 +102,32 @@ class WBParser:
         logger.info(f"Сформирован URL: {url}")
         return url
 
-    def fetch_data(self, url: str) -> Optional[Dict[str, Any]]:
+    def fetch_data(self, url: str, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
         """
-        Выполняет HTTP запрос и возвращает JSON данные
+        Возвращает JSON данные по URL: из кэша страниц, из идущей предзагрузки или новым запросом
 
         Args:
             url: URL для запроса
+            deadline: Ограничение по времени: таймаут не больше оставшегося, после истечения запрос не выполняется
 
         Returns:
             Словарь с данными или None в случае ошибки
         """
+        if self.search_cache is not None:
+            return self.search_cache.get(url, deadline)
+        return self._fetch_url(url, deadline)
+
+    def _fetch_url(self, url: str, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """Выполняет HTTP запрос и возвращает JSON данные (None в случае ошибки)"""
+        if is_expired(deadline):
+            logger.warning(f"Истёк бюджет времени, запрос не выполнен: {url}")
+            return None
         try:
             logger.info(f"Выполняется запрос к: {url}")
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-
-            data = response.json()
+            with upstream_call('wb', 'wb_fetch'):
+                response = self.transport.get(url, timeout=request_timeout(deadline))
+                response.raise_for_status()
+                data = response.json()
             logger.info(f"Получен ответ, размер: {len(response.text)} символов")
             return data
 
@@ -209,6 +243,35 @@ class WBParser:
 
         return data.get("total", 0)
 
+    def prefetch_next_page(self, query: str, page: int, data: Optional[Dict[str, Any]],
+                           dest: Optional[str] = None, last_page: Optional[int] = None) -> bool:
+        """
+        Запускает фоновую загрузку страницы page + 1 в кэш страниц, пока обрабатывается page
+
+        Args:
+            query: Поисковый запрос
+            page: Номер загруженной страницы
+            data: Ответ WB на страницу page: по total определяется, есть ли следующая
+            dest: Код региона выдачи
+            last_page: Последняя страница постраничного обхода; без него загрузка спекулятивная
+                (следующую страницу могут и не запросить) и выполняется только при self.prefetch
+
+        Returns:
+            True, если загрузка запущена
+        """
+        if self.search_cache is None or not data:
+            return False
+        if last_page is None and not self.prefetch:
+            return False
+        if last_page is not None and page >= last_page:
+            return False
+
+        # Без известного total следующая страница может оказаться пустой - не рискуем
+        total = data.get("total")
+        if not data.get("products") or not isinstance(total, int) or page * self.PAGE_SIZE >= total:
+            return False
+        return self.search_cache.prefetch(self.build_url(query, page + 1, dest=dest))
+
     def get_products_detailed_info(self, product_ids: List[int]) -> List[Dict[str, Any]]:
         """
         Получает подробную информацию о товарах через Mayak API
@@ -231,8 +294,10 @@ class WBParser:
 
         return products
 
-    def get_products_detailed_info_with_pics(self, query: str, page: int = 1, max_products: int = None) -> List[
-        Dict[str, Any]]:
+    def get_products_detailed_info_with_pics(self, query: str, page: int = 1, max_products: int = None,
+                                             product_filter: Optional[ProductFilter] = None,
+                                             on_progress: Optional[Callable[[List[Dict[str, Any]], int, int], None]] = None,
+                                             deadline: Optional[Deadline] = None) -> ProductList:
         """
         Получает подробную информацию о товарах с добавлением данных об изображениях из WB
 
@@ -240,38 +305,103 @@ class WBParser:
             query: Поисковый запрос
             page: Номер страницы
             max_products: Максимальное количество товаров
+            product_filter: Фильтр по данным WB, применяется до запросов к Mayak
+            on_progress: Вызывается после каждого чанка Mayak с (объединённые товары на текущий
+                момент, отсортированные по продажам; готово чанков; всего чанков)
+            deadline: Бюджет времени на весь запрос (WB и все чанки Mayak). По истечении
+                возвращается то, что успели обогатить, с пометкой partial
 
         Returns:
-            Список товаров с объединенными данными от WB и Mayak
+            Список товаров с объединенными данными от WB и Mayak (ProductList: partial и
+            missing_ids, если не все товары успели обогатить до deadline или запросы Mayak
+            по ним не удались и после повторов)
         """
         if not self.mayak_api:
             logger.error("Mayak API не инициализирован. Передайте cookies в конструктор.")
-            return []
+            return ProductList()
 
         # Получаем данные от WB
         url = self.build_url(query, page)
-        wb_data = self.fetch_data(url)
+        wb_data = self.fetch_data(url, deadline=deadline)
 
         if not wb_data:
-            return []
+            return ProductList(partial=is_expired(deadline))
+
+        # Следующая страница загружается, пока эта обогащается данными Mayak
+        self.prefetch_next_page(query, page, wb_data)
 
         # Извлекаем продукты с информацией об изображениях
         wb_products = self.extract_products_with_pics(wb_data)
+        if product_filter:
+            wb_products = product_filter.apply(wb_products)
         product_ids = list(wb_products.keys())
 
+        if not product_ids:
+            logger.info("Нет товаров для запроса к Mayak")
+            return ProductList()
+
         # Ограничиваем количество если указано
         if max_products and len(product_ids) > max_products:
             product_ids = product_ids[:max_products]
             logger.info(f"Ограничено до {max_products} товаров")
 
+        on_chunk = self._progress_merger(wb_products, on_progress) if on_progress else None
+
         # Получаем подробную информацию от Mayak
-        mayak_products = self.mayak_api.get_all_products_info(product_ids)
+        enriched = self.mayak_api.get_all_products_info(product_ids, on_chunk=on_chunk, deadline=deadline)
 
         # Сортируем по продажам
+        mayak_products = enriched
         if mayak_products:
             mayak_products = self.mayak_api.sort_products_by_sales(mayak_products, reverse=True)
 
-        # Объединяем данные
+        result = ProductList.like(self.merge_with_wb_data(mayak_products, wb_products, deadline=deadline), enriched)
+        if result.partial:
+            logger.warning(f"Частичный результат для '{query}': не обогащено {len(result.missing_ids)} "
+                           f"из {len(product_ids)} товаров")
+        return result
+
+    def _progress_merger(self, wb_products: Dict[int, Dict[str, Any]],
+                         on_progress: Callable[[List[Dict[str, Any]], int, int], None]
+                         ) -> Callable[[List[Dict[str, Any]], int, int], None]:
+        """
+        Обработчик чанков Mayak для on_progress: объединяет с данными WB только товары
+        нового чанка и передаёт все объединённые на текущий момент, отсортированные по продажам
+        """
+        merged: List[Dict[str, Any]] = []
+
+        def on_chunk(products_so_far: List[Dict[str, Any]], done: int, total: int):
+            # Копируем: итоговое объединение дополняет исходные словари
+            new_products = [dict(p) for p in products_so_far[len(merged):]]
+            merged.extend(self._merge_products(new_products, wb_products))
+            on_progress(self.mayak_api.sort_products_by_sales(merged, reverse=True), done, total)
+
+        return on_chunk
+
+    @timed('merge')
+    def merge_with_wb_data(self, mayak_products: List[Dict[str, Any]], wb_products: Dict[int, Dict[str, Any]],
+                           deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """
+        Объединяет данные Mayak с данными WB (pics, ссылки на изображения, название)
+
+        Args:
+            mayak_products: Товары от Mayak (порядок сохраняется)
+            wb_products: Результат extract_products_with_pics
+            deadline: После истечения basket не уточняется пробами, берётся из таблицы
+
+        Returns:
+            Список товаров с объединенными данными от WB и Mayak
+        """
+        combined_products = self._merge_products(mayak_products, wb_products, deadline=deadline)
+        logger.info(f"Объединено {len(combined_products)} товаров с данными WB и Mayak")
+        return combined_products
+
+    def _merge_products(self, mayak_products: List[Dict[str, Any]], wb_products: Dict[int, Dict[str, Any]],
+                        deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """merge_with_wb_data без замера этапа merge (для промежуточных результатов)"""
+        if self.basket_resolver is not None:
+            self.basket_resolver.resolve_many((int(p.get('id', 0)) for p in mayak_products), deadline=deadline)
+
         combined_products = []
         for mayak_product in mayak_products:
             product_id = int(mayak_product.get('id', 0))
@@ -282,7 +412,7 @@ class WBParser:
                 mayak_product['pics'] = pics_count
 
                 # Генерируем ссылки на изображения
-                image_urls = self.generate_image_urls(product_id, pics_count)
+                image_urls = self.generate_image_urls(product_id, pics_count, deadline=deadline)
                 mayak_product['image_urls'] = image_urls
 
                 # Добавляем название из WB (если есть)
@@ -301,16 +431,171 @@ class WBParser:
 
             combined_products.append(mayak_product)
 
-        logger.info(f"Объединено {len(combined_products)} товаров с данными WB и Mayak")
         return combined_products
 
-    def generate_image_urls(self, product_id: int, pics_count: int) -> List[str]:
+    def get_products_for_queries(self, queries: List[str], pages: int = 1, max_products: int = None,
+                                 product_filter: Optional[ProductFilter] = None) -> Dict[str, ProductList]:
+        """
+        Получает подробную информацию о товарах для нескольких запросов и страниц.
+        Каждый уникальный товар запрашивается у Mayak один раз, сколько бы раз
+        он ни встретился на разных страницах и в разных запросах.
+
+        Args:
+            queries: Поисковые запросы
+            pages: Количество страниц выдачи WB на запрос
+            max_products: Максимальное количество товаров на запрос
+            product_filter: Фильтр по данным WB, применяется до запросов к Mayak
+
+        Returns:
+            Словарь {запрос: список товаров, отсортированных по продажам};
+            коды товаров, не обогащённые Mayak, - в missing_ids
+        """
+        if not self.mayak_api:
+            logger.error("Mayak API не инициализирован. Передайте cookies в конструктор.")
+            return {}
+
+        batch = EnrichmentBatch()
+        for query in queries:
+            batch.add_query(query)
+            for page in range(1, pages + 1):
+                if max_products and batch.count(query) >= max_products:
+                    break
+
+                wb_data = self.fetch_data(self.build_url(query, page))
+                if not wb_data:
+                    break
+                self.prefetch_next_page(query, page, wb_data, last_page=pages)
+
+                wb_products = self.extract_products_with_pics(wb_data)
+                if not wb_products:
+                    break
+                if product_filter:
+                    wb_products = product_filter.apply(wb_products)
+                batch.add(query, wb_products, max_products=max_products)
+
+        return batch.enrich(self)
+
+    def fetch_region_products(self, query: str, dest: str, pages: int = 1, max_products: int = None,
+                              product_filter: Optional[ProductFilter] = None
+                              ) -> Tuple[Dict[int, Dict[str, Any]], Dict[int, int]]:
+        """
+        Собирает выдачу WB по запросу в одном регионе
+
+        Args:
+            query: Поисковый запрос
+            dest: Код региона
+            pages: Количество страниц выдачи
+            max_products: Максимальное количество товаров после фильтра
+            product_filter: Фильтр по данным WB
+
+        Returns:
+            (товары WB после фильтра в порядке выдачи, {id: позиция в выдаче региона с 1})
+        """
+        collected: Dict[int, Dict[str, Any]] = {}
+        ranks: Dict[int, int] = {}
+        position = 0
+        for page in range(1, pages + 1):
+            if max_products and len(collected) >= max_products:
+                break
+
+            wb_data = self.fetch_data(self.build_url(query, page, dest=dest))
+            if not wb_data:
+                break
+            self.prefetch_next_page(query, page, wb_data, dest=dest, last_page=pages)
+            wb_products = self.extract_products_with_pics(wb_data)
+            if not wb_products:
+                break
+
+            # Позиция считается по полной выдаче, до фильтра
+            for product_id in wb_products:
+                position += 1
+                ranks.setdefault(product_id, position)
+
+            if product_filter:
+                wb_products = product_filter.apply(wb_products)
+            for product_id, info in wb_products.items():
+                collected.setdefault(product_id, info)
+
+        return collected, ranks
+
+    def get_products_for_regions(self, queries: List[str], dests: List[str], pages: int = 1,
+                                 max_products: int = None, product_filter: Optional[ProductFilter] = None,
+                                 max_workers: Optional[int] = None) -> Dict[str, ProductList]:
+        """
+        Выполняет запросы параллельно в нескольких регионах (dest) и объединяет выдачу.
+        Каждый уникальный товар запрашивается у Mayak один раз, в скольких бы
+        регионах он ни встретился.
+
+        Args:
+            queries: Поисковые запросы
+            dests: Коды регионов
+            pages: Количество страниц выдачи на запрос и регион
+            max_products: Максимальное количество товаров на запрос в каждом регионе
+            product_filter: Фильтр по данным WB, применяется до запросов к Mayak
+            max_workers: Количество одновременных запросов к WB
+
+        Returns:
+            Словарь {запрос: товары, отсортированные по продажам}; у каждого товара
+            ranks - {dest: позиция в выдаче региона} и best_rank - лучшая позиция,
+            коды товаров, не обогащённые Mayak, - в missing_ids
+        """
+        if not self.mayak_api:
+            logger.error("Mayak API не инициализирован. Передайте cookies в конструктор.")
+            return {}
+
+        dests = [str(dest) for dest in dests]
+        tasks = [(query, dest) for query in queries for dest in dests]
+        workers = max_workers or min(len(tasks), 8) or 1
+        logger.info(f"Поиск в {len(dests)} регионах по {len(queries)} запросам ({workers} потоков)")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wb-region') as executor:
+            futures = [
+                executor.submit(self.fetch_region_products, query, dest, pages, max_products, product_filter)
+                for query, dest in tasks
+            ]
+
+            batch = EnrichmentBatch()
+            ranks: Dict[str, Dict[int, Dict[str, int]]] = {query: {} for query in queries}
+            # Порядок задач фиксирован, поэтому результат не зависит от порядка ответов WB
+            for (query, dest), future in zip(tasks, futures):
+                wb_products, region_ranks = future.result()
+                batch.add((query, dest), wb_products, max_products=max_products)
+                for product_id, rank in region_ranks.items():
+                    ranks[query].setdefault(product_id, {})[dest] = rank
+
+        enriched = batch.enrich(self)
+
+        results = {}
+        for query in queries:
+            merged: Dict[str, Dict[str, Any]] = {}
+            missing: Dict[str, None] = {}
+            for dest in dests:
+                region_products = enriched.get((query, dest), [])
+                for product in region_products:
+                    merged.setdefault(str(product.get('id')), product)
+                missing.update(dict.fromkeys(getattr(region_products, 'missing_ids', [])))
+
+            products = list(merged.values())
+            for product in products:
+                try:
+                    product_ranks = ranks[query].get(int(product.get('id')), {})
+                except (TypeError, ValueError):
+                    product_ranks = {}
+                product['ranks'] = {dest: product_ranks[dest] for dest in dests if dest in product_ranks}
+                product['best_rank'] = min(product['ranks'].values()) if product['ranks'] else None
+            results[query] = ProductList(self.mayak_api.sort_products_by_sales(products, reverse=True),
+                                         missing_ids=list(missing))
+        return results
+
+    def generate_image_urls(self, product_id: int, pics_count: int,
+                            deadline: Optional[Deadline] = None) -> List[str]:
         """
         Генерирует ссылки на изображения товара WildBerries
 
         Args:
             product_id: ID товара
             pics_count: Количество изображений
+            deadline: После истечения basket не уточняется пробами
 
         Returns:
             Список ссылок на изображения
@@ -321,74 +606,11 @@ class WBParser:
         # Определяем vol (обрезаем последние 5 цифр)
         vol = product_id // 100000
 
-        # Определяем номер сервера по vol (новые диапазоны)
-        def get_basket_host(vol):
-            if 0 <= vol <= 143:
-                return "01"
-            elif vol <= 287:
-                return "02"
-            elif vol <= 431:
-                return "03"
-            elif vol <= 719:
-                return "04"
-            elif vol <= 1007:
-                return "05"
-            elif vol <= 1061:
-                return "06"
-            elif vol <= 1115:
-                return "07"
-            elif vol <= 1169:
-                return "08"
-            elif vol <= 1313:
-                return "09"
-            elif vol <= 1601:
-                return "10"
-            elif vol <= 1655:
-                return "11"
-            elif vol <= 1919:
-                return "12"
-            elif vol <= 2045:
-                return "13"
-            elif vol <= 2189:
-                return "14"
-            elif vol <= 2405:
-                return "15"
-            elif vol <= 2621:
-                return "16"
-            elif vol <= 2837:
-                return "17"
-            elif vol <= 3053:
-                return "18"
-            elif vol <= 3269:
-                return "19"
-            elif vol <= 3485:
-                return "20"
-            elif vol <= 3701:
-                return "21"
-            elif vol <= 3917:
-                return "22"
-            elif vol <= 4133:
-                return "23"
-            elif vol <= 4349:
-                return "24"
-            elif vol <= 4565:
-                return "25"
-            elif vol <= 4877:
-                return "26"
-            elif vol <= 5189:
-                return "27"
-            elif vol <= 5501:
-                return "28"
-            elif vol <= 5813:
-                return "29"
-            elif vol <= 6125:
-                return "30"
-            elif vol <= 6437:
-                return "31"
-            else:
-                return "32"
-
-        basket_host = get_basket_host(vol)
+        # Определяем номер сервера по vol: таблица диапазонов или найденный резолвером basket
+        if self.basket_resolver is not None:
+            basket_host = self.basket_resolver.resolve(product_id, deadline=deadline)
+        else:
+            basket_host = get_basket_host(vol)
         part = product_id // 1000  # part это ID без последних 3 цифр
 
         # Генерируем ссылки на все изображения
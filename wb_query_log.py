@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Журнал поисковых запросов пользователей
+
+Каждый запрос CLI и Telegram бота дописывается строкой JSON (query, ts, latency,
+count, source) в общий файл; ротацию по размеру выполняет только бот. По журналу
+определяются самые частые недавние запросы - их бот заранее загружает в кэш
+результатов перед часами пик (WARMUP_TIME).
+
+Использование:
+    python3 wb_query_log.py top --days 7 --limit 20
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from wb_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+# Путь по умолчанию не зависит от рабочего каталога: CLI, демон и бот пишут в один журнал
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'query_log.jsonl')
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+SECONDS_PER_DAY = 86400
+
+
+class QueryLog:
+    """
+    Журнал запросов только на дозапись
+
+    CLI, демон и бот пишут в один файл из разных процессов, поэтому каждая запись - один
+    write() с O_APPEND без переименований. Ротирует файл только процесс с rotate=True
+    (бот): ротация из нескольких процессов теряла бы и перемешивала записи.
+    """
+
+    _rotate_lock = threading.Lock()
+
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 backup_count: int = DEFAULT_BACKUP_COUNT, rotate: bool = False):
+        """
+        Args:
+            path: Файл журнала (ротированные копии - path.1, path.2, ...)
+            max_bytes: Размер файла, после которого он ротируется
+            backup_count: Сколько ротированных копий хранить
+            rotate: Ротировать файл из этого процесса (только в одном процессе на журнал)
+        """
+        self.path = os.path.abspath(path)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate = rotate
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping[str, str]] = None,
+                 cwd: Optional[str] = None, rotate: bool = False) -> Optional['QueryLog']:
+        """
+        Журнал из WB_QUERY_LOG (путь; пустое значение отключает журнал)
+
+        Args:
+            environ: Переменные окружения (по умолчанию os.environ)
+            cwd: Каталог, от которого считается относительный путь (по умолчанию текущий)
+            rotate: Ротировать файл из этого процесса
+        """
+        path = (os.environ if environ is None else environ).get('WB_QUERY_LOG', DEFAULT_PATH)
+        if not path:
+            return None
+        return cls(os.path.join(cwd, os.path.expanduser(path)) if cwd else path, rotate=rotate)
+
+    def _rotate_if_needed(self, incoming: int):
+        """Сдвигает копии path.N и переименовывает текущий файл, если запись не помещается"""
+        if not self.rotate or self.max_bytes <= 0 or self.backup_count < 1:
+            return
+        with self._rotate_lock:
+            try:
+                if os.path.getsize(self.path) + incoming <= self.max_bytes:
+                    return
+            except FileNotFoundError:
+                return
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+
+    def record(self, query: str, latency: float, count: int, source: str = 'cli',
+               ts: Optional[float] = None, **extra: Any):
+        """
+        Дописывает запрос в журнал
+
+        Args:
+            query: Поисковый запрос
+            latency: Время выполнения, сек
+            count: Количество товаров в результате
+            source: Кто выполнил запрос (cli, bot, ...)
+            ts: Время запроса (unix time), по умолчанию текущее
+            extra: Дополнительные поля (например cached=True)
+        """
+        entry = {
+            'query': query,
+            'ts': round(time.time() if ts is None else ts, 3),
+            'latency': round(latency, 3),
+            'count': count,
+            'source': source,
+        }
+        entry.update(extra)
+        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        try:
+            self._rotate_if_needed(len(line))
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except Exception as e:
+            logger.warning(f"Не удалось записать запрос в журнал {self.path}: {e}")
+
+    def files(self) -> List[str]:
+        """Файлы журнала от старых ротированных к текущему"""
+        candidates = [f"{self.path}.{i}" for i in range(self.backup_count, 0, -1)] + [self.path]
+        return [path for path in candidates if os.path.exists(path)]
+
+    def entries(self, since: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Записи журнала в порядке записи; since - только не раньше этого времени (unix time)"""
+        for path in self.files():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if not isinstance(entry, dict) or not entry.get('query'):
+                        continue
+                    if since is not None and entry.get('ts', 0) < since:
+                        continue
+                    yield entry
+
+    def top_queries(self, days: float = 7, limit: int = 20, now: Optional[float] = None) -> List[Tuple[str, int]]:
+        """
+        Самые частые запросы за последние days дней
+
+        Запросы сравниваются после normalize_query; возвращается последняя
+        встретившаяся форма запроса.
+
+        Returns:
+            Список (запрос, количество) по убыванию количества
+        """
+        now = time.time() if now is None else now
+        counts: Counter = Counter()
+        latest: Dict[str, str] = {}
+        for entry in self.entries(since=now - days * SECONDS_PER_DAY):
+            key = normalize_query(entry['query'])
+            counts[key] += 1
+            latest[key] = entry['query']
+        return [(latest[key], count) for key, count in counts.most_common(limit)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Журнал поисковых запросов')
+    parser.add_argument('--log', type=str, default=os.getenv('WB_QUERY_LOG') or DEFAULT_PATH,
+                        help='Файл журнала (по умолчанию: query_log.jsonl рядом с программой)')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    top = subparsers.add_parser('top', help='Самые частые недавние запросы')
+    top.add_argument('--days', type=float, default=7, help='За сколько последних дней (по умолчанию: 7)')
+    top.add_argument('--limit', type=int, default=20, help='Сколько запросов показать (по умолчанию: 20)')
+
+    args = parser.parse_args()
+    if args.command == 'top':
+        queries = QueryLog(args.log).top_queries(days=args.days, limit=args.limit)
+        if not queries:
+            print("Журнал запросов пуст")
+            return
+        for query, count in queries:
+            print(f"{count:6d}  {query}")
+
+
+if __name__ == "__main__":
+    main()
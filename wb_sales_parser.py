@@ -6,11 +6,21 @@ WB Sales Parser - простой парсер для получения ID, pics
 
 import argparse
 import logging
+import os
 import sys
 import csv
-from typing import List, Dict, Any
-from wb_parser import WBParser
-from mayak_api import parse_cookies_string
+import time
+from typing import List, Dict, Any, Optional, TYPE_CHECKING
+from wb_filters import ProductFilter
+from wb_deadline import Deadline
+from wb_query_log import QueryLog
+from wb_duplicates import find_duplicate_listings, DEFAULT_MAX_DISTANCE
+from wb_export import products_to_xlsx_bytes, DEFAULT_EMBED_IMAGES, IMAGE_CACHE_DIR
+
+# wb_parser, wb_basket и wb_images тянут requests и импортируются лениво:
+# при работающем демоне (wb_daemon.py) CLI только пересылает ему аргументы
+if TYPE_CHECKING:
+    from wb_parser import WBParser
 
 # Настройка логирования
 logging.basicConfig(
@@ -20,9 +30,14 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def write_csv(path: str, products: List[Dict[str, Any]]):
-    """Сохраняет CSV со столбцами: Ссылка, Название, Количество продаж, Изображения"""
+def write_csv(path: str, products: List[Dict[str, Any]], with_query: bool = False,
+              regions: Optional[List[str]] = None):
+    """Сохраняет CSV со столбцами: [Запрос,] Ссылка, Название, Количество продаж, Изображения[, Позиция <dest>...]"""
     fieldnames = ["Ссылка", "Название", "Количество продаж", "Изображения"]
+    if with_query:
+        fieldnames.insert(0, "Запрос")
+    regions = regions or []
+    fieldnames += [f"Позиция {dest}" for dest in regions]
 
     try:
         with open(path, 'w', newline='', encoding='utf-8-sig') as f:
@@ -35,18 +50,112 @@ def write_csv(path: str, products: List[Dict[str, Any]]):
                 sales = p.get('sales', 0)
                 image_urls = p.get('image_urls', [])
                 images_joined = '\n'.join(image_urls) if image_urls else ''
-                writer.writerow({
+                row = {
                     "Ссылка": url,
                     "Название": name,
                     "Количество продаж": sales,
                     "Изображения": images_joined,
-                })
+                }
+                if with_query:
+                    row["Запрос"] = p.get('query', '')
+                ranks = p.get('ranks') or {}
+                for dest in regions:
+                    row[f"Позиция {dest}"] = ranks.get(dest, '')
+                writer.writerow(row)
         logger.info(f"CSV сохранён: {path}")
     except Exception as e:
         logger.error(f"Ошибка записи CSV: {e}")
         sys.exit(1)
 
-def main():
+def build_product_filter(args: argparse.Namespace) -> ProductFilter:
+    """Собирает фильтр товаров из аргументов командной строки"""
+    product_filter = ProductFilter(
+        min_price=args.min_price,
+        max_price=args.max_price,
+        min_rating=args.min_rating,
+        min_feedbacks=args.min_feedbacks,
+        min_pics=args.min_pics,
+        brands=args.brand,
+        exclude_brands=args.exclude_brand,
+    )
+    if args.filter:
+        product_filter.extend(ProductFilter.from_expression(args.filter))
+    return product_filter
+
+def print_products(args: argparse.Namespace, wb_parser: 'WBParser', combined_products: List[Dict[str, Any]]):
+    """Выводит товары в выбранном формате"""
+    if args.images_only:
+        print("\n🖼️ Ссылки на изображения:")
+        for product in combined_products:
+            image_urls = product.get('image_urls', [])
+            for url in image_urls:
+                print(url)
+    elif args.show_table:
+        print("\n" + wb_parser.display_products_by_sales(combined_products))
+        if args.show_images:
+            print("\n🖼️ Ссылки на изображения:")
+            for product in combined_products:
+                product_id = product.get('id', 'N/A')
+                image_urls = product.get('image_urls', [])
+                if image_urls:
+                    print(f"\nТовар {product_id} ({len(image_urls)} изображений):")
+                    for i, url in enumerate(image_urls, 1):
+                        print(f"  {i}. {url}")
+    else:
+        print("\n📋 Список товаров (отсортированы по продажам):")
+        print("ID товара | Продажи | Фото")
+        print("-" * 30)
+        for product in combined_products:
+            product_id = product.get('id', 'N/A')
+            sales = product.get('sales', 0)
+            pics = product.get('pics', 0)
+            print(f"{product_id} | {sales:,} | {pics}")
+        if args.show_images:
+            print("\n🖼️ Ссылки на изображения:")
+            for product in combined_products:
+                product_id = product.get('id', 'N/A')
+                image_urls = product.get('image_urls', [])
+                if image_urls:
+                    print(f"\nТовар {product_id} ({len(image_urls)} изображений):")
+                    for i, url in enumerate(image_urls, 1):
+                        print(f"  {i}. {url}")
+
+def parse_dests(values: Optional[List[str]]) -> List[str]:
+    """Коды регионов из повторяющегося аргумента --dest (допускаются списки через запятую)"""
+    dests = []
+    for value in values or []:
+        dests.extend(dest.strip() for dest in value.split(',') if dest.strip())
+    return list(dict.fromkeys(dests))
+
+def print_region_ranks(products: List[Dict[str, Any]], dests: List[str]):
+    """Выводит товары с позициями в выдаче каждого региона"""
+    print("\n🌍 Товары по продажам и позиции в регионах:")
+    print("ID товара | Продажи | " + " | ".join(dests))
+    print("-" * (22 + 12 * len(dests)))
+    for product in products:
+        ranks = product.get('ranks') or {}
+        columns = " | ".join(str(ranks.get(dest, '-')) for dest in dests)
+        print(f"{product.get('id', 'N/A')} | {product.get('sales', 0):,} | {columns}")
+
+def print_partial_result(products: List[Dict[str, Any]], query: Optional[str] = None):
+    """Предупреждает о товарах без данных Mayak (ProductList с partial)"""
+    if not getattr(products, 'partial', False):
+        return
+    missing = products.missing_ids
+    label = f" для запроса '{query}'" if query else ''
+    print(f"⚠️ Частичный результат{label}: не получены данные по {len(missing)} товарам"
+          f"{': ' + ', '.join(missing[:10]) if missing else ''}{'...' if len(missing) > 10 else ''}")
+
+def print_duplicate_groups(query: str, groups: List[Dict[str, Any]]):
+    """Выводит группы дублирующихся карточек с суммарными продажами"""
+    print(f"\n🔁 Дублирующиеся карточки для запроса '{query}': {len(groups)} групп")
+    for i, group in enumerate(groups, 1):
+        print(f"{i}. Продажи: {group['sales']:,} | Выручка: {group['revenue']:,} | "
+              f"Карточки: {', '.join(group['ids'])}")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """Парсер аргументов командной строки (используется и демоном wb_daemon.py)"""
     parser = argparse.ArgumentParser(
         description='Получение списка товаров WB отсортированных по продажам',
         formatter_class=argparse.RawTextHelpFormatter
@@ -55,14 +164,28 @@ def main():
     parser.add_argument(
         '-q', '--query',
         type=str,
+        action='append',
         required=True,
-        help='Поисковый запрос'
+        help='Поисковый запрос (можно указать несколько раз)'
+    )
+    parser.add_argument(
+        '--pages',
+        type=int,
+        default=1,
+        help='Количество страниц выдачи WB на запрос (по умолчанию: 1)'
+    )
+    parser.add_argument(
+        '--dest',
+        type=str,
+        action='append',
+        help='Код региона выдачи WB (можно указать несколько раз или через запятую); '
+             'регионы опрашиваются параллельно, для товаров выводится позиция в каждом регионе'
     )
     parser.add_argument(
         '--cookies-file',
         type=str,
         default='cookies.txt',
-        help='Файл с cookies для Mayak API (по умолчанию: cookies.txt)'
+        help='Файл с cookies для Mayak API, по аккаунту на строку, или каталог (по умолчанию: cookies.txt)'
     )
     parser.add_argument(
         '--max-products',
@@ -70,6 +193,12 @@ def main():
         default=20,
         help='Максимальное количество товаров (по умолчанию: 20)'
     )
+    parser.add_argument(
+        '--deadline',
+        type=float,
+        help='Бюджет времени на запрос в секундах (один запрос, одна страница): по истечении\n'
+             'выводятся уже обогащённые товары с пометкой о частичном результате'
+    )
 
     parser.add_argument(
         '--show-table',
@@ -95,13 +224,128 @@ def main():
         help='Сохранить результат в CSV файл (столбцы: Ссылка, Название, Количество продаж, Изображения)'
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        '--basket-cache',
+        type=str,
+        help='Определять сервер изображений для новых vol HEAD запросами и кэшировать в указанный файл'
+    )
+
+    parser.add_argument(
+        '--xlsx',
+        type=str,
+        help='Сохранить результат в Excel файл (изображения - формулами IMAGE())'
+    )
+    parser.add_argument(
+        '--embed-images',
+        action='store_true',
+        help=f'Встроить в Excel миниатюры первых --max-images изображений (по умолчанию {DEFAULT_EMBED_IMAGES}) '
+             f'вместо формул IMAGE()'
+    )
+    parser.add_argument(
+        '--download-images',
+        type=str,
+        metavar='DIR',
+        help='Загрузить изображения товаров в каталог (с дедупликацией и продолжением после прерывания)'
+    )
+    parser.add_argument(
+        '--max-images',
+        type=int,
+        help='Сколько первых изображений загружать для каждого товара (по умолчанию все)'
+    )
+    parser.add_argument(
+        '--download-workers',
+        type=int,
+        default=16,
+        help='Количество одновременных загрузок изображений (по умолчанию: 16)'
+    )
+    parser.add_argument(
+        '--group-duplicates',
+        action='store_true',
+        help='Найти дублирующиеся карточки по главному фото и показать суммарные продажи групп'
+    )
+    parser.add_argument(
+        '--duplicate-distance',
+        type=int,
+        default=DEFAULT_MAX_DISTANCE,
+        help=f'Максимальное расстояние Хэмминга между хэшами дубликатов (по умолчанию: {DEFAULT_MAX_DISTANCE})'
+    )
+
+    filters_group = parser.add_argument_group('Фильтры по данным WB (применяются до запросов к Mayak)')
+    filters_group.add_argument('--min-price', type=float, help='Минимальная цена, ₽')
+    filters_group.add_argument('--max-price', type=float, help='Максимальная цена, ₽')
+    filters_group.add_argument('--min-rating', type=float, help='Минимальный рейтинг')
+    filters_group.add_argument('--min-feedbacks', type=int, help='Минимальное количество отзывов')
+    filters_group.add_argument('--min-pics', type=int, help='Минимальное количество фото')
+    filters_group.add_argument(
+        '--brand',
+        action='append',
+        help='Оставить только указанный бренд (можно указать несколько раз)'
+    )
+    filters_group.add_argument(
+        '--exclude-brand',
+        action='append',
+        help='Исключить бренд (можно указать несколько раз)'
+    )
+    filters_group.add_argument(
+        '--filter',
+        type=str,
+        help='Выражение фильтра, например: "price >= 1000 and rating >= 4.5 and brand not in Zara|Mango"'
+    )
+
+    return parser
+
+
+class CliContext:
+    """
+    Источник парсеров и хранилищ для run()
+
+    При обычном запуске объекты создаются заново; демон wb_daemon.py подменяет
+    контекст на «тёплый», который переиспользует их между запусками.
+    """
+
+    def get_parser(self, mayak_cookies: List[str], basket_cache: Optional[str] = None) -> 'WBParser':
+        from wb_parser import WBParser
+        from wb_basket import BasketResolver
+
+        wb_parser = WBParser(mayak_cookies=mayak_cookies)
+        if basket_cache:
+            wb_parser.basket_resolver = BasketResolver(basket_cache, transport=wb_parser.transport)
+        return wb_parser
+
+    def get_image_store(self, root: str):
+        from wb_images import ImageStore
+
+        return ImageStore(root)
+
+    def get_image_downloader(self, root: str, max_workers: int, transport=None):
+        from wb_images import ImageDownloader
+
+        return ImageDownloader(self.get_image_store(root), transport=transport, max_workers=max_workers)
+
+    def image_dir(self) -> str:
+        """Хранилище изображений для --group-duplicates и --embed-images без --download-images"""
+        return IMAGE_CACHE_DIR
+
+    def query_log(self) -> Optional[QueryLog]:
+        return QueryLog.from_env()
+
+
+def run(args: argparse.Namespace, context: Optional[CliContext] = None):
+    """Выполняет команду по разобранным аргументам"""
+    from mayak_api import load_cookie_sets
+
+    context = context or CliContext()
+
+    try:
+        product_filter = build_product_filter(args)
+    except ValueError as e:
+        logger.error(f"Ошибка в параметрах фильтра: {e}")
+        sys.exit(1)
 
     # Загружаем cookies
     mayak_cookies = None
     try:
-        with open(args.cookies_file, 'r') as f:
-            mayak_cookies = f.read().strip()
+        mayak_cookies = load_cookie_sets(args.cookies_file)
         if not mayak_cookies:
             logger.error("Файл с cookies пуст.")
             sys.exit(1)
@@ -113,63 +357,128 @@ def main():
         sys.exit(1)
 
     # Инициализируем парсер с cookies
-    wb_parser = WBParser(mayak_cookies=mayak_cookies)
+    wb_parser = context.get_parser(mayak_cookies, args.basket_cache)
 
-    logger.info(f"Начинаем поиск и получение подробной информации для запроса: '{args.query}'")
+    queries = args.query
+    dests = parse_dests(args.dest)
+    started = time.monotonic()
+    if dests:
+        logger.info(f"Начинаем поиск по {len(queries)} запросам в регионах: {', '.join(dests)}")
 
-    # Получаем подробную информацию с pics и сортировкой
-    combined_products = wb_parser.get_products_detailed_info_with_pics(
-        args.query,
-        page=1,
-        max_products=args.max_products
-    )
+        # Каждый товар запрашивается у Mayak один раз для всех регионов
+        results = wb_parser.get_products_for_regions(
+            queries,
+            dests,
+            pages=args.pages,
+            max_products=args.max_products,
+            product_filter=product_filter
+        )
+    elif len(queries) == 1 and args.pages == 1:
+        logger.info(f"Начинаем поиск и получение подробной информации для запроса: '{queries[0]}'")
+
+        # Получаем подробную информацию с pics и сортировкой
+        products = wb_parser.get_products_detailed_info_with_pics(
+            queries[0],
+            page=1,
+            max_products=args.max_products,
+            product_filter=product_filter,
+            deadline=Deadline.after(args.deadline)
+        )
+        results = {queries[0]: products}
+    else:
+        logger.info(f"Начинаем поиск по {len(queries)} запросам, страниц на запрос: {args.pages}")
 
-    if not combined_products:
+        # Каждый товар запрашивается у Mayak один раз для всех страниц и запросов
+        results = wb_parser.get_products_for_queries(
+            queries,
+            pages=args.pages,
+            max_products=args.max_products,
+            product_filter=product_filter
+        )
+
+    for query, products in results.items():
+        print_partial_result(products, query if len(results) > 1 else None)
+
+    query_log = context.query_log()
+    if query_log is not None:
+        latency = time.monotonic() - started
+        if len(results) == 1:
+            for query, products in results.items():
+                query_log.record(query, latency, len(products), source='cli')
+        else:
+            # Запросы пакета обогащаются у Mayak вместе, поэтому время отдельного запроса не измерить:
+            # записи помечаются cumulative, latency - время всего пакета из batch запросов
+            for query, products in results.items():
+                query_log.record(query, latency, len(products), source='cli', cumulative=True, batch=len(results))
+
+    if not any(results.values()):
         logger.warning("Не удалось получить подробную информацию о товарах.")
         sys.exit(1)
 
+    # Загрузка изображений при необходимости
+    if args.download_images:
+        downloader = context.get_image_downloader(args.download_images, args.download_workers, wb_parser.transport)
+        all_products = [p for products in results.values() for p in products]
+        downloaded = downloader.download_products(all_products, max_images=args.max_images)
+        total_files = sum(len(paths) for paths in downloaded.values())
+        print(f"✅ Изображения загружены: {total_files} файлов в {args.download_images}")
+
+    # Поиск дублирующихся карточек при необходимости
+    image_dir = args.download_images or context.image_dir()
+    if args.group_duplicates:
+        downloader = context.get_image_downloader(image_dir, args.download_workers, wb_parser.transport)
+        for query, products in results.items():
+            groups = find_duplicate_listings(products, downloader, max_distance=args.duplicate_distance)
+            print_duplicate_groups(query, groups)
+
+    # Экспорт Excel при необходимости
+    if args.xlsx:
+        all_products = [p for products in results.values() for p in products]
+        xlsx_bytes = products_to_xlsx_bytes(
+            all_products,
+            embed_images=args.embed_images,
+            images_per_product=args.max_images or DEFAULT_EMBED_IMAGES,
+            downloader=context.get_image_downloader(image_dir, args.download_workers,
+                                                    wb_parser.transport) if args.embed_images else None
+        )
+        with open(args.xlsx, 'wb') as f:
+            f.write(xlsx_bytes)
+        print(f"✅ Excel сохранён: {args.xlsx}")
+        if not args.csv:
+            return
+
     # Экспорт CSV при необходимости
     if args.csv:
-        write_csv(args.csv, combined_products)
+        if len(results) == 1:
+            write_csv(args.csv, next(iter(results.values())), regions=dests)
+        else:
+            rows = [dict(p, query=query) for query, products in results.items() for p in products]
+            write_csv(args.csv, rows, with_query=True, regions=dests)
         print(f"✅ CSV сохранён: {args.csv}")
         return
 
     # Иначе, обычный вывод
-    if args.images_only:
-        print("\n🖼️ Ссылки на изображения:")
-        for product in combined_products:
-            image_urls = product.get('image_urls', [])
-            for url in image_urls:
-                print(url)
-    elif args.show_table:
-        print("\n" + wb_parser.display_products_by_sales(combined_products))
-        if args.show_images:
-            print("\n🖼️ Ссылки на изображения:")
-            for product in combined_products:
-                product_id = product.get('id', 'N/A')
-                image_urls = product.get('image_urls', [])
-                if image_urls:
-                    print(f"\nТовар {product_id} ({len(image_urls)} изображений):")
-                    for i, url in enumerate(image_urls, 1):
-                        print(f"  {i}. {url}")
-    else:
-        print("\n📋 Список товаров (отсортированы по продажам):")
-        print("ID товара | Продажи | Фото")
-        print("-" * 30)
-        for product in combined_products:
-            product_id = product.get('id', 'N/A')
-            sales = product.get('sales', 0)
-            pics = product.get('pics', 0)
-            print(f"{product_id} | {sales:,} | {pics}")
-        if args.show_images:
-            print("\n🖼️ Ссылки на изображения:")
-            for product in combined_products:
-                product_id = product.get('id', 'N/A')
-                image_urls = product.get('image_urls', [])
-                if image_urls:
-                    print(f"\nТовар {product_id} ({len(image_urls)} изображений):")
-                    for i, url in enumerate(image_urls, 1):
-                        print(f"  {i}. {url}")
+    for query, combined_products in results.items():
+        if len(results) > 1:
+            print(f"\n🔎 Запрос: {query} ({len(combined_products)} товаров)")
+        if dests and not (args.show_table or args.show_images or args.images_only):
+            print_region_ranks(combined_products, dests)
+        else:
+            print_products(args, wb_parser, combined_products)
+
+
+def main(argv: Optional[List[str]] = None):
+    argv = sys.argv[1:] if argv is None else argv
+
+    # Если запущен демон, команда выполняется в нём на «тёплых» парсерах и соединениях
+    if os.environ.get('WB_NO_DAEMON') != '1':
+        from wb_daemon import forward_to_daemon
+        exit_code = forward_to_daemon(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+
+    run(build_arg_parser().parse_args(argv))
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш страниц выдачи WB с фоновой предзагрузкой
+
+Пока страница N обогащается данными Mayak, страница N+1 загружается в фоне и
+попадает в кэш; следующий запрос этой страницы (постраничный обход или
+«следующая страница» в API) берёт её из кэша или дожидается уже идущего
+запроса вместо нового. Число одновременных фоновых загрузок ограничено.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, Dict, Optional
+
+from wb_cache import TTLCache
+from wb_deadline import Deadline
+from wb_metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 120.0
+DEFAULT_MAX_PREFETCH = 2
+
+
+class SearchPageCache:
+    """Потокобезопасный кэш ответов поиска WB по URL с предзагрузкой"""
+
+    def __init__(self, fetch: Callable[[str, Optional[Deadline]], Optional[Dict[str, Any]]],
+                 ttl: float = DEFAULT_TTL, max_entries: int = 256, max_prefetch: int = DEFAULT_MAX_PREFETCH):
+        """
+        Args:
+            fetch: Загружает страницу по URL: (url, deadline) -> данные или None при ошибке
+            ttl: Время жизни страницы в кэше, сек
+            max_entries: Максимум страниц в кэше
+            max_prefetch: Максимум одновременных фоновых загрузок (лишние пропускаются)
+        """
+        self._fetch = fetch
+        self._pages = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.max_entries = max_entries
+        self.max_prefetch = max_prefetch
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self._prefetched: Dict[str, None] = {}
+        self._prefetching = 0
+        self.prefetches = 0
+        self.prefetch_hits = 0
+        self.prefetch_skipped = 0
+
+    def _mark_used(self, url: str):
+        if self._prefetched.pop(url, False) is None:
+            self.prefetch_hits += 1
+
+    def get(self, url: str, deadline: Optional[Deadline] = None) -> Optional[Dict[str, Any]]:
+        """
+        Страница из кэша; если она уже загружается в фоне - ждёт эту загрузку, иначе загружает
+
+        Returns:
+            Данные страницы или None при ошибке (ошибки не кэшируются)
+        """
+        with self._lock:
+            data = self._pages.get(url)
+            if data is not None:
+                self._mark_used(url)
+                record_cache('search', True)
+                return data
+            future = self._in_flight.get(url)
+            if future is None:
+                future = self._in_flight[url] = Future()
+                owner = True
+            else:
+                owner = False
+        # Ожидание уже идущей загрузки - тоже попадание: нового запроса к WB нет
+        record_cache('search', not owner)
+
+        if owner:
+            return self._load(url, future, deadline)
+
+        logger.info(f"Ожидаем предзагружаемую страницу: {url}")
+        try:
+            data = future.result(timeout=deadline.remaining() if deadline is not None else None)
+        except FuturesTimeoutError:
+            logger.warning(f"Истёк бюджет времени в ожидании предзагрузки: {url}")
+            return None
+        with self._lock:
+            self._mark_used(url)
+        return data
+
+    def _load(self, url: str, future: Future, deadline: Optional[Deadline]) -> Optional[Dict[str, Any]]:
+        data = None
+        try:
+            data = self._fetch(url, deadline)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки страницы выдачи: {e}")
+        finally:
+            with self._lock:
+                if data is not None:
+                    self._pages.set(url, data)
+                self._in_flight.pop(url, None)
+            future.set_result(data)
+        return data
+
+    def prefetch(self, url: str) -> bool:
+        """
+        Запускает фоновую загрузку страницы, если её нет в кэше и не превышен лимит загрузок
+
+        Returns:
+            True, если загрузка запущена
+        """
+        with self._lock:
+            if url in self._in_flight or url in self._pages:
+                return False
+            if self._prefetching >= self.max_prefetch:
+                self.prefetch_skipped += 1
+                return False
+            future = self._in_flight[url] = Future()
+            self._prefetching += 1
+            self.prefetches += 1
+            self._prefetched[url] = None
+            while len(self._prefetched) > self.max_entries:
+                self._prefetched.pop(next(iter(self._prefetched)))
+
+        logger.info(f"Предзагрузка страницы выдачи: {url}")
+        # Поток-демон не задерживает завершение процесса, если страница так и не понадобилась
+        threading.Thread(target=self._run_prefetch, args=(url, future), name='wb-prefetch', daemon=True).start()
+        return True
+
+    def _run_prefetch(self, url: str, future: Future):
+        try:
+            self._load(url, future, None)
+        finally:
+            with self._lock:
+                self._prefetching -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'pages': len(self._pages),
+                'hits': self._pages.hits,
+                'misses': self._pages.misses,
+                'prefetches': self.prefetches,
+                'prefetch_hits': self.prefetch_hits,
+                'prefetch_skipped': self.prefetch_skipped,
+                'prefetching': self._prefetching,
+            }